@@ -3,8 +3,9 @@ import os
 import shutil
 
 from scale_build.clean import clean_packages
+from scale_build.utils.apt_archives import APT_ARCHIVES_IN_CHROOT, release_apt_archives, setup_apt_archives
 from scale_build.utils.manifest import get_manifest, get_apt_repos
-from scale_build.utils.paths import BUILDER_DIR, CHROOT_BASEDIR, REFERENCE_FILES, REFERENCE_FILES_DIR
+from scale_build.utils.paths import BUILDER_DIR, CHROOT_BASEDIR, REFERENCE_FILES, REFERENCE_FILES_DIR, TMP_DIR
 from scale_build.utils.run import run
 
 from .cache import CacheMixin
@@ -20,6 +21,9 @@ class BootstrapDir(CacheMixin, HashMixin):
     def __init__(self):
         self.logger = logger
         self.chroot_basedir = CHROOT_BASEDIR
+        # Bootstrap directories can be derived from one another, so each of them gets its own apt archives
+        self.apt_archives = os.path.join(TMP_DIR, f'apt-archives_{os.path.splitext(self.cache_filename)[0]}')
+        self.apt_archives_enabled = False
 
     def setup(self):
         self.clean_setup()
@@ -27,6 +31,12 @@ class BootstrapDir(CacheMixin, HashMixin):
             self.setup_impl()
         finally:
             self.clean_setup()
+            release_apt_archives(self.apt_archives)
+
+    @property
+    def apt_archives_deopts(self):
+        # Packages downloaded by debootstrap are kept in the apt archive cache as well
+        return ['--cache-dir', os.path.abspath(self.apt_archives)] if self.apt_archives_enabled else []
 
     def debootstrap_debian(self):
         manifest = get_manifest()
@@ -38,7 +48,7 @@ class BootstrapDir(CacheMixin, HashMixin):
         run(['sh', '-c', f'gpg --dearmor < {keyring_path} > {binary_keyring}'])
 
         run(
-            ['debootstrap'] + self.deopts + [
+            ['debootstrap'] + self.deopts + self.apt_archives_deopts + [
                 '--keyring', binary_keyring,
                 manifest['debian_release'],
                 self.chroot_basedir, get_apt_repos(check_custom=True)['url']
@@ -46,15 +56,56 @@ class BootstrapDir(CacheMixin, HashMixin):
         )
 
     def setup_impl(self):
-        if self.mirror_cache_intact:
+        cache_status = self.cache_status
+        if cache_status == 'intact':
             # Mirror cache is intact, we do not need to re-create the bootstrap directory
             self.logger.debug('Basechroot cache is intact and does not need to be changed')
             return
 
-        apt_repos = get_apt_repos(check_custom=True)
+        self.apt_archives_enabled = setup_apt_archives(self.apt_archives)
+        if cache_status == 'stale':
+            if self.refresh_cache():
+                return
+            self.clean_setup()
+            self.remove_cache()
+
         self.debootstrap_debian()
         self.setup_mounts()
+        installed_packages = self.install_packages()
+        self.clean_mounts()
+        self.save_build_cache(installed_packages)
+
+    def refresh_cache(self):
+        """
+        Upgrade a cache which is only out of date with the APT repos in place, usually only a few packages have changed
+        upstream so this is a lot cheaper than starting over with debootstrap. Returns False if the refreshed chroot
+        does not match what a fresh one would look like, in which case it has to be created from scratch.
+        """
+        self.logger.debug('Refreshing basechroot cache')
+        cached_packages = self.installed_packages_in_cache
+        self.restore_cache(self.chroot_basedir)
+        self.setup_mounts()
+        # A plain upgrade holds back packages whose dependencies changed, which a fresh chroot would have
+        installed_packages = self.install_packages(full_upgrade=True)
+        self.clean_mounts()
+
+        if removed := set(cached_packages) - set(installed_packages):
+            self.logger.debug('Upgrade removed %r package(s), re-creating squashfs cache', ', '.join(sorted(removed)))
+            return False
+        if self.reference_files_changed(self.chroot_basedir):
+            return False
 
+        # Not every cache backend can save over an existing cache
+        self.remove_cache()
+        self.save_build_cache(installed_packages)
+        return True
+
+    def install_packages(self, full_upgrade=False):
+        """
+        Configure APT in the chroot, bring it up to date with the APT repos and install `extra_packages_to_install`.
+        Returns the packages installed.
+        """
+        apt_repos = get_apt_repos(check_custom=True)
         self.logger.debug('Updating apt preferences')
         apt_path = os.path.join(self.chroot_basedir, 'etc/apt')
         apt_sources_path = os.path.join(apt_path, 'sources.list')
@@ -103,7 +154,7 @@ class BootstrapDir(CacheMixin, HashMixin):
 
         # Update and upgrade
         run(['chroot', self.chroot_basedir, 'apt', 'update'])
-        run(['chroot', self.chroot_basedir, 'apt', 'upgrade', '-y'])
+        run(['chroot', self.chroot_basedir, 'apt', 'full-upgrade' if full_upgrade else 'upgrade', '-y'])
 
         if self.extra_packages_to_install:
             run(['chroot', self.chroot_basedir, 'apt', 'install', '-y'] + self.extra_packages_to_install)
@@ -117,8 +168,7 @@ class BootstrapDir(CacheMixin, HashMixin):
         with open(apt_sources_path, 'w') as f:
             f.write('\n'.join(apt_sources))
 
-        self.clean_mounts()
-        self.save_build_cache(installed_packages)
+        return installed_packages
 
     def after_extra_packages_installation_steps(self):
         pass
@@ -134,11 +184,15 @@ class BootstrapDir(CacheMixin, HashMixin):
     def setup_mounts(self):
         run(['mount', 'proc', os.path.join(self.chroot_basedir, 'proc'), '-t', 'proc'])
         run(['mount', 'sysfs', os.path.join(self.chroot_basedir, 'sys'), '-t', 'sysfs'])
+        if self.apt_archives_enabled:
+            os.makedirs(os.path.join(self.chroot_basedir, APT_ARCHIVES_IN_CHROOT), exist_ok=True)
+            run(['mount', '--bind', self.apt_archives, os.path.join(self.chroot_basedir, APT_ARCHIVES_IN_CHROOT)])
 
     def clean_mounts(self):
         for command in (
             ['umount', '-f', os.path.join(self.chroot_basedir, 'proc')],
             ['umount', '-f', os.path.join(self.chroot_basedir, 'sys')],
+            ['umount', '-f', os.path.join(self.chroot_basedir, APT_ARCHIVES_IN_CHROOT)],
         ):
             run(command, check=False, log=False)
 
@@ -172,7 +226,7 @@ class RootfsBootstrapDir(BootstrapDir):
         run(['sh', '-c', f'gpg --dearmor < {keyring_path} > {binary_keyring}'])
 
         run(
-            ['debootstrap'] + self.deopts + [
+            ['debootstrap'] + self.deopts + self.apt_archives_deopts + [
                 '--foreign', '--keyring', binary_keyring,
                 manifest['debian_release'],
                 self.chroot_basedir, get_apt_repos(check_custom=True)['url']
@@ -195,12 +249,23 @@ class PackageBootstrapDir(RootfsBootstrapDir):
 
     @property
     def extra_packages_to_install(self):
-        return ['build-essential', 'dh-make', 'devscripts', 'fakeroot']
+        # ccache is always installed so that toggling CCACHE does not change the package bootstrap and with it
+        # invalidate every built package, it is only put to use when CCACHE is enabled
+        return ['build-essential', 'ccache', 'dh-make', 'devscripts', 'fakeroot']
 
     @property
     def cache_filename(self):
         return 'basechroot-package.squashfs'
 
+    def debootstrap_debian(self):
+        # The package chroot is the rootfs chroot with build tools on top, so rather than running debootstrap again
+        # it starts from the rootfs cache (creating it if needed). The rest of the setup only has to install the
+        # build tools then.
+        base = RootfsBootstrapDir()
+        base.setup()
+        self.logger.debug('Restoring rootfs bootstrap cache as base of package bootstrap')
+        base.restore_cache(self.chroot_basedir)
+
     def after_extra_packages_installation_steps(self):
         if self.installed_packages_in_cache_changed:
             clean_packages()
@@ -1,11 +1,11 @@
 import os
-import shutil
+import tempfile
 
-from scale_build.utils.paths import CACHE_DIR
+from scale_build.utils.paths import CACHE_DIR, REFERENCE_FILES, TMP_DIR
 from scale_build.utils.reference_files import compare_reference_files
-from scale_build.utils.run import run
 
-from .hash import get_all_repo_hash
+from .cache_backends import CACHE_BACKENDS, get_cache_backend
+from .hash import get_all_repo_hash, get_bootstrap_base_state
 
 
 class CacheMixin:
@@ -14,9 +14,16 @@ class CacheMixin:
     def cache_filename(self):
         raise NotImplementedError
 
+    @property
+    def cache_backend(self):
+        return get_cache_backend()
+
+    def get_cache_file_path(self, backend):
+        return os.path.join(CACHE_DIR, f'{os.path.splitext(self.cache_filename)[0]}{backend.suffix}')
+
     @property
     def cache_file_path(self):
-        return os.path.join(CACHE_DIR, self.cache_filename)
+        return self.get_cache_file_path(self.cache_backend)
 
     @property
     def cache_exists(self):
@@ -25,9 +32,18 @@ class CacheMixin:
         )
 
     def remove_cache(self):
+        # Caches saved with other backends are removed as well, they would not be kept up to date
+        for backend, path in filter(
+            lambda i: os.path.lexists(i[1]),
+            [(self.cache_backend, self.cache_file_path)] + [
+                (backend, self.get_cache_file_path(backend)) for backend in CACHE_BACKENDS.values()
+            ]
+        ):
+            backend.remove(path)
+
         for path in filter(
             lambda p: os.path.exists(p),
-            (self.cache_file_path, self.saved_packages_file_path, self.cache_hash_file_path)
+            (self.saved_packages_file_path, self.cache_hash_file_path, self.cache_base_state_file_path)
         ):
             os.unlink(path)
 
@@ -38,48 +54,75 @@ class CacheMixin:
 
     def save_build_cache(self, installed_packages):
         self.logger.debug('Caching CHROOT_BASEDIR for future runs...')
-        run(['mksquashfs', self.chroot_basedir, self.cache_file_path])
+        self.cache_backend.save(self.chroot_basedir, self.cache_file_path)
         self.update_saved_packages_list(installed_packages)
         self.update_mirror_cache()
 
     @property
-    def mirror_cache_intact(self):
-        intact = True
+    def cache_status(self):
+        """
+        'intact' if the cache can be used as is, 'stale' if it is only out of date with the APT repos and can be
+        refreshed with `refresh_cache()`, otherwise None in which case the cache has been removed.
+        """
+        if not (status := self.check_cache()):
+            self.remove_cache()
+
+        return status
+
+    def check_cache(self):
+        """
+        Same as `cache_status` but leaves the cache alone, so it can be used to report what a build would do.
+        """
+        status = 'intact'
         if not self.cache_exists:
             # No hash file? Lets remove to be safe
-            intact = False
+            status = None
             self.logger.debug('Cache does not exist')
 
-        elif get_all_repo_hash() != self.get_mirror_cache():
-            self.logger.debug('Upstream repo changed! Removing squashfs cache to re-create.')
-            intact = False
-
-        if intact:
-            self.restore_cache(self.chroot_basedir)
-            for reference_file, diff in compare_reference_files(
-                cut_nonexistent_user_group_membership=True,
-                default_homedir='/var/empty'
-            ):
-                if diff:
-                    intact = False
-                    self.logger.debug(
-                        'Reference file %r changed, removing squashfs cache to re-create with it '
-                        'having following diff:\n%s',
-                        reference_file, '\n'.join(diff)
-                    )
-                    break
-
-            # Remove the temporary restored cached directory
-            shutil.rmtree(self.chroot_basedir, ignore_errors=True)
-
-        if not intact:
-            self.remove_cache()
+        elif missing := set(self.extra_packages_to_install) - set(self.installed_packages_in_cache):
+            self.logger.debug('%r package(s) missing from cache, removing squashfs cache to re-create', missing)
+            status = None
 
-        return intact
+        elif get_all_repo_hash() != self.get_mirror_cache():
+            if self.get_cache_base_state() == get_bootstrap_base_state():
+                self.logger.debug('Upstream repo changed! Squashfs cache is going to be refreshed.')
+                status = 'stale'
+            else:
+                self.logger.debug('Upstream repo changed! Removing squashfs cache to re-create.')
+                status = None
+
+        if status:
+            # Only the reference files are needed to verify the cache, so only they are extracted from it
+            os.makedirs(TMP_DIR, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=TMP_DIR) as td:
+                self.restore_cache(td, REFERENCE_FILES)
+                if self.reference_files_changed(td):
+                    status = None
+
+        return status
+
+    def reference_files_changed(self, chroot):
+        for reference_file, diff in compare_reference_files(
+            cut_nonexistent_user_group_membership=True,
+            default_homedir='/var/empty',
+            chroot=chroot,
+        ):
+            if diff:
+                self.logger.debug(
+                    'Reference file %r changed, removing squashfs cache to re-create with it '
+                    'having following diff:\n%s',
+                    reference_file, '\n'.join(diff)
+                )
+                return True
+        return False
 
     @property
     def installed_packages_in_cache_changed(self):
         return self.installed_packages_in_cache != self.get_packages()
 
-    def restore_cache(self, chroot_basedir):
-        run(['unsquashfs', '-f', '-d', chroot_basedir, self.cache_file_path])
+    def restore_cache(self, chroot_basedir, paths=None):
+        # `paths` restricts extraction to these paths (relative to the root of the cached chroot)
+        self.cache_backend.restore(self.cache_file_path, chroot_basedir, paths)
+
+    def mount_cache(self, path):
+        self.cache_backend.mount(self.cache_file_path, path)
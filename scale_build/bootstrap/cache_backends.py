@@ -0,0 +1,97 @@
+import os
+import shutil
+
+from scale_build.config import BOOTSTRAP_CACHE_BACKEND
+from scale_build.exceptions import CallError
+from scale_build.utils.run import run
+
+
+class SquashfsCacheBackend:
+
+    def __init__(self, compression=None):
+        self.compression = compression
+        self.suffix = f'.{compression}.squashfs' if compression else '.squashfs'
+
+    def save(self, source, path):
+        run(['mksquashfs', source, path, '-noappend'] + (['-comp', self.compression] if self.compression else []))
+
+    def restore(self, path, destination, paths=None):
+        run(['unsquashfs', '-f', '-d', destination, path, *(paths or [])])
+
+    def mount(self, path, mountpoint):
+        run(['mount', '-t', 'squashfs', '-o', 'ro,loop', path, mountpoint])
+
+    def remove(self, path):
+        os.unlink(path)
+
+
+class TarZstdCacheBackend:
+
+    suffix = '.tar.zst'
+    tar_options = ['--numeric-owner', '--xattrs', '--xattrs-include=*', '--acls']
+
+    def save(self, source, path):
+        run(['tar', '-C', source, *self.tar_options, '-I', 'zstd -T0', '-cf', path, '.'])
+
+    def restore(self, path, destination, paths=None):
+        os.makedirs(destination, exist_ok=True)
+        run([
+            'tar', '-C', destination, *self.tar_options, '-I', 'zstd -T0', '-xpf', path,
+            *(f'./{p}' for p in paths or []),
+        ])
+
+    def mount(self, path, mountpoint):
+        raise CallError(f'{path!r} can not be mounted')
+
+    def remove(self, path):
+        os.unlink(path)
+
+
+class DirectoryCacheBackend:
+    """
+    Keeps the chroot as a plain directory. Restoring it is a copy which shares data blocks with the cache where the
+    filesystem supports reflinks. Hardlinks are deliberately not used as restored chroots are modified in place.
+    """
+
+    suffix = '.d'
+
+    def save(self, source, path):
+        run(['cp', '-a', '--reflink=auto', source, path])
+
+    def restore(self, path, destination, paths=None):
+        os.makedirs(destination, exist_ok=True)
+        if not paths:
+            run(['cp', '-a', '--reflink=auto', os.path.join(path, '.'), destination])
+            return
+
+        for p in paths:
+            os.makedirs(os.path.join(destination, os.path.dirname(p)), exist_ok=True)
+            run(['cp', '-a', '--reflink=auto', os.path.join(path, p), os.path.join(destination, p)])
+
+    def mount(self, path, mountpoint):
+        run(['mount', '--bind', path, mountpoint])
+        try:
+            run(['mount', '-o', 'remount,bind,ro', mountpoint])
+        except CallError:
+            # Never hand out a writable view of the cache
+            run(['umount', '-f', mountpoint], check=False, log=False)
+            raise
+
+    def remove(self, path):
+        shutil.rmtree(path)
+
+
+CACHE_BACKENDS = {
+    'squashfs': SquashfsCacheBackend(),
+    'squashfs-lz4': SquashfsCacheBackend('lz4'),
+    'squashfs-zstd': SquashfsCacheBackend('zstd'),
+    'tar-zstd': TarZstdCacheBackend(),
+    'directory': DirectoryCacheBackend(),
+}
+
+
+def get_cache_backend(name=BOOTSTRAP_CACHE_BACKEND):
+    try:
+        return CACHE_BACKENDS[name]
+    except KeyError:
+        raise CallError(f'Unknown bootstrap cache backend {name!r}, valid backends are {", ".join(CACHE_BACKENDS)}')
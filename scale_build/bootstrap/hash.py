@@ -1,14 +1,19 @@
+import concurrent.futures
+import contextlib
 import hashlib
 import json
 import logging
 import os
 import re
 import requests
+import threading
 import urllib.parse
 
-from scale_build.utils.manifest import get_apt_repos
+from requests.adapters import HTTPAdapter
+
+from scale_build.utils.manifest import get_apt_repos, get_manifest
 from scale_build.utils.run import run
-from scale_build.utils.paths import CACHE_DIR, HASH_DIR
+from scale_build.utils.paths import CACHE_DIR, HASH_DIR, REPO_METADATA_CACHE_DIR
 
 from .utils import get_apt_preferences
 
@@ -19,25 +24,119 @@ logging.getLogger('urllib3').setLevel(logging.INFO)
 INSTALLED_PACKAGES_REGEX = re.compile(r'([^\t]+)\t([^\t]+)\t([\S]+)\n')
 
 
+class RepoFreshnessChecker:
+    """
+    Hashes the `Release` file of APT repositories to tell whether they changed. Repositories are checked
+    concurrently over a shared HTTP session and the ETag / Last-Modified of every response is kept in `path`, so a
+    repository which did not change is revalidated with a conditional request instead of being downloaded again.
+    Hashes are memoized for the rest of the process, every bootstrap directory shares them.
+    """
+
+    def __init__(self, path=REPO_METADATA_CACHE_DIR, max_workers=8):
+        self.path = path
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=max_workers))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=max_workers))
+
+    def metadata_path(self, url):
+        return os.path.join(self.path, f'{hashlib.sha256(url.encode()).hexdigest()}.json')
+
+    def read_metadata(self, url):
+        with contextlib.suppress(FileNotFoundError, json.JSONDecodeError):
+            with open(self.metadata_path(url), 'r') as f:
+                metadata = json.loads(f.read())
+            if metadata['url'] == url:
+                return metadata
+
+    def write_metadata(self, url, metadata):
+        os.makedirs(self.path, exist_ok=True)
+        path = self.metadata_path(url)
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(json.dumps({'url': url, **metadata}))
+        os.replace(f'{path}.tmp', path)
+
+    def fetch_repo_hash(self, repo_url, distribution):
+        url = urllib.parse.urljoin(repo_url, os.path.join('dists', distribution, 'Release'))
+        headers = {}
+        if metadata := self.read_metadata(url):
+            if metadata.get('etag'):
+                headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last_modified'):
+                headers['If-Modified-Since'] = metadata['last_modified']
+
+        resp = self.session.get(url, headers=headers, timeout=60)
+        if resp.status_code == 304 and metadata:
+            return metadata['hash']
+
+        resp.raise_for_status()
+        repo_hash = hashlib.sha256(resp.content + repo_url.encode()).hexdigest()
+        if resp.headers.get('ETag') or resp.headers.get('Last-Modified'):
+            self.write_metadata(url, {
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'hash': repo_hash,
+            })
+        return repo_hash
+
+    def get_repo_hashes(self, repos):
+        """
+        Returns the hash of every (url, distribution) of `repos` in the same order.
+        """
+        with self.lock:
+            missing = list(dict.fromkeys(r for r in repos if r not in self.hashes))
+            if missing:
+                with concurrent.futures.ThreadPoolExecutor(min(len(missing), self.max_workers)) as executor:
+                    for repo, repo_hash in zip(missing, executor.map(lambda r: self.fetch_repo_hash(*r), missing)):
+                        self.hashes[repo] = repo_hash
+            return [self.hashes[r] for r in repos]
+
+    def clear(self):
+        with self.lock:
+            self.hashes.clear()
+
+
+REPO_FRESHNESS_CHECKER = RepoFreshnessChecker()
+
+
 def get_repo_hash(repo_url: str, distribution: str) -> str:
-    resp = requests.get(urllib.parse.urljoin(repo_url, os.path.join('dists', distribution, 'Release')), timeout=60)
-    resp.raise_for_status()
-    return hashlib.sha256(resp.content + repo_url.encode()).hexdigest()
+    return REPO_FRESHNESS_CHECKER.get_repo_hashes([(repo_url, distribution)])[0]
 
 
 def get_all_repo_hash():
     apt_repos = get_apt_repos(check_custom=True)
-    # Start by validating the main APT repo
-    all_repo_hash = get_repo_hash(apt_repos['url'], apt_repos['distribution'])
-
-    for repo_config in apt_repos['additional']:
-        all_repo_hash += get_repo_hash(repo_config['url'], repo_config['distribution'])
+    # The main APT repo comes first
+    all_repo_hash = ''.join(REPO_FRESHNESS_CHECKER.get_repo_hashes(
+        [(apt_repos['url'], apt_repos['distribution'])] + [
+            (repo_config['url'], repo_config['distribution']) for repo_config in apt_repos['additional']
+        ]
+    ))
 
     all_repo_hash += hashlib.sha256(get_apt_preferences().encode()).hexdigest()
 
     return all_repo_hash
 
 
+def get_bootstrap_base_state():
+    """
+    Everything a bootstrap cache depends on apart from the contents of the APT repos. While this stays the same, a
+    cache which is out of date with the repos can be upgraded in place rather than being created again. A build epoch
+    change always requires a fresh debootstrap.
+    """
+    apt_repos = get_apt_repos(check_custom=True)
+    manifest = get_manifest()
+    return {
+        'build_epoch': manifest['build-epoch'],
+        'debian_release': manifest['debian_release'],
+        'apt_preferences': hashlib.sha256(get_apt_preferences().encode()).hexdigest(),
+        'repos': [[apt_repos['url'], apt_repos['distribution'], apt_repos['components']]] + [
+            [repo['url'], repo['distribution'], repo['component'], repo.get('key')] for repo in apt_repos['additional']
+        ],
+    }
+
+
 class HashMixin:
 
     @property
@@ -48,9 +147,20 @@ class HashMixin:
     def cache_hash_file_path(self):
         return os.path.join(CACHE_DIR, self.cache_hash_filename)
 
+    @property
+    def cache_base_state_file_path(self):
+        return os.path.join(CACHE_DIR, f'{self.cache_filename}.base.json')
+
     def update_mirror_cache(self):
         with open(self.cache_hash_file_path, 'w') as f:
             f.write(get_all_repo_hash())
+        with open(self.cache_base_state_file_path, 'w') as f:
+            f.write(json.dumps(get_bootstrap_base_state()))
+
+    def get_cache_base_state(self):
+        with contextlib.suppress(FileNotFoundError, json.JSONDecodeError):
+            with open(self.cache_base_state_file_path, 'r') as f:
+                return json.loads(f.read())
 
     @property
     def saved_packages_file_path(self):
@@ -29,17 +29,33 @@ def get_normalized_value(value, _type, default_value=None):
         return _type(default_value) if default_value else _type()
 
 
+APT_ARCHIVE_CACHE = get_env_variable('APT_ARCHIVE_CACHE', bool, True)
 APT_BASE_CUSTOM = get_env_variable('APT_BASE_CUSTOM', str)
 APT_INTERNAL_BUILD = get_env_variable('APT_INTERNAL_BUILD', bool, False)
+BOOTSTRAP_CACHE_BACKEND = get_env_variable('BOOTSTRAP_CACHE_BACKEND', str, 'squashfs')
 BUILD_TIME = int(time())
 BUILD_TIME_OBJ = datetime.fromtimestamp(BUILD_TIME)
 BUILDER_DIR = get_env_variable('BUILDER_DIR', str, './')
+BUILD_DEPS_CACHE = get_env_variable('BUILD_DEPS_CACHE', bool, False)
+BUILD_DEPS_CACHE_SIZE = get_env_variable('BUILD_DEPS_CACHE_SIZE', int, 50)
+BUILD_LOG_BUFFER_SIZE = get_env_variable('BUILD_LOG_BUFFER_SIZE', int, 1024 * 1024)
+BUILD_LOG_COMPRESSION = get_env_variable('BUILD_LOG_COMPRESSION', bool, False)
+BUILD_LOG_TAIL_LINES = get_env_variable('BUILD_LOG_TAIL_LINES', int, 200)
 BRANCH_OUT_NAME = get_env_variable('NEW_BRANCH_NAME', str)
 BRANCH_OVERRIDES = {}
 CCACHE_ENABLED = get_env_variable('CCACHE', bool, 0)
+CCACHE_COMPRESSION_LEVEL = get_env_variable('CCACHE_COMPRESSION_LEVEL', int, 0)
+CCACHE_MAX_SIZE = get_env_variable('CCACHE_MAX_SIZE', str, '20G')
+EARLY_CUTOFF = get_env_variable('EARLY_CUTOFF', bool, True)
+EXTENSIONS_CACHE = get_env_variable('EXTENSIONS_CACHE', bool, True)
 FORCE_CLEANUP_WITH_EPOCH_CHANGE = get_env_variable('FORCE_CLEANUP_WITH_EPOCH_CHANGE', bool)
 GITHUB_TOKEN = get_env_variable('GITHUB_TOKEN', str)
+JOBSERVER = get_env_variable('JOBSERVER', bool, True)
+JOBSERVER_TOKENS = get_env_variable('JOBSERVER_TOKENS', int, cpu_count())
 PACKAGE_IDENTITY_FILE_PATH_OVERRIDES = {}
+PACKAGE_STORE = get_env_variable('PACKAGE_STORE', str)
+PACKAGE_STORE_READ_ONLY = get_env_variable('PACKAGE_STORE_READ_ONLY', bool, False)
+PARALLEL_EXTENSIONS = get_env_variable('PARALLEL_EXTENSIONS', bool, True)
 PARALLEL_BUILD = get_env_variable('PARALLEL_BUILDS', int, (max(cpu_count(), 8) / 4))
 PKG_DEBUG = get_env_variable('PKG_DEBUG', bool, 0)
 SECRET_ENV_VARS = {}
@@ -51,6 +67,7 @@ TRUENAS_BRANCH_OVERRIDE = get_env_variable('TRUENAS_BRANCH_OVERRIDE', str)
 TRY_BRANCH_OVERRIDE = get_env_variable('TRY_BRANCH_OVERRIDE', str)
 VERSION = get_env_variable('TRUENAS_VERSION', str, f'{_VERS}-{BUILD_TIME_OBJ.strftime("%Y%m%d-%H%M%S")}')
 TRUENAS_VENDOR = get_env_variable('TRUENAS_VENDOR', str)
+WORKER_TOKEN = get_env_variable('WORKER_TOKEN', str)
 PRESERVE_ISO = get_env_variable('PRESERVE_ISO', bool, False)
 
 
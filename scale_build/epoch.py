@@ -19,21 +19,27 @@ def update_epoch(epoch_value):
         f.write(str(epoch_value))
 
 
+def epoch_changed():
+    if not os.path.exists(EPOCH_PATH):
+        return False
+
+    with open(EPOCH_PATH, 'r') as f:
+        return f.read().strip() != str(get_manifest()['build-epoch'])
+
+
 def check_epoch():
     current_epoch = str(get_manifest()['build-epoch'])
     if os.path.exists(EPOCH_PATH):
-        with open(EPOCH_PATH, 'r') as f:
-            epoch_num = f.read().strip()
-            if epoch_num != current_epoch:
-                if FORCE_CLEANUP_WITH_EPOCH_CHANGE:
-                    logger.warning('Build epoch changed! Removing temporary files and forcing clean build.')
-                    update_epoch(current_epoch)
-                    complete_cleanup()
-                    setup_dirs()
-                else:
-                    raise CallError(
-                        'Build epoch changed, either run "make clean" or set '
-                        '"FORCE_CLEANUP_WITH_EPOCH_CHANGE" environment variable to proceed.'
-                    )
+        if epoch_changed():
+            if FORCE_CLEANUP_WITH_EPOCH_CHANGE:
+                logger.warning('Build epoch changed! Removing temporary files and forcing clean build.')
+                update_epoch(current_epoch)
+                complete_cleanup()
+                setup_dirs()
+            else:
+                raise CallError(
+                    'Build epoch changed, either run "make clean" or set '
+                    '"FORCE_CLEANUP_WITH_EPOCH_CHANGE" environment variable to proceed.'
+                )
     else:
         update_epoch(current_epoch)
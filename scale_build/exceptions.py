@@ -14,3 +14,11 @@ class MissingManifest(CallError):
 class MissingPackagesException(CallError):
     def __init__(self, packages):
         super().__init__(f'Failed preflight check. Please install {", ".join(packages)!r} packages.')
+
+
+class RemoteBuildFailed(CallError):
+    pass
+
+
+class WorkerUnavailable(CallError):
+    pass
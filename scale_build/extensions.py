@@ -1,51 +1,203 @@
-import errno
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
+import json
 import logging
 import os
 import shutil
+import stat
+import time
 
 import requests
 
+from .bootstrap.hash import get_all_repo_hash
+from .config import EXTENSIONS_CACHE, PARALLEL_EXTENSIONS
+from .exceptions import CallError
 from .image.utils import run_in_chroot
+from .packages.timings import PhaseTimings
+from .utils.apt_archives import mount_apt_archives
 from .utils.kernel import get_kernel_version
+from .utils.logger import LoggingContext
 from .utils.manifest import get_manifest
-from .utils.paths import TMPFS, PKG_DIR
+from .utils.paths import EXTENSIONS_CACHE_DIR, HASH_DIR, LOG_DIR, TMP_DIR, TMPFS, PKG_DIR
 from .utils.run import run
 
 logger = logging.getLogger(__name__)
-
-
-def build_extensions(rootfs_image, dst_dir):
-    chroot = os.path.join(TMPFS, "extensions_chroot")
-    chroot_base = os.path.join(TMPFS, "extensions_chroot_base")
-
-    if os.path.exists(chroot_base):
-        shutil.rmtree(chroot_base)
-    os.makedirs(chroot_base)
-    run(["unsquashfs", "-dest", chroot_base, rootfs_image])
-
-    for klass, name in [(DevToolsExtension, "dev-tools"), (NvidiaExtension, "nvidia")]:
-        klass(rootfs_image, chroot_base, chroot).build(name, f"{dst_dir}/{name}.raw")
+NVIDIA_REPOSITORY = "https://nvidia.github.io/libnvidia-container/stable/deb"
+
+
+def build_extensions(chroot_base, dst_dir):
+    extensions = [(DevToolsExtension, "dev-tools"), (NvidiaExtension, "nvidia")]
+    timings = {}
+    # `dst_dir` usually lives in `chroot_base` which must not change while it is the lower layer of a mounted overlay,
+    # so images are staged elsewhere and only moved there once all extension overlays are gone
+    staging_dir = os.path.join(TMP_DIR, "extensions")
+
+    def build(klass, name):
+        logger.debug("Building %r extension (%s/extension-%s.log)", name, LOG_DIR, name)
+        with LoggingContext(f"extension-{name}", "w"):
+            extension = klass(chroot_base, os.path.join(TMPFS, "extensions", name))
+            try:
+                extension.build(name, os.path.join(staging_dir, f"{name}.raw"))
+            finally:
+                timings[name] = extension.timings.to_dict()["phases"]
+
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(staging_dir)
+    start = time.monotonic()
+    try:
+        # Every extension is built in its own overlay on top of the rootfs chroot so they do not interfere
+        with concurrent.futures.ThreadPoolExecutor(len(extensions) if PARALLEL_EXTENSIONS else 1) as executor:
+            for future in [executor.submit(build, klass, name) for klass, name in extensions]:
+                future.result()
+
+        for _, name in extensions:
+            shutil.move(os.path.join(staging_dir, f"{name}.raw"), os.path.join(dst_dir, f"{name}.raw"))
+    finally:
+        duration = time.monotonic() - start
+        logger.debug("Built extensions in %.1fs", duration)
+        with open(os.path.join(LOG_DIR, "extensions.json"), "w") as f:
+            f.write(json.dumps({
+                "parallel": PARALLEL_EXTENSIONS, "duration": round(duration, 3), "extensions": timings,
+            }, indent=4))
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def get_installed_packages(chroot):
+    """
+    Versions of the packages installed in `chroot`, read from its dpkg database.
+    """
+    packages = {}
+    with open(os.path.join(chroot, "var/lib/dpkg/status")) as f:
+        for stanza in f.read().split("\n\n"):
+            fields = dict(
+                line.split(": ", 1) for line in stanza.splitlines() if ": " in line and not line.startswith(" ")
+            )
+            if fields.get("Status", "").endswith(" installed"):
+                packages[fields["Package"]] = fields["Version"]
+    return packages
+
+
+def get_package_key_versions(chroot):
+    """
+    Versions of the packages installed in `chroot` as they should be used for cache keys. Locally built packages
+    get a new version with every build, they are identified by the digest of their contents recorded for
+    `EARLY_CUTOFF` instead. The truenas package only carries the version of the build and is left out.
+    """
+    digests = {}
+    for pkglist in glob.glob(os.path.join(HASH_DIR, "*.pkglist")):
+        digest = None
+        with contextlib.suppress(FileNotFoundError):
+            with open(f"{pkglist[:-len('.pkglist')]}.digest") as f:
+                digest = f.read().strip()
+        with open(pkglist) as f:
+            for deb in f.read().split():
+                digests[deb.split("_")[0]] = digest
+
+    return {
+        name: None if name == "truenas" else digests.get(name) or version
+        for name, version in get_installed_packages(chroot).items()
+    }
 
 
 class Extension:
-    def __init__(self, base_image: str, chroot_base: str, chroot: str):
+    # Packages of the rootfs whose versions the extension depends on, None if it depends on all of them. The
+    # extension image also depends on which packages the rootfs has at all, so those are always part of the key.
+    key_packages = None
+
+    def __init__(self, chroot_base: str, path: str):
         """
-        :param base_image: rootfs squashfs image path
-        :param chroot_base: a path where `base_image` is extracted
-            (it will be used to compare which files were modified and should be included in the extension image)
-        :param chroot: a path which will be used as chroot for extension install
+        :param chroot_base: the finished rootfs chroot. It is used read-only as the lower layer of the extension
+            chroot, anything mounted inside it is not visible in the extension chroot.
+        :param path: a directory holding the extension chroot along with the upper and work directories of its
+            overlay. Everything the extension changes ends up in the upper directory.
         """
-        self.base_image = base_image
         self.chroot_base = chroot_base
-        self.chroot = chroot
+        self.path = path
+        self.chroot = os.path.join(path, "chroot")
+        self.upper = os.path.join(path, "upper")
+        self.timings = PhaseTimings()
+
+    def cache_key(self, name):
+        """
+        Everything the extension image depends on. The image is built as the difference to the rootfs chroot, so
+        apart from what the extension itself installs this includes the packages of the rootfs.
+        """
+        with open(__file__, "rb") as f:
+            code = hashlib.sha256(f.read()).hexdigest()
+        versions = get_package_key_versions(self.chroot_base)
+        return {
+            "name": name,
+            "code": code,
+            "apt_repos": get_all_repo_hash(),
+            "rootfs_packages": sorted(versions),
+            "packages": versions if self.key_packages is None else {
+                package: versions.get(package) for package in self.key_packages
+            },
+            **self.cache_key_impl(versions),
+        }
+
+    def cache_key_impl(self, versions):
+        return {}
+
+    def restore_from_cache(self, name, key, dst_path):
+        with contextlib.suppress(FileNotFoundError, json.JSONDecodeError):
+            with open(os.path.join(EXTENSIONS_CACHE_DIR, f"{name}.json")) as f:
+                if json.loads(f.read())["key"] == key:
+                    shutil.copyfile(os.path.join(EXTENSIONS_CACHE_DIR, f"{name}.raw"), dst_path)
+                    return True
+        return False
+
+    def save_to_cache(self, name, key, dst_path):
+        os.makedirs(EXTENSIONS_CACHE_DIR, exist_ok=True)
+        path = os.path.join(EXTENSIONS_CACHE_DIR, name)
+        shutil.copyfile(dst_path, f"{path}.raw.tmp")
+        os.replace(f"{path}.raw.tmp", f"{path}.raw")
+        with open(f"{path}.json.tmp", "w") as f:
+            f.write(json.dumps({"key": key}))
+        os.replace(f"{path}.json.tmp", f"{path}.json")
 
     def build(self, name, dst_path):
-        if os.path.exists(self.chroot):
-            shutil.rmtree(self.chroot)
-        os.makedirs(self.chroot)
+        key = None
+        if EXTENSIONS_CACHE:
+            with self.timings.phase("cache"):
+                key = hashlib.sha256(json.dumps(self.cache_key(name), sort_keys=True).encode()).hexdigest()
+                if self.restore_from_cache(name, key, dst_path):
+                    logger.debug("Extension %r did not change, using cached image", name)
+                    return
+
+        self.build_uncached(name, dst_path)
+
+        if key:
+            with self.timings.phase("cache"):
+                self.save_to_cache(name, key, dst_path)
+
+    def build_uncached(self, name, dst_path):
+        self.clean_overlay()
+        for path in (self.chroot, self.upper, os.path.join(self.path, "work")):
+            os.makedirs(path)
+
+        run([
+            "mount", "-t", "overlay", "-o",
+            f"lowerdir={self.chroot_base},upperdir={self.upper},workdir={self.path}/work",
+            "none", self.chroot,
+        ])
+        try:
+            self.build_in_overlay(name, dst_path)
+        finally:
+            self.clean_overlay()
+
+    def clean_overlay(self):
+        run(["umount", "-R", "-f", self.chroot], check=False, log=False)
+        if os.path.ismount(self.chroot):
+            raise CallError(f"Failed to unmount {self.chroot!r}")
 
-        run(["unsquashfs", "-dest", self.chroot, self.base_image])
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
 
+    def build_in_overlay(self, name, dst_path):
         os.makedirs(os.path.join(self.chroot, "proc"), exist_ok=True)
         run(["mount", "proc", os.path.join(self.chroot, "proc"), "-t", "proc"])
         os.makedirs(os.path.join(self.chroot, "sys"), exist_ok=True)
@@ -55,7 +207,10 @@ class Extension:
         try:
             shutil.copyfile("/etc/resolv.conf", f"{self.chroot}/etc/resolv.conf")
 
-            self.build_impl()
+            with self.timings.phase("install"), (
+                mount_apt_archives(self.chroot, os.path.join(TMP_DIR, f"apt-archives_{name}"))
+            ):
+                self.build_impl()
         finally:
             run(["umount", os.path.join(self.chroot, "packages")])
             run(["umount", os.path.join(self.chroot, "sys")])
@@ -66,43 +221,69 @@ class Extension:
     def build_impl(self):
         raise NotImplementedError
 
+    def get_sysext_files(self):
+        """
+        Files the extension added or modified under /usr (except /usr/src). The overlay upper directory holds exactly
+        what was changed, apart from whiteouts of removed files and files which were copied up without changing.
+        Symlinks to directories are not included.
+        """
+        sysext_files = []
+        for root, dirs, files in os.walk(os.path.join(self.upper, "usr")):
+            if os.path.relpath(root, self.upper) == "usr":
+                dirs[:] = [d for d in dirs if d != "src"]
+
+            for f in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+                path = os.path.relpath(os.path.join(root, f), self.upper)
+                st = os.lstat(os.path.join(root, f))
+                if stat.S_ISCHR(st.st_mode) and st.st_rdev == 0:
+                    continue  # Whiteout
+                if os.path.isdir(os.path.join(self.chroot, path)):
+                    continue  # Symlink to a directory
+                if self.copied_up_unchanged(path, st):
+                    continue
+                sysext_files.append(path)
+
+        return sorted(sysext_files)
+
+    def copied_up_unchanged(self, path, st):
+        try:
+            base_st = os.lstat(os.path.join(self.chroot_base, path))
+        except FileNotFoundError:
+            return False
+
+        if any(getattr(st, a) != getattr(base_st, a) for a in ("st_mode", "st_uid", "st_gid", "st_size")):
+            return False
+        if stat.S_ISLNK(st.st_mode):
+            return os.readlink(os.path.join(self.upper, path)) == os.readlink(os.path.join(self.chroot_base, path))
+        # Same quick check rsync does
+        return int(st.st_mtime) == int(base_st.st_mtime)
+
     def build_extension(self, name, dst_path):
-        changed_files = [
-            os.path.relpath(filename, self.chroot)
-            for filename in map(
-                lambda filename: os.path.join(os.getcwd(), filename),
-                run(
-                    ["rsync", "-avn", "--out-format=%f", f"{self.chroot}/", f"{self.chroot_base}/"],
-                    log=False,
-                ).stdout.split("\n")
-            )
-            if os.path.abspath(filename).startswith(os.path.abspath(self.chroot))
-        ]
-
-        sysext_files = [f for f in changed_files if f.startswith("usr/") and not (f.startswith("usr/src/"))]
-
-        for root, dirs, files in os.walk(self.chroot, topdown=False):
-            for f in files:
-                path = os.path.relpath(os.path.abspath(os.path.join(root, f)), self.chroot)
-                if path not in sysext_files:
-                    os.unlink(os.path.join(root, f))
-
-            for d in dirs:
-                try:
-                    os.rmdir(os.path.join(root, d))
-                except NotADirectoryError:
-                    os.unlink(os.path.join(root, d))  # It's a symlink
-                except OSError as e:
-                    if e.errno == errno.ENOTEMPTY:
-                        pass
-                    else:
-                        raise
-
-        os.makedirs(f"{self.chroot}/usr/lib/extension-release.d", exist_ok=True)
-        with open(f"{self.chroot}/usr/lib/extension-release.d/extension-release.{name}", "w") as f:
+        # The extension tree is assembled from hardlinks to the upper directory, only the directories containing
+        # extension files are created (with the ownership and permissions they have in the extension chroot)
+        sysext = os.path.join(self.path, "sysext")
+        with self.timings.phase("collect"):
+            directories = set()
+            for path in self.get_sysext_files():
+                os.makedirs(os.path.join(sysext, os.path.dirname(path)), exist_ok=True)
+                os.link(os.path.join(self.upper, path), os.path.join(sysext, path), follow_symlinks=False)
+                parent = os.path.dirname(path)
+                while parent and parent not in directories:
+                    directories.add(parent)
+                    parent = os.path.dirname(parent)
+
+            for directory in sorted(directories, reverse=True):
+                st = os.lstat(os.path.join(self.chroot, directory))
+                os.chown(os.path.join(sysext, directory), st.st_uid, st.st_gid)
+                os.chmod(os.path.join(sysext, directory), stat.S_IMODE(st.st_mode))
+                os.utime(os.path.join(sysext, directory), ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        os.makedirs(f"{sysext}/usr/lib/extension-release.d", exist_ok=True)
+        with open(f"{sysext}/usr/lib/extension-release.d/extension-release.{name}", "w") as f:
             f.write("ID=_any\n")
 
-        run(["mksquashfs", self.chroot, dst_path, "-comp", "xz"])
+        with self.timings.phase("squash"):
+            run(["mksquashfs", sysext, dst_path, "-comp", "xz"])
 
     def run(self, cmd: list[str]):
         run_in_chroot(cmd, chroot=self.chroot)
@@ -120,6 +301,18 @@ class NvidiaExtension(Extension):
     binaries = ("apt", "apt-config", "dpkg")
     temporary_packages = ["gcc", "make", "pkg-config"]
     permanent_packages = ["libvulkan1", "nvidia-container-toolkit", "vulkan-validationlayers"]
+    key_packages = ["apt", "dpkg"] + temporary_packages + permanent_packages
+
+    def cache_key_impl(self, versions):
+        # Packages from the NVIDIA repository can change without anything else changing
+        r = requests.get(f"{NVIDIA_REPOSITORY}/amd64/Release", timeout=60)
+        r.raise_for_status()
+        return {
+            "kernel": get_kernel_version(self.chroot_base),
+            "kernel_packages": {k: v for k, v in versions.items() if k.startswith("linux-")},
+            "driver": get_manifest()["extensions"]["nvidia"]["current"],
+            "nvidia_repository": hashlib.sha256(r.content).hexdigest(),
+        }
 
     def build_impl(self):
         kernel_version = get_kernel_version(self.chroot)
@@ -148,7 +341,7 @@ class NvidiaExtension(Extension):
 
         with open(f"{self.chroot}/etc/apt/sources.list.d/nvidia-container-toolkit.list", "w") as f:
             f.write("deb [signed-by=/usr/share/keyrings/nvidia-container-toolkit-keyring.gpg] "
-                    "https://nvidia.github.io/libnvidia-container/stable/deb/$(ARCH) /")
+                    f"{NVIDIA_REPOSITORY}/$(ARCH) /")
 
     def download_nvidia_driver(self):
         prefix = "https://us.download.nvidia.com/XFree86/Linux-x86_64"
@@ -11,6 +11,7 @@ import json
 import requests
 
 from scale_build.exceptions import CallError
+from scale_build.utils.apt_archives import mount_apt_archives
 from scale_build.utils.manifest import get_apt_repos, get_manifest
 from scale_build.utils.run import run
 from scale_build.utils.paths import CD_DIR, CD_FILES_DIR, CHROOT_BASEDIR, CONF_GRUB, PKG_DIR, RELEASE_DIR, TMP_DIR
@@ -30,14 +31,15 @@ def install_iso_packages():
 
 
 def install_iso_packages_impl():
-    run_in_chroot(['apt', 'update'])
+    with mount_apt_archives(CHROOT_BASEDIR, os.path.join(TMP_DIR, 'apt-archives_cdrom')):
+        run_in_chroot(['apt', 'update'])
 
-    with open(f"{CHROOT_BASEDIR}/etc/resolv.conf") as f:
-        resolv_conf = f.read()
+        with open(f"{CHROOT_BASEDIR}/etc/resolv.conf") as f:
+            resolv_conf = f.read()
 
-    # echo "/dev/disk/by-label/TRUENAS / iso9660 loop 0 0" > ${CHROOT_BASEDIR}/etc/fstab
-    for package in get_manifest()['iso-packages']:
-        run_in_chroot(['apt', 'install', '-y', package])
+        # echo "/dev/disk/by-label/TRUENAS / iso9660 loop 0 0" > ${CHROOT_BASEDIR}/etc/fstab
+        for package in get_manifest()['iso-packages']:
+            run_in_chroot(['apt', 'install', '-y', package])
 
     # We want to make sure that truenas-installer service is enabled
     run_in_chroot(['systemctl', 'enable', 'truenas-installer.service'])
@@ -11,9 +11,10 @@ import time
 
 from scale_build.config import SIGNING_KEY, SIGNING_PASSWORD
 from scale_build.extensions import build_extensions as do_build_extensions
+from scale_build.utils.apt_archives import mount_apt_archives
 from scale_build.utils.manifest import get_manifest, get_apt_repos
 from scale_build.utils.run import run
-from scale_build.utils.paths import CHROOT_BASEDIR, RELEASE_DIR, UPDATE_DIR
+from scale_build.utils.paths import CHROOT_BASEDIR, RELEASE_DIR, TMP_DIR, UPDATE_DIR
 
 from .bootstrap import umount_chroot_basedir
 from .manifest import build_manifest, build_release_manifest, get_version, update_file_path, update_file_checksum_path
@@ -102,26 +103,27 @@ def install_rootfs_packages_impl():
     with open(os.path.join(CHROOT_BASEDIR, 'etc/dpkg/dpkg.cfg.d/force-unsafe-io'), 'w') as f:
         f.write('force-unsafe-io')
 
-    run_in_chroot(['apt', 'update'])
+    with mount_apt_archives(CHROOT_BASEDIR, os.path.join(TMP_DIR, 'apt-archives_rootfs')):
+        run_in_chroot(['apt', 'update'])
 
-    manifest = get_manifest()
-    packages_to_install = {False: set(), True: set()}
-    for package_entry in itertools.chain(manifest['base-packages'], manifest['additional-packages']):
-        packages_to_install[package_entry['install_recommends']].add(package_entry['name'])
+        manifest = get_manifest()
+        packages_to_install = {False: set(), True: set()}
+        for package_entry in itertools.chain(manifest['base-packages'], manifest['additional-packages']):
+            packages_to_install[package_entry['install_recommends']].add(package_entry['name'])
 
-    for install_recommends, packages_names in packages_to_install.items():
-        log_message = f'Installing {packages_names}'
-        install_cmd = ['apt', 'install', '-V', '-y']
-        if not install_recommends:
-            install_cmd.append('--no-install-recommends')
-            log_message += ' (no recommends)'
-        install_cmd += list(packages_names)
+        for install_recommends, packages_names in packages_to_install.items():
+            log_message = f'Installing {packages_names}'
+            install_cmd = ['apt', 'install', '-V', '-y']
+            if not install_recommends:
+                install_cmd.append('--no-install-recommends')
+                log_message += ' (no recommends)'
+            install_cmd += list(packages_names)
 
-        logger.debug(log_message)
-        run_in_chroot(install_cmd)
+            logger.debug(log_message)
+            run_in_chroot(install_cmd)
 
-    # Do any custom rootfs setup
-    custom_rootfs_setup()
+        # Do any custom rootfs setup
+        custom_rootfs_setup()
 
     # Do any pruning of rootfs
     clean_rootfs()
@@ -395,10 +397,8 @@ def build_extensions():
 
         run(["mksquashfs", td, f"{sysext_extensions_dir}/functioning-dpkg.raw"])
 
-    with tempfile.TemporaryDirectory() as td:
-        rootfs_image = f"{td}/rootfs.squashfs"
-        run(["mksquashfs", CHROOT_BASEDIR, rootfs_image, "-one-file-system"])
-        do_build_extensions(rootfs_image, sysext_extensions_dir)
+    # Extensions are built on overlays of the rootfs chroot, the rootfs chroot itself is not modified
+    do_build_extensions(CHROOT_BASEDIR, sysext_extensions_dir)
 
     external_extesions_dir = os.path.join(RELEASE_DIR, "extensions")
     os.makedirs(external_extesions_dir, exist_ok=True)
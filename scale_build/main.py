@@ -12,11 +12,15 @@ from .epoch import check_epoch
 from .exceptions import CallError
 from .iso import build_iso
 from .package import build_packages
+from .packages.protocol import DEFAULT_WORKER_PORT
+from .plan import show_build_plan
 from .preflight import preflight_check
+from .stats import show_stats
 from .update_image import build_update_image
 from .utils.logger import ConsoleFilter, LogHandler
 from .utils.manifest import get_manifest
 from .validate import validate
+from .worker import run_worker
 
 
 logger = logging.getLogger('scale_build')
@@ -60,6 +64,38 @@ def main():
     packages_parser.add_argument(
         '--packages', '-p', help='Specify specific packages to be built', default=[], nargs='+'
     )
+    packages_parser.add_argument(
+        '--workers', '-w', default=[], nargs='+', metavar='HOST:PORT',
+        help='Dispatch packages to these build workers in addition to building them locally',
+    )
+    failure_group = packages_parser.add_mutually_exclusive_group()
+    failure_group.add_argument(
+        '--keep-going', '-k', action='store_true', default=False,
+        help='Keep building every package which does not depend on a failed package',
+    )
+    failure_group.add_argument(
+        '--fail-fast', action='store_true', default=False,
+        help='Terminate packages which are still being built as soon as one package fails',
+    )
+    packages_parser.add_argument(
+        '--plan', action='store_true', default=False,
+        help='Show which packages would be built and why along with an estimated build time without building them',
+    )
+    stats_parser = subparsers.add_parser('stats', help='Show package build timings aggregated across runs')
+    stats_parser.add_argument(
+        '--runs', '-r', type=int, default=5, help='Number of previous runs to compare the latest run against'
+    )
+    stats_parser.add_argument('--top', '-t', type=int, default=15, help='Number of slowest phases to show')
+    stats_parser.add_argument(
+        '--threshold', type=float, default=20, help='Percentage by which a phase has to slow down to be reported'
+    )
+    worker_parser = subparsers.add_parser(
+        'worker', help='Build packages for a "packages" run on another scale-build checkout (trusted networks only)'
+    )
+    worker_parser.add_argument(
+        '--listen', '-l', default=f'127.0.0.1:{DEFAULT_WORKER_PORT}', metavar='HOST:PORT',
+        help='Address to accept build jobs on',
+    )
     subparsers.add_parser('update', help='Create TrueNAS Scale update image')
     subparsers.add_parser('iso', help='Create TrueNAS Scale iso installation file')
     branchout_parser = subparsers.add_parser('branchout', help='Checkout new branch for all packages')
@@ -80,10 +116,18 @@ def main():
         checkout_sources()
     elif args.action == 'check_upstream_package_updates':
         check_upstream_package_updates()
+    elif args.action == 'packages' and args.plan:
+        validate()
+        show_build_plan(args.packages)
     elif args.action == 'packages':
         validate()
         check_epoch()
-        build_packages(args.packages)
+        build_packages(args.packages, args.keep_going, args.fail_fast, args.workers)
+    elif args.action == 'worker':
+        validate()
+        run_worker(args.listen)
+    elif args.action == 'stats':
+        show_stats(args.runs, args.top, args.threshold / 100)
     elif args.action == 'update':
         validate()
         build_update_image()
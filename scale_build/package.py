@@ -1,110 +1,187 @@
+import contextlib
 import logging
 import os
-import queue
 import shutil
 import threading
-
-from toposort import toposort
+import time
 
 from .bootstrap.bootstrapdir import PackageBootstrapDir
 from .clean import clean_bootstrap_logs
-from .config import PARALLEL_BUILD, PKG_DEBUG
-from .exceptions import CallError
+from .config import CCACHE_ENABLED, EARLY_CUTOFF, JOBSERVER, JOBSERVER_TOKENS, PARALLEL_BUILD, PKG_DEBUG
+from .exceptions import CallError, WorkerUnavailable
+from .packages.apt_index import LocalAptIndex
+from .packages.bootstrap import clean_shared_chroot_basedir
+from .packages.ccache import configure_ccache_dir
+from .packages.jobserver import JobServer
 from .packages.order import get_initialized_packages, get_to_build_packages
-from .utils.logger import LoggingContext
-from .utils.paths import LOG_DIR, PKG_DIR, PKG_LOG_DIR
-from .utils.run import interactive_run, run
+from .packages.remote import RemoteWorker
+from .packages.scheduler import BuildScheduler
+from .packages.store import get_package_store, get_store_keys, restore_package_from_store
+from .packages.timings import PhaseTimings
+from .stats import BuildStats
+from .utils.logger import BuildLogContext, LoggingContext
+from .utils.paths import LOG_DIR, PKG_DIR, PKG_LOG_DIR, TMP_DIR
+from .utils.run import ProcessRegistry, interactive_run
 
 
 logger = logging.getLogger(__name__)
 
 APT_LOCK = threading.Lock()
-PACKAGE_BUILD_LOCK = threading.Lock()
+LOCAL_APT_INDEX = LocalAptIndex()
+PACKAGE_STORE = get_package_store()
 
 
-def update_queue(package_queue, to_build_orig, failed, in_progress, built):
-    if failed:
-        # If we have failure(s), there is no point in continuing
-        return
+def restore_packages_from_store(all_packages, to_build, desired_packages=None):
+    keys = get_store_keys(all_packages)
+    restored = []
+    for name, package in list(to_build.items()):
+        package.store_key = keys[name]
+        if not package.store_key or name in (desired_packages or []):
+            continue
+
+        if restore_package_from_store(
+            PACKAGE_STORE, package, package.store_key, os.path.join(TMP_DIR, f'store_{name}'), PKG_DIR
+        ):
+            logger.debug('Restored %r from package store (%s)', name, package.store_key)
+            restored.append(to_build.pop(name).name)
+
+    return restored
+
 
-    to_build = {k: v for k, v in to_build_orig.items()}
-    to_remove = set()
-    for pkg_name, package in in_progress.items():
-        for child in package.children:
-            to_remove.add(child)
+def build_single_package(package):
+    with package.timings.phase('delete_overlayfs'):
+        package.delete_overlayfs()
+    with package.timings.phase('setup_chroot_basedir'):
+        package.setup_chroot_basedir()
+    with package.timings.lock('apt', APT_LOCK):
+        with package.timings.phase('clean_previous_packages'):
+            package.clean_previous_packages()
+        with package.timings.phase('update_apt_index'):
+            LOCAL_APT_INDEX.update()
+        with package.timings.phase('snapshot_local_repo'):
+            package.snapshot_local_repo()
+    with package.timings.phase('make_overlayfs'):
+        package.make_overlayfs()
+    package._build_impl()
 
-    for rm in to_remove:
-        to_build.pop(rm, None)
 
-    deps_mapping = {
-        p.name: {d for d in p.build_time_dependencies() if d not in built} for p in list(to_build.values())
-    }
-    sorted_ordering = [list(deps) for deps in toposort(deps_mapping)]
+def build_package_remotely(package, worker):
+    logger.debug('Building %r package on worker %r', package.name, worker.address)
+    staging_dir = os.path.join(TMP_DIR, f'remote_{package.name}')
+    for path in filter(os.path.exists, (staging_dir, package.local_repo_snapshot)):
+        shutil.rmtree(path)
+    os.makedirs(staging_dir)
+    try:
+        with package.timings.lock('apt', APT_LOCK):
+            # Like a local build, the remote build must not see previously built packages of its own
+            with package.timings.phase('clean_previous_packages'):
+                package.clean_previous_packages()
+            with package.timings.phase('snapshot_local_repo'):
+                package.snapshot_local_repo()
+        with package.timings.phase('remote_build'):
+            built_packages, phases = worker.build(package, package.local_repo_snapshot, staging_dir)
+        package.timings.phases.update({f'remote_{k}': v for k, v in phases.items()})
 
-    for item in filter(
-        lambda i: i in to_build and i not in in_progress and i not in package_queue.queue and i not in built,
-        sorted(sorted_ordering[0], key=lambda k: to_build_orig[k].batch_priority) if sorted_ordering else []
-    ):
-        package_queue.put(to_build_orig.pop(item))
+        with package.timings.lock('apt', APT_LOCK):
+            package.clean_previous_packages()
+            for name in built_packages:
+                os.replace(os.path.join(staging_dir, name), os.path.join(PKG_DIR, name))
+            package.record_built_packages(built_packages)
+    finally:
+        for path in filter(os.path.exists, (staging_dir, package.local_repo_snapshot)):
+            shutil.rmtree(path)
 
 
-def build_package(package_queue, to_build, failed, in_progress, built):
+def build_package(scheduler, jobserver, stats, processes=None, worker=None):
     while True:
-        if not failed and (to_build or package_queue.queue):
-            try:
-                package = package_queue.get(timeout=5)
-            except queue.Empty:
-                package = None
-            else:
-                in_progress[package.name] = package
-        else:
+        start = time.monotonic()
+        package = scheduler.get()
+        stats.add_lock_wait('scheduler', time.monotonic() - start)
+        if package is None:
             if PKG_DEBUG:
                 logger.debug('Thread exiting')
             break
 
-        if package:
-            try:
-                logger.debug('Building %r package', package.name)
-                with LoggingContext(os.path.join('packages', package.name), 'w'):
-                    package.delete_overlayfs()
-                    package.setup_chroot_basedir()
-                    package.make_overlayfs()
-                    with APT_LOCK:
-                        package.clean_previous_packages()
-                        shutil.copytree(PKG_DIR, package.dpkg_overlay_packages_path)
-                    package._build_impl()
-            except Exception as e:
-                logger.error('Failed to build %r package', package.name)
-                failed[package.name] = {'package': package, 'exception': e}
-                with LoggingContext(os.path.join('packages', package.name)):
-                    logger.error('%r package failed to build: %r', package.name, e, exc_info=True)
-                break
+        try:
+            logger.debug('Building %r package', package.name)
+            package.jobserver = jobserver
+            package.processes = processes
+            package.timings = PhaseTimings()
+            package.open_build_log()
+            start = time.monotonic()
+            if worker:
+                with BuildLogContext(package.build_log):
+                    build_package_remotely(package, worker)
             else:
-                with APT_LOCK:
-                    with LoggingContext(os.path.join('packages', package.name)):
-                        logger.debug('Building local APT repo Packages.gz...')
-                        run(
-                            f'cd {PKG_DIR} && dpkg-scanpackages --multiversion . /dev/null | gzip -9c > Packages.gz',
-                            shell=True
-                        )
-                in_progress.pop(package.name)
-                built[package.name] = package
-                logger.info(
-                    'Successfully built %r package (Remaining %d packages)', package.name,
-                    len(to_build) + package_queue.qsize() + len(in_progress)
-                )
-
-        with PACKAGE_BUILD_LOCK:
-            if not package:
-                update_queue(package_queue, to_build, failed, in_progress, built)
+                with BuildLogContext(package.build_log), (
+                    jobserver.building() if jobserver else contextlib.nullcontext()
+                ):
+                    build_single_package(package)
+        except WorkerUnavailable as e:
+            # Not the fault of the package, it is handed out again to be built locally or on another worker
+            logger.warning('%s, building %r package elsewhere', e, package.name)
+            package.build_log.close()
+            worker.failures += 1
+            scheduler.requeue(package)
+            if not worker.usable:
+                logger.warning('Not using build worker %r anymore after %d failures', worker.address, worker.failures)
+                break
+        except Exception as e:
+            logger.error('Failed to build %r package', package.name)
+            log_tail = package.build_log.tail()
+            with BuildLogContext(package.build_log):
+                logger.error('%r package failed to build: %r', package.name, e, exc_info=True)
+            package.build_log.close()
+            stats.add_package(package, 'failed', time.monotonic() - start, log_tail)
+            scheduler.mark_failed(package, e, log_tail)
+            if processes and not processes.terminated:
+                logger.error('Terminating packages which are still being built')
+                processes.terminate()
+            if not scheduler.keep_going:
+                break
+        else:
+            with BuildLogContext(package.build_log):
+                logger.debug('Updating local APT repo index...')
+                with package.timings.phase('index_packages'):
+                    LOCAL_APT_INDEX.cache_stanzas(package.built_packages)
+                with package.timings.lock('apt', APT_LOCK), package.timings.phase('update_apt_index'):
+                    added, removed = LOCAL_APT_INDEX.update()
+                logger.debug('Added %d and removed %d package(s) from local APT repo index', len(added), len(removed))
+                output_changed = True
+                if EARLY_CUTOFF:
+                    try:
+                        with package.timings.phase('output_digest'):
+                            output_changed = package.update_output_digest()
+                    except Exception as e:
+                        logger.warning('Failed to compare built packages with previous build: %r', e)
+                    logger.debug('Built packages %s', 'changed' if output_changed else 'did not change')
+                if PACKAGE_STORE and package.store_key:
+                    try:
+                        with package.timings.phase('publish_to_store'):
+                            PACKAGE_STORE.publish(
+                                package.store_key, package.name,
+                                [os.path.join(PKG_DIR, p) for p in package.built_packages],
+                            )
+                    except OSError as e:
+                        logger.warning('Failed to publish %r to package store: %s', package.name, e)
+            package.build_log.close()
+            stats.add_package(package, 'built', time.monotonic() - start)
+            scheduler.mark_built(package, output_changed)
+            logger.info(
+                'Successfully built %r package (Remaining %d packages)', package.name, scheduler.remaining
+            )
 
 
-def build_packages(desired_packages=None):
+def build_packages(desired_packages=None, keep_going=False, fail_fast=False, workers=None):
     clean_bootstrap_logs()
-    _build_packages_impl(desired_packages)
+    clean_shared_chroot_basedir()
+    try:
+        _build_packages_impl(desired_packages, keep_going, fail_fast, workers)
+    finally:
+        clean_shared_chroot_basedir()
 
 
-def _build_packages_impl(desired_packages=None):
+def _build_packages_impl(desired_packages=None, keep_going=False, fail_fast=False, workers=None):
     logger.info('Building packages (%s/build_packages.log)', LOG_DIR)
     logger.debug('Setting up bootstrap directory')
 
@@ -117,33 +194,77 @@ def _build_packages_impl(desired_packages=None):
         shutil.rmtree(PKG_LOG_DIR)
     os.makedirs(PKG_LOG_DIR)
 
+    if CCACHE_ENABLED:
+        configure_ccache_dir()
+
     with LoggingContext('package_ordering', 'w'):
         all_packages = get_initialized_packages(desired_packages)
         to_build = get_to_build_packages(all_packages, desired_packages)
 
-    package_queue = queue.Queue()
-    in_progress = {}
-    failed = {}
+    changed = set()
+    if PACKAGE_STORE and to_build:
+        logger.debug('Looking up packages in package store (%s/package_store.log)', LOG_DIR)
+        with LoggingContext('package_store', 'w'):
+            restored = restore_packages_from_store(all_packages, to_build, desired_packages)
+            changed = {n for n in restored if not EARLY_CUTOFF or all_packages[n].update_output_digest()}
+        logger.debug('%d package(s) restored from package store', len(restored))
+
+    LOCAL_APT_INDEX.update()
+
     built = {p: all_packages[p] for p in set(all_packages) - set(to_build)}
     if built:
         logger.debug('%d package(s) do not need to be rebuilt (%s)', len(built), ','.join(built))
     logger.debug('Going to build %d package(s): %s', len(to_build), ','.join(to_build))
+    scheduler = BuildScheduler(to_build, built, EARLY_CUTOFF, changed, keep_going)
+    failed = scheduler.failed
     no_of_tasks = PARALLEL_BUILD if len(to_build) >= PARALLEL_BUILD else len(to_build)
-    update_queue(package_queue, to_build, failed, in_progress, built)
     logger.debug('Creating %d parallel task(s)', no_of_tasks)
+    jobserver = JobServer(JOBSERVER_TOKENS) if JOBSERVER else None
+    if jobserver:
+        logger.debug('Sharing %d job(s) between parallel builds through a jobserver', jobserver.tokens)
+        jobserver.start()
+
+    remote_workers = [RemoteWorker(address) for address in workers or []]
+    if remote_workers and to_build:
+        logger.debug('Dispatching packages to %d build worker(s) as well', len(remote_workers))
+        for worker in remote_workers:
+            worker.connect()
+
+    stats = BuildStats()
+    # With fail fast, build commands are started in their own process group so they can be terminated
+    processes = ProcessRegistry() if fail_fast else None
     threads = [
         threading.Thread(
             name=f'build_packages_thread_{i + 1}', target=build_package,
-            args=(package_queue, to_build, failed, in_progress, built)
+            args=(scheduler, jobserver, stats, processes),
         ) for i in range(no_of_tasks)
+    ] + [
+        threading.Thread(
+            name=f'build_packages_worker_{i + 1}', target=build_package,
+            args=(scheduler, jobserver, stats, processes, worker),
+        ) for i, worker in enumerate(remote_workers if to_build else [])
     ]
-    for thread in threads:
-        thread.start()
-    for thread in threads:
-        thread.join()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if jobserver:
+            jobserver.stop()
+        for worker in remote_workers:
+            worker.close()
+        stats.save()
 
     if failed:
         logger.error('Failed to build %r package(s)', ', '.join(failed))
+        for name, info in filter(lambda i: i[1]['log_tail'], failed.items()):
+            logger.error(
+                'Last %d line(s) of %r build log (%s):\n%s', len(info['log_tail']), name,
+                info['package'].build_log.path, '\n'.join(info['log_tail']),
+            )
+        for name, skipped in filter(lambda i: i[1], ((n, f['skipped']) for n, f in failed.items())):
+            logger.error('Skipped %d package(s) depending on %r: %s', len(skipped), name, ', '.join(skipped))
         try:
             if PKG_DEBUG:
                 logger.debug(
@@ -168,10 +289,16 @@ def _build_packages_impl(desired_packages=None):
                         interactive_run(package['package'].debug_command)
         finally:
             for p in map(lambda p: p['package'], failed.values()):
-                with LoggingContext(os.path.join('packages', p.name)):
+                with BuildLogContext(p.build_log):
                     p.delete_overlayfs()
+                p.build_log.close()
 
         raise CallError(f'{", ".join(failed)!r} Packages failed to build')
 
     else:
+        if scheduler.skipped:
+            logger.debug(
+                'Skipped %d package(s) whose dependencies produced identical packages: %s',
+                len(scheduler.skipped), ','.join(scheduler.skipped)
+            )
         logger.info('Success! Done building packages')
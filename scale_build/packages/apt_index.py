@@ -0,0 +1,111 @@
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from scale_build.utils.paths import HASH_DIR, PKG_DIR
+from scale_build.utils.run import run
+
+
+class LocalAptIndex:
+    """
+    Incrementally maintained `Packages` index of the local APT repository.
+
+    Control stanzas are cached per .deb keyed by its filename, size and mtime so updating the index after a
+    package build only needs to inspect the .deb files which were added since the last update. The stanzas are
+    persisted so that subsequent runs do not have to inspect already indexed packages again either.
+    """
+
+    def __init__(self, path=PKG_DIR, cache_path=os.path.join(HASH_DIR, 'local_apt_index.json')):
+        self.path = path
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.stanzas = None
+
+    def load(self):
+        if self.stanzas is None:
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self.stanzas = json.loads(f.read())
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.stanzas = {}
+
+    @staticmethod
+    def get_key(stat):
+        return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    def generate_stanza(self, filename):
+        deb_path = os.path.join(self.path, filename)
+        control = run(['dpkg-deb', '--field', deb_path], log=False).stdout.rstrip('\n')
+        checksums = {'MD5sum': hashlib.md5(), 'SHA1': hashlib.sha1(), 'SHA256': hashlib.sha256()}
+        with open(deb_path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                for checksum in checksums.values():
+                    checksum.update(chunk)
+
+        return '\n'.join([
+            control,
+            f'Filename: ./{filename}',
+            f'Size: {os.path.getsize(deb_path)}',
+        ] + [f'{k}: {v.hexdigest()}' for k, v in checksums.items()])
+
+    def cache_stanzas(self, filenames):
+        """
+        Generate control stanzas for `filenames` so that a subsequent `update()` does not have to. This is meant
+        to be called before acquiring the lock which serializes index updates.
+        """
+        with self.lock:
+            self.load()
+
+        for filename in filter(lambda f: f.endswith('.deb'), filenames):
+            with contextlib.suppress(FileNotFoundError):
+                key = self.get_key(os.stat(os.path.join(self.path, filename)))
+                with self.lock:
+                    if self.stanzas.get(filename, {}).get('key') == key:
+                        continue
+
+                stanza = self.generate_stanza(filename)
+                with self.lock:
+                    self.stanzas[filename] = {'key': key, 'stanza': stanza}
+
+    def update(self):
+        """
+        Bring `Packages` and `Packages.gz` in sync with the .deb files currently present in the local repository.
+        Returns a tuple of added and removed .deb filenames.
+        """
+        with self.lock:
+            self.load()
+            debs = {}
+            with os.scandir(self.path) as entries:
+                for entry in filter(lambda e: e.is_file() and e.name.endswith('.deb'), entries):
+                    debs[entry.name] = self.get_key(entry.stat())
+
+            removed = set(self.stanzas) - set(debs)
+            for filename in removed:
+                self.stanzas.pop(filename)
+
+            added = set()
+            for filename, key in debs.items():
+                if self.stanzas.get(filename, {}).get('key') != key:
+                    self.stanzas[filename] = {'key': key, 'stanza': self.generate_stanza(filename)}
+                    added.add(filename)
+
+            self.write_index()
+            return added, removed
+
+    def write_index(self):
+        packages = ''.join(f'{self.stanzas[filename]["stanza"]}\n\n' for filename in sorted(self.stanzas))
+        for filename, opener in (
+            ('Packages', open),
+            ('Packages.gz', lambda path, mode: gzip.open(path, mode, compresslevel=1)),
+        ):
+            path = os.path.join(self.path, filename)
+            with opener(f'{path}.tmp', 'wt') as f:
+                f.write(packages)
+            os.replace(f'{path}.tmp', path)
+
+        with open(f'{self.cache_path}.tmp', 'w') as f:
+            f.write(json.dumps(self.stanzas))
+        os.replace(f'{self.cache_path}.tmp', self.cache_path)
@@ -1,13 +1,49 @@
+import logging
 import os
+import shutil
+import threading
 
 from scale_build.bootstrap.bootstrapdir import PackageBootstrapDir
+from scale_build.exceptions import CallError
+from scale_build.utils.paths import PKG_CHROOT_BASEDIR
 from scale_build.utils.run import run
 
 
+logger = logging.getLogger(__name__)
+SHARED_CHROOT_BASEDIR_LOCK = threading.Lock()
+
+
+def setup_shared_chroot_basedir():
+    # All package builds share a single read-only copy of the package bootstrap as the lowerdir of their
+    # overlayfs. Preferably the squashfs cache is loop mounted directly so nothing is extracted at all.
+    with SHARED_CHROOT_BASEDIR_LOCK:
+        if os.path.exists(PKG_CHROOT_BASEDIR):
+            return
+
+        os.makedirs(PKG_CHROOT_BASEDIR)
+        bootstrap_dir = PackageBootstrapDir()
+        try:
+            bootstrap_dir.mount_cache(PKG_CHROOT_BASEDIR)
+        except CallError as e:
+            logger.debug('Failed to mount package bootstrap cache (%s), extracting it once instead', e)
+            try:
+                bootstrap_dir.restore_cache(PKG_CHROOT_BASEDIR)
+            except Exception:
+                shutil.rmtree(PKG_CHROOT_BASEDIR)
+                raise
+
+
+def clean_shared_chroot_basedir():
+    with SHARED_CHROOT_BASEDIR_LOCK:
+        run(['umount', '-f', PKG_CHROOT_BASEDIR], check=False, log=False)
+        if os.path.exists(PKG_CHROOT_BASEDIR):
+            shutil.rmtree(PKG_CHROOT_BASEDIR)
+
+
 class BootstrapMixin:
     def setup_chroot_basedir(self):
-        self.logger.debug('Restoring CHROOT_BASEDIR for runs...')
+        self.logger.debug('Setting up CHROOT_BASEDIR for runs...')
         os.makedirs(self.tmpfs_path, exist_ok=True)
         if self.tmpfs:
             run(['mount', '-t', 'tmpfs', '-o', f'size={self.tmpfs_size}G', 'tmpfs', self.tmpfs_path])
-        PackageBootstrapDir().restore_cache(self.chroot_base_directory)
+        setup_shared_chroot_basedir()
@@ -3,9 +3,9 @@ import json
 import os
 import shlex
 import shutil
+import time
 
 from datetime import datetime
-from scale_build.config import BUILD_TIME, VERSION
 from scale_build.exceptions import CallError
 from scale_build.utils.environment import APT_ENV
 from scale_build.utils.manifest import get_truenas_train, get_release_code_name, get_secret_env, get_manifest
@@ -15,11 +15,11 @@ from scale_build.utils.paths import PKG_DIR
 
 class BuildPackageMixin:
 
-    def run_in_chroot(self, command, exception_message=None):
-        run(
+    def run_in_chroot(self, command, exception_message=None, **kwargs):
+        return run(
             f'chroot {self.dpkg_overlay} /bin/bash -c {shlex.quote(command)}', shell=True,
-            exception_msg=exception_message,
-            env=self._get_build_env() | self._get_chroot_env()
+            exception_msg=exception_message, registry=self.processes,
+            env=self._get_build_env() | self._get_chroot_env(), **kwargs
         )
 
     @property
@@ -43,7 +43,7 @@ class BuildPackageMixin:
         # 5) Apt update
         # 6) Install linux custom headers/image for kernel based packages
         # 7) Execute relevant predep commands
-        # 8) Install build depends
+        # 8) Install build depends (or mount a cached layer of them)
         # 9) Execute relevant prebuild commands
         # 10) Generate version
         # 11) Execute relevant building commands
@@ -58,14 +58,41 @@ class BuildPackageMixin:
         env = {
             **os.environ,
             **APT_ENV,
+            **self._get_make_env(),
             **self.env,
         }
         env.update(self.ccache_env(env))
         return env
 
+    def _get_make_env(self):
+        # Build commands calling make directly opt in with `make $MAKE_JOBS_FLAGS` so that they either join the
+        # jobserver or fall back to the usual number of jobs. MAKEFLAGS is left alone as not every make invoked by
+        # build commands is safe to run in parallel. An explicit `jobs` in the manifest always wins.
+        if self.jobserver and not self.jobs:
+            return {'MAKE_JOBS_FLAGS': self.jobserver.make_jobs_flags}
+        else:
+            return {'MAKE_JOBS_FLAGS': f'-j{self.jobs if self.jobs else os.cpu_count()}'}
+
+    @contextlib.contextmanager
+    def jobserver_grant(self):
+        # debuild does not pass the jobserver on, so debuild builds hold a fixed share of its tokens instead
+        if not self.jobserver or self.buildcmd:
+            yield
+            return
+
+        start = time.monotonic()
+        with self.jobserver.grant(self.jobs) as jobs:
+            self.timings.lock_waits['jobserver'] += time.monotonic() - start
+            self.logger.debug('Jobserver granted %d job(s)', jobs)
+            self.build_jobs = jobs
+            try:
+                yield
+            finally:
+                self.build_jobs = None
+
     def _get_chroot_env(self):
         env = {
-            'RELEASE_VERSION': VERSION,
+            'RELEASE_VERSION': self.version,
         }
         secrets = get_secret_env()
         for k in filter(lambda k: k in secrets, self.secret_env):
@@ -73,35 +100,44 @@ class BuildPackageMixin:
         return env
 
     def _build_impl(self):
-        shutil.copytree(self.source_path, self.source_in_chroot, dirs_exist_ok=True, symlinks=True)
+        with self.timings.phase('copy_sources'):
+            shutil.copytree(self.source_path, self.source_in_chroot, dirs_exist_ok=True, symlinks=True)
         if os.path.exists(os.path.join(self.dpkg_overlay_packages_path, 'Packages.gz')):
-            self.run_in_chroot('apt update')
+            with self.timings.phase('apt_update'):
+                self.run_in_chroot('apt update')
 
-        self.setup_ccache()
-        self.execute_pre_depends_commands()
+        with self.timings.phase('setup_ccache'):
+            self.setup_ccache()
+        with self.timings.phase('predepscmd'):
+            self.execute_pre_depends_commands()
 
-        self.run_in_chroot(f'cd {self.package_source} && mk-build-deps --build-dep', 'Failed mk-build-deps')
-        self.run_in_chroot(f'cd {self.package_source} && apt install -y ./*.deb', 'Failed install build deps')
+        with self.timings.phase('mk_build_deps'):
+            self.run_in_chroot(f'cd {self.package_source} && mk-build-deps --build-dep', 'Failed mk-build-deps')
+        with self.timings.phase('install_build_deps'):
+            if not self.restore_build_deps_layer():
+                self.run_in_chroot(f'cd {self.package_source} && apt install -y ./*.deb', 'Failed install build deps')
+                self.save_build_deps_layer()
 
         # Truenas package is special
         if self.name == 'truenas':
             os.makedirs(os.path.join(self.package_source_with_chroot, 'data'))
             with open(os.path.join(self.package_source_with_chroot, 'data/manifest.json'), 'w') as f:
                 f.write(json.dumps({
-                    'buildtime': BUILD_TIME,
+                    'buildtime': self.build_time,
                     'train': get_truenas_train(),
                     'codename': get_release_code_name(),
-                    'version': VERSION,
+                    'version': self.version,
                 }))
             os.makedirs(os.path.join(self.package_source_with_chroot, 'etc'), exist_ok=True)
             with open(os.path.join(self.package_source_with_chroot, 'etc/version'), 'w') as f:
-                f.write(VERSION)
+                f.write(self.version)
 
-        for prebuild_command in self.prebuildcmd:
-            self.logger.debug('Running prebuildcmd: %r', prebuild_command)
-            self.run_in_chroot(
-                f'cd {self.package_source} && {prebuild_command}', 'Failed to execute prebuildcmd command'
-            )
+        with self.timings.phase('prebuildcmd'):
+            for prebuild_command in self.prebuildcmd:
+                self.logger.debug('Running prebuildcmd: %r', prebuild_command)
+                self.run_in_chroot(
+                    f'cd {self.package_source} && {prebuild_command}', 'Failed to execute prebuildcmd command'
+                )
 
         # Make a programmatically generated version for this build
         generate_version_flags = ''
@@ -116,28 +152,34 @@ class BuildPackageMixin:
             'Failed dch changelog'
         )
 
-        for command in self.build_command:
-            self.logger.debug('Running build command: %r', command)
-            self.run_in_chroot(
-                f'cd {self.package_source} && {command}', f'Failed to build {self.name} package'
-            )
+        with self.jobserver_grant(), self.timings.phase('build'), self.ccache_stats():
+            for command in self.build_command:
+                self.logger.debug('Running build command: %r', command)
+                self.run_in_chroot(
+                    f'cd {self.package_source} && {command}', f'Failed to build {self.name} package'
+                )
 
         self.logger.debug('Copying finished packages')
         # Copy and record each built packages for cleanup later
         package_dir = os.path.dirname(self.package_source_with_chroot)
         built_packages = []
-        for pkg in filter(lambda p: p.endswith(('.deb', '.udeb')), os.listdir(package_dir)):
-            shutil.move(os.path.join(package_dir, pkg), os.path.join(PKG_DIR, pkg))
-            built_packages.append(pkg)
+        with self.timings.phase('copy_packages'):
+            for pkg in filter(lambda p: p.endswith(('.deb', '.udeb')), os.listdir(package_dir)):
+                shutil.move(os.path.join(package_dir, pkg), os.path.join(PKG_DIR, pkg))
+                built_packages.append(pkg)
 
+        self.record_built_packages(built_packages)
+
+        with self.timings.phase('delete_overlayfs'):
+            self.delete_overlayfs()
+
+    def record_built_packages(self, built_packages):
         with open(self.pkglist_hash_file_path, 'w') as f:
             f.write('\n'.join(built_packages))
 
         with open(self.hash_path, 'w') as f:
             f.write(self.source_hash)
 
-        self.delete_overlayfs()
-
     def execute_pre_depends_commands(self):
         for predep_entry in self.predepscmd:
             if isinstance(predep_entry, dict):
@@ -182,7 +224,7 @@ class BuildPackageMixin:
 
     @property
     def deflags(self):
-        return ['--no-lintian', f'-j{self.jobs if self.jobs else os.cpu_count()}', '-us', '-uc', '-b']
+        return ['--no-lintian', f'-j{self.build_jobs or self.jobs or os.cpu_count()}', '-us', '-uc', '-b']
 
     @contextlib.contextmanager
     def build_dir(self):
@@ -0,0 +1,159 @@
+import collections
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+
+from scale_build.bootstrap.bootstrapdir import PackageBootstrapDir
+from scale_build.config import BUILD_DEPS_CACHE, BUILD_DEPS_CACHE_SIZE
+from scale_build.utils.paths import BUILD_DEPS_CACHE_DIR
+from scale_build.utils.run import run
+
+
+logger = logging.getLogger(__name__)
+LAYERS_IN_USE = collections.Counter()
+LAYERS_LOCK = threading.Lock()
+SIMULATED_INSTALL_RE = re.compile(r'^Inst (\S+) (?:\[\S+\] )?\((\S+)', re.M)
+
+
+@functools.cache
+def get_base_chroot_hash():
+    bootstrap_dir = PackageBootstrapDir()
+    with open(bootstrap_dir.saved_packages_file_path, 'r') as f:
+        return hashlib.sha256((bootstrap_dir.get_mirror_cache() + f.read()).encode()).hexdigest()
+
+
+def get_directory_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for entry in dirs + files:
+            size += os.lstat(os.path.join(root, entry)).st_size
+    return size
+
+
+def remove_build_deps_layer(path, key):
+    os.unlink(os.path.join(path, f'{key}.json'))
+    shutil.rmtree(os.path.join(path, key), ignore_errors=True)
+
+
+def evict_build_deps_layers(path=BUILD_DEPS_CACHE_DIR, max_size=BUILD_DEPS_CACHE_SIZE * 1024 ** 3):
+    """
+    Remove least recently used build dependency layers until the cache fits in `max_size` bytes. Layers which
+    are currently mounted by a package build are never removed.
+    """
+    with LAYERS_LOCK:
+        layers = []
+        for meta_file in filter(lambda f: f.endswith('.json'), os.listdir(path)):
+            meta_path = os.path.join(path, meta_file)
+            with open(meta_path, 'r') as f:
+                layers.append((os.stat(meta_path).st_mtime_ns, meta_file[:-5], json.loads(f.read())['size']))
+
+        total_size = sum(layer[2] for layer in layers)
+        for last_used, key, size in sorted(layers):
+            if total_size <= max_size:
+                break
+            if LAYERS_IN_USE[key]:
+                continue
+
+            logger.debug('Evicting build dependencies layer %r', key)
+            remove_build_deps_layer(path, key)
+            total_size -= size
+
+
+class BuildDepsCacheMixin:
+
+    @property
+    def build_deps_cache_enabled(self):
+        return BUILD_DEPS_CACHE
+
+    def get_build_deps_key(self):
+        # Packages installed by predep commands (which can include packages from the local repo) are part of the
+        # key together with what the build dependencies resolve to against the current apt lists
+        installed = self.run_in_chroot(
+            'dpkg-query -W -f \'${Package}=${Version}\\n\'', 'Failed to list installed packages', log=False,
+        ).stdout
+        simulation = self.run_in_chroot(
+            f'cd {self.package_source} && apt-get install --simulate ./*.deb', 'Failed to resolve build deps',
+            log=False,
+        ).stdout
+        return hashlib.sha256(json.dumps({
+            'base': get_base_chroot_hash(),
+            'build_depends': sorted(self.build_depends),
+            'ccache': self.ccache_enabled,
+            'installed': sorted(installed.split()),
+            'predepscmd': self.predepscmd,
+            'resolved': sorted(f'{pkg}={version}' for pkg, version in SIMULATED_INSTALL_RE.findall(simulation)),
+        }, sort_keys=True).encode()).hexdigest()
+
+    def restore_build_deps_layer(self):
+        """
+        Look up a cached layer for the build dependencies of this package and if there is one, mount it as an
+        additional lowerdir of a fresh overlay. Returns `True` if build dependencies do not have to be installed.
+        """
+        if not self.build_deps_cache_enabled:
+            return False
+
+        self.build_deps_key = self.get_build_deps_key()
+        layer = os.path.join(BUILD_DEPS_CACHE_DIR, self.build_deps_key)
+        with LAYERS_LOCK:
+            if not os.path.exists(f'{layer}.json'):
+                return False
+
+            LAYERS_IN_USE[self.build_deps_key] += 1
+            os.utime(f'{layer}.json')
+
+        self.logger.debug('Using cached build dependencies layer %r', self.build_deps_key)
+        self.build_deps_layer = layer
+        self.umount_overlayfs()
+        for path in (self.chroot_overlay, self.workdir_overlay):
+            shutil.rmtree(path)
+        self.make_overlayfs()
+        # The layer carries apt lists from the build which created it
+        if os.path.exists(os.path.join(self.dpkg_overlay_packages_path, 'Packages.gz')):
+            self.run_in_chroot('apt update')
+
+        return True
+
+    def save_build_deps_layer(self):
+        if not self.build_deps_key:
+            return
+
+        if os.path.exists(self.apt_archives):
+            # Downloaded packages live in the apt archive cache mount and still have to be harvested from there
+            self.run_in_chroot('rm -f /var/cache/apt/*.bin')
+        else:
+            self.run_in_chroot('apt-get clean')
+        os.makedirs(BUILD_DEPS_CACHE_DIR, exist_ok=True)
+        layer = os.path.join(BUILD_DEPS_CACHE_DIR, self.build_deps_key)
+        tmp_layer = os.path.join(BUILD_DEPS_CACHE_DIR, f'.{self.build_deps_key}_{self.name}')
+        if os.path.exists(tmp_layer):
+            shutil.rmtree(tmp_layer)
+
+        self.logger.debug('Caching build dependencies layer %r', self.build_deps_key)
+        # cp -a keeps overlayfs whiteouts (character devices) and opaque directory xattrs intact
+        run(['cp', '-a', self.chroot_overlay, tmp_layer])
+        size = get_directory_size(tmp_layer)
+        with LAYERS_LOCK:
+            # Another build with identical build dependencies might have finished first
+            if not (cached := os.path.exists(f'{layer}.json')):
+                if os.path.exists(layer):
+                    shutil.rmtree(layer)
+                os.rename(tmp_layer, layer)
+                with open(f'{layer}.json', 'w') as f:
+                    f.write(json.dumps({'package': self.name, 'size': size}))
+
+        if cached:
+            shutil.rmtree(tmp_layer)
+
+        evict_build_deps_layers()
+
+    def release_build_deps_layer(self):
+        if self.build_deps_layer:
+            with LAYERS_LOCK:
+                LAYERS_IN_USE[self.build_deps_key] -= 1
+
+        self.build_deps_layer = self.build_deps_key = None
@@ -1,6 +1,47 @@
+import collections
+import contextlib
+import json
 import os
 
-from scale_build.config import CCACHE_ENABLED
+from scale_build.config import CCACHE_COMPRESSION_LEVEL, CCACHE_ENABLED, CCACHE_MAX_SIZE
+from scale_build.utils.paths import CCACHE_DIR, PKG_LOG_DIR
+
+
+CCACHE_STATS_LOG = '/tmp/ccache-stats.log'
+HIT_COUNTERS = ('direct_cache_hit', 'preprocessed_cache_hit', 'remote_cache_hit')
+MISS_COUNTERS = ('cache_miss',)
+
+
+def configure_ccache_dir(path=CCACHE_DIR, max_size=CCACHE_MAX_SIZE, compression_level=CCACHE_COMPRESSION_LEVEL):
+    # ccache reads the configuration from the cache directory itself, so this applies to every build sharing it and
+    # ccache evicts old entries on its own once `max_size` is exceeded. A compression level of 0 is ccache's default.
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'ccache.conf.tmp'), 'w') as f:
+        f.write(f'max_size = {max_size}\ncompression = true\ncompression_level = {compression_level}\n')
+    os.replace(os.path.join(path, 'ccache.conf.tmp'), os.path.join(path, 'ccache.conf'))
+
+
+def parse_ccache_stats_log(data):
+    # Every compilation appends a `# <source file>` line followed by the counters it incremented
+    counters = collections.Counter(
+        line.strip() for line in data.splitlines() if line.strip() and not line.startswith('#')
+    )
+    hits = sum(counters[c] for c in HIT_COUNTERS)
+    misses = sum(counters[c] for c in MISS_COUNTERS)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'counters': dict(counters),
+    }
+
+
+def parse_ccache_print_stats(data):
+    stats = {}
+    for key, value in filter(lambda i: len(i) == 2, (line.split('\t') for line in data.splitlines())):
+        with contextlib.suppress(ValueError):
+            stats[key] = int(value)
+    return stats
 
 
 class CCacheMixin:
@@ -19,11 +60,15 @@ class CCacheMixin:
     def ccache_in_chroot(self) -> str:
         return '/root/.ccache'
 
+    @property
+    def ccache_stats_path(self) -> str:
+        return os.path.join(PKG_LOG_DIR, f'{self.name}.ccache.json')
+
     def ccache_env(self, existing_env: dict) -> dict:
         if not self.ccache_enabled:
             return {}
 
-        env = {'CCACHE_DIR': self.ccache_in_chroot}
+        env = {'CCACHE_DIR': self.ccache_in_chroot, 'CCACHE_STATSLOG': CCACHE_STATS_LOG}
         if self.CCACHE_PATH not in existing_env['PATH'].split(':'):
             env['PATH'] = f'{self.CCACHE_PATH}:{existing_env["PATH"]}'
 
@@ -33,5 +78,41 @@ class CCacheMixin:
         if not self.ccache_enabled:
             return
 
-        self.logger.debug('Setting up ccache')
-        self.run_in_chroot('apt install -y ccache')
+        # ccache is part of the package bootstrap, this only covers a bootstrap cache created before it was
+        if not os.path.exists(os.path.join(self.dpkg_overlay, 'usr/bin/ccache')):
+            self.logger.debug('Setting up ccache')
+            self.run_in_chroot('apt install -y ccache')
+
+    def get_ccache_totals(self) -> dict:
+        return parse_ccache_print_stats(self.run_in_chroot('ccache --print-stats', check=False, log=False).stdout)
+
+    @contextlib.contextmanager
+    def ccache_stats(self):
+        if not self.ccache_enabled:
+            yield
+            return
+
+        stats_log = os.path.join(self.dpkg_overlay, CCACHE_STATS_LOG.lstrip('/'))
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(stats_log)
+        before = self.get_ccache_totals()
+        try:
+            yield
+        finally:
+            try:
+                with open(stats_log, 'r') as f:
+                    stats = parse_ccache_stats_log(f.read())
+            except FileNotFoundError:
+                stats = parse_ccache_stats_log('')
+
+            # Hits and misses only count this package, size changes of the shared cache include parallel builds
+            after = self.get_ccache_totals()
+            for key in ('cache_size_kibibyte', 'files_in_cache'):
+                if key in before and key in after:
+                    stats[key] = {'before': before[key], 'after': after[key], 'delta': after[key] - before[key]}
+
+            with open(self.ccache_stats_path, 'w') as f:
+                f.write(json.dumps(stats, indent=4))
+            self.logger.debug(
+                'ccache: %d hit(s), %d miss(es), hit rate %s', stats['hits'], stats['misses'], stats['hit_rate']
+            )
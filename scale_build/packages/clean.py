@@ -11,9 +11,7 @@ class BuildCleanMixin:
             # Nothing to do
             return
 
-        with open(self.pkglist_hash_file_path, 'r') as f:
-            to_remove = [p for p in map(str.strip, f.read().split()) if p]
-
+        to_remove = self.built_packages
         os.unlink(self.pkglist_hash_file_path)
         if not to_remove:
             return
@@ -0,0 +1,55 @@
+import hashlib
+import re
+import subprocess
+import tarfile
+
+from scale_build.exceptions import CallError
+from scale_build.utils.run import run
+
+
+# Changelogs carry the build timestamp and version which change with every build even if nothing else did
+IGNORED_MEMBERS_RE = re.compile(r'^\./usr/share/doc/[^/]+/changelog(\.Debian)?(\.gz)?$')
+
+
+def get_control_digest(path):
+    fields = run(['dpkg-deb', '--field', path], log=False).stdout
+    version = re.search(r'^Version: (.*)$', fields, re.M)
+    lines = [line for line in fields.splitlines() if not line.startswith('Version:')]
+    if version:
+        lines = [line.replace(version.group(1), '') for line in lines]
+    return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
+
+
+def get_deb_digest(path):
+    """
+    Digest of a .deb which ignores the version, file timestamps and changelogs so that rebuilding unchanged
+    sources results in the same digest.
+    """
+    digest = hashlib.sha256(get_control_digest(path).encode())
+    proc = subprocess.Popen(['dpkg-deb', '--fsys-tarfile', path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+            for member in filter(lambda m: not IGNORED_MEMBERS_RE.match(m.name), tar):
+                digest.update(f'{member.name}\0{member.type}\0{member.mode}\0{member.linkname}\0'.encode())
+                if member.isfile():
+                    f = tar.extractfile(member)
+                    while chunk := f.read(1024 * 1024):
+                        digest.update(chunk)
+        # Drain the padding after the end of archive so dpkg-deb does not fail with a broken pipe
+        proc.stdout.read()
+    finally:
+        proc.stdout.close()
+        if proc.wait():
+            raise CallError(f'Failed to read contents of {path!r}')
+
+    return digest.hexdigest()
+
+
+def get_packages_digest(paths):
+    digest = hashlib.sha256()
+    for name, deb_digest in sorted(
+        (run(['dpkg-deb', '--field', path, 'Package'], log=False).stdout.strip(), get_deb_digest(path))
+        for path in paths
+    ):
+        digest.update(f'{name}:{deb_digest}\n'.encode())
+    return digest.hexdigest()
@@ -0,0 +1,96 @@
+import contextlib
+import os
+import select
+import shutil
+import threading
+import time
+
+from scale_build.utils.paths import TMP_DIR
+
+
+JOBSERVER_IN_CHROOT = '/jobserver'
+
+
+class JobServer:
+    """
+    GNU make jobserver (fifo style, make >= 4.4) shared by all parallel package builds so that together they do not
+    run more jobs than there are tokens.
+
+    Build commands which invoke make as `make $MAKE_JOBS_FLAGS` join the jobserver and acquire tokens job by job, so
+    a long running package like the kernel automatically gets all tokens once it is the only package left building.
+    Any other make keeps running the way it is written.
+    debuild sanitizes the environment and debhelper always passes an explicit -j to make which makes it leave the
+    jobserver, so debuild builds are instead granted a fair share of the tokens up front which they hold until the
+    build finishes.
+    """
+
+    def __init__(self, tokens, path=os.path.join(TMP_DIR, 'jobserver')):
+        self.tokens = max(tokens, 1)
+        self.path = path
+        self.lock = threading.Lock()
+        self.active = 0
+        self.fd = None
+
+    @property
+    def fifo_path(self):
+        return os.path.join(self.path, 'fifo')
+
+    @property
+    def make_jobs_flags(self):
+        # Without an explicit -j, make takes its job slots from the jobserver and passes it on to sub-makes
+        return f'--jobserver-auth=fifo:{os.path.join(JOBSERVER_IN_CHROOT, "fifo")}'
+
+    def start(self):
+        self.stop()
+        os.makedirs(self.path)
+        os.mkfifo(self.fifo_path, 0o666)
+        # Opening read-write means we neither block on open nor see EOF when no make is attached
+        self.fd = os.open(self.fifo_path, os.O_RDWR | os.O_NONBLOCK)
+        # Like make itself, every client has one implicit token so the pool has one token less than the job limit
+        os.write(self.fd, b'+' * (self.tokens - 1))
+
+    def stop(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+
+    @contextlib.contextmanager
+    def building(self):
+        with self.lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    @contextlib.contextmanager
+    def grant(self, limit=None, timeout=10):
+        """
+        Take a fair share of tokens out of the pool for the duration of the context. The share depends on how many
+        packages are building right now, a package which is the only one left building is offered all tokens.
+        Yields the number of jobs the caller may run which includes its implicit token.
+        """
+        with self.lock:
+            share = max(self.tokens // max(self.active, 1), 1)
+        if limit:
+            share = min(share, limit)
+
+        tokens = b''
+        deadline = time.monotonic() + timeout
+        while len(tokens) < share - 1:
+            try:
+                tokens += os.read(self.fd, share - 1 - len(tokens))
+            except BlockingIOError:
+                # Tokens held by make based builds are handed back as soon as their current jobs finish
+                if (remaining := deadline - time.monotonic()) <= 0:
+                    break
+                select.select([self.fd], [], [], remaining)
+
+        try:
+            yield len(tokens) + 1
+        finally:
+            if tokens:
+                os.write(self.fd, tokens)
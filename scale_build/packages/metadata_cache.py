@@ -0,0 +1,65 @@
+import contextlib
+import hashlib
+import json
+import os
+
+from scale_build.bootstrap.bootstrapdir import PackageBootstrapDir
+from scale_build.utils.paths import PACKAGE_METADATA_CACHE_DIR
+
+from .utils import DEPENDS_SCRIPT_PATH
+
+
+class DependencyMetadataCacheMixin:
+    """
+    Persists what `scripts/parse_deps.pl` reports for a package so that ordering packages on an unchanged tree does
+    not have to parse control files again or even set up a chroot for packages which generate their control file.
+    """
+
+    @property
+    def dependency_metadata_cache_path(self):
+        return os.path.join(PACKAGE_METADATA_CACHE_DIR, f'{self.name}.json')
+
+    @property
+    def dependency_metadata_key(self):
+        with open(DEPENDS_SCRIPT_PATH, 'rb') as f:
+            key = {'parse_deps': hashlib.sha256(f.read()).hexdigest()}
+
+        if self.depscmd:
+            # Generated control files depend on the source tree, the commands generating them and the chroot they
+            # are generated in. Uncommitted changes can't be keyed reliably so those are never cached.
+            if self.source_dirty:
+                return None
+            key.update({
+                'source_tree': self.source_tree_hash,
+                'subdir': self.subdir,
+                'predepscmd': self.predepscmd,
+                'depscmd': self.depscmd,
+                'chroot': PackageBootstrapDir().get_mirror_cache(),
+            })
+        else:
+            try:
+                with open(self.debian_control_file_path, 'rb') as f:
+                    key['control'] = hashlib.sha256(f.read()).hexdigest()
+            except FileNotFoundError:
+                return None
+
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def get_cached_dependency_metadata(self, key):
+        if not key:
+            return None
+
+        with contextlib.suppress(FileNotFoundError, json.JSONDecodeError):
+            with open(self.dependency_metadata_cache_path, 'r') as f:
+                cached = json.loads(f.read())
+            if cached['key'] == key:
+                return cached['metadata']
+
+    def cache_dependency_metadata(self, key, metadata):
+        if not key:
+            return
+
+        os.makedirs(PACKAGE_METADATA_CACHE_DIR, exist_ok=True)
+        with open(f'{self.dependency_metadata_cache_path}.tmp', 'w') as f:
+            f.write(json.dumps({'key': key, 'metadata': metadata}))
+        os.replace(f'{self.dependency_metadata_cache_path}.tmp', self.dependency_metadata_cache_path)
@@ -1,6 +1,7 @@
 import logging
 
 from scale_build.exceptions import CallError
+from scale_build.utils.git_utils import snapshot_git_state
 from scale_build.utils.package import get_packages
 
 
@@ -21,11 +22,15 @@ def get_initialized_packages(desired_packages=None):
     binary_packages = {}
     desired_packages = desired_packages or []
     packages_list = get_packages()
-    packages = {}
     for package in packages_list:
         if not package.exists:
             raise CallError(f'Missing sources for {package.name},  did you forget to run "make checkout" ?')
 
+    # Rebuild decisions are based on this single snapshot of every source repository
+    git_state = snapshot_git_state([package.source_path for package in packages_list])
+    packages = {}
+    for package in packages_list:
+        package.git_state = git_state[package.source_path]
         packages[package.name] = package
         for binary_package in package.binary_packages:
             binary_packages[binary_package.name] = binary_package
@@ -1,8 +1,12 @@
+import errno
 import os
 import shutil
 
+from scale_build.utils.apt_archives import APT_ARCHIVES_IN_CHROOT, release_apt_archives, setup_apt_archives
 from scale_build.utils.run import run
-from scale_build.utils.paths import CCACHE_DIR, TMP_DIR, TMPFS
+from scale_build.utils.paths import CCACHE_DIR, PKG_CHROOT_BASEDIR, PKG_DIR, TMP_DIR, TMPFS
+
+from .jobserver import JOBSERVER_IN_CHROOT
 
 
 class OverlayMixin:
@@ -13,7 +17,11 @@ class OverlayMixin:
 
     @property
     def chroot_base_directory(self):
-        return os.path.join(self.tmpfs_path, f'chroot_{self.name}')
+        return PKG_CHROOT_BASEDIR
+
+    @property
+    def overlay_lowerdirs(self):
+        return ':'.join(filter(None, (self.build_deps_layer, self.chroot_base_directory)))
 
     @property
     def chroot_overlay(self):
@@ -35,14 +43,48 @@ class OverlayMixin:
     def dpkg_overlay_packages_path(self):
         return os.path.join(self.dpkg_overlay, 'packages')
 
+    @property
+    def apt_archives(self):
+        return os.path.join(TMP_DIR, f'apt-archives_{self.name}')
+
+    @property
+    def apt_archives_with_chroot_path(self):
+        return os.path.join(self.dpkg_overlay, APT_ARCHIVES_IN_CHROOT)
+
+    @property
+    def jobserver_with_chroot_path(self):
+        return os.path.join(self.dpkg_overlay, JOBSERVER_IN_CHROOT.lstrip('/'))
+
+    @property
+    def local_repo_snapshot(self):
+        return os.path.join(TMP_DIR, f'pkgdir-snapshot_{self.name}')
+
+    def snapshot_local_repo(self):
+        # Hardlinks give us a point-in-time view of the local repo without copying any .deb payloads. Finished
+        # packages are moved into PKG_DIR and the index files are atomically replaced, so files are never modified
+        # in place and the snapshot remains consistent while other packages keep building.
+        if os.path.exists(self.local_repo_snapshot):
+            shutil.rmtree(self.local_repo_snapshot)
+        os.makedirs(self.local_repo_snapshot)
+
+        with os.scandir(PKG_DIR) as entries:
+            for entry in filter(lambda e: e.is_file(), entries):
+                try:
+                    os.link(entry.path, os.path.join(self.local_repo_snapshot, entry.name))
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.copy2(entry.path, os.path.join(self.local_repo_snapshot, entry.name))
+
     def make_overlayfs(self):
         for path in (self.chroot_overlay, self.dpkg_overlay, self.sources_overlay, self.workdir_overlay):
             os.makedirs(path, exist_ok=True)
+        apt_archives_enabled = os.path.exists(self.apt_archives) or setup_apt_archives(self.apt_archives)
 
         for entry in [
             ([
                  'mount', '-t', 'overlay', '-o',
-                 f'lowerdir={self.chroot_base_directory},upperdir={self.chroot_overlay},workdir={self.workdir_overlay}',
+                 f'lowerdir={self.overlay_lowerdirs},upperdir={self.chroot_overlay},workdir={self.workdir_overlay}',
                  'none', f'{self.dpkg_overlay}/'
              ], 'Failed overlayfs'),
             (['mount', 'proc', os.path.join(self.dpkg_overlay, 'proc'), '-t', 'proc'], 'Failed mount proc'),
@@ -52,9 +94,18 @@ class OverlayMixin:
                 'Failed mount --bind /dpkg-src', self.source_in_chroot
             )
         ] + ([
+            (['mount', '-o', 'bind,ro', self.local_repo_snapshot, self.dpkg_overlay_packages_path],
+             'Failed to mount --bind local repo snapshot', self.dpkg_overlay_packages_path),
+        ] if os.path.exists(self.local_repo_snapshot) else []) + ([
             (['mount', '--bind', CCACHE_DIR, self.ccache_with_chroot_path],
              'Failed to mount --bind ccache', self.ccache_with_chroot_path),
-        ] if self.ccache_enabled else []):
+        ] if self.ccache_enabled else []) + ([
+            (['mount', '--bind', self.jobserver.path, self.jobserver_with_chroot_path],
+             'Failed to mount --bind jobserver', self.jobserver_with_chroot_path),
+        ] if self.jobserver else []) + ([
+            (['mount', '--bind', self.apt_archives, self.apt_archives_with_chroot_path],
+             'Failed to mount --bind apt archives', self.apt_archives_with_chroot_path),
+        ] if apt_archives_enabled else []):
             if len(entry) == 2:
                 command, msg = entry
             else:
@@ -63,19 +114,27 @@ class OverlayMixin:
 
             run(command, exception_msg=msg)
 
-    def delete_overlayfs(self):
+    def umount_overlayfs(self):
         for command in (
             ['umount', '-f', os.path.join(self.dpkg_overlay, 'proc')],
             ['umount', '-f', os.path.join(self.dpkg_overlay, 'sys')],
             ['umount', '-f', self.ccache_with_chroot_path],
+            ['umount', '-f', self.dpkg_overlay_packages_path],
+            ['umount', '-f', self.jobserver_with_chroot_path],
+            ['umount', '-f', self.apt_archives_with_chroot_path],
             ['umount', '-f', self.dpkg_overlay],
             ['umount', '-R', '-f', self.dpkg_overlay],
-            ['umount', '-R', '-f', self.tmpfs_path],
         ):
             run(command, check=False)
 
+    def delete_overlayfs(self):
+        self.umount_overlayfs()
+        run(['umount', '-R', '-f', self.tmpfs_path], check=False)
+        self.release_build_deps_layer()
+        release_apt_archives(self.apt_archives)
+
         for path in filter(os.path.exists, (
-            self.chroot_overlay, self.dpkg_overlay, self.workdir_overlay, self.chroot_base_directory,
-            self.sources_overlay, self.tmpfs_path
+            self.chroot_overlay, self.dpkg_overlay, self.workdir_overlay, self.sources_overlay, self.tmpfs_path,
+            self.local_repo_snapshot,
         )):
             shutil.rmtree(path)
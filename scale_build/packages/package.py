@@ -3,17 +3,26 @@ import json
 import logging
 import os
 
+from scale_build.config import (
+    BUILD_LOG_BUFFER_SIZE, BUILD_LOG_COMPRESSION, BUILD_LOG_TAIL_LINES, BUILD_TIME, VERSION,
+)
 from scale_build.exceptions import CallError
+from scale_build.utils.git_utils import retrieve_git_state
+from scale_build.utils.logger import BuildLogHandler
 from scale_build.utils.run import run
-from scale_build.utils.paths import HASH_DIR, PKG_LOG_DIR, SOURCES_DIR
+from scale_build.utils.paths import HASH_DIR, PKG_DIR, PKG_LOG_DIR, SOURCES_DIR
 
 from .binary_package import BinaryPackage
 from .bootstrap import BootstrapMixin
 from .build import BuildPackageMixin
+from .build_deps_cache import BuildDepsCacheMixin
 from .ccache import CCacheMixin
 from .clean import BuildCleanMixin
+from .digest import get_packages_digest
 from .git import GitPackageMixin
+from .metadata_cache import DependencyMetadataCacheMixin
 from .overlay import OverlayMixin
+from .timings import PhaseTimings
 from .utils import (
     DEPENDS_SCRIPT_PATH, gather_build_time_dependencies, get_normalized_build_constraint_value,
     get_normalized_specified_build_constraint_value, normalize_build_depends, normalize_bin_packages_depends,
@@ -23,7 +32,10 @@ from .utils import (
 logger = logging.getLogger(__name__)
 
 
-class Package(BootstrapMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin, GitPackageMixin, OverlayMixin):
+class Package(
+    BootstrapMixin, BuildDepsCacheMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin,
+    DependencyMetadataCacheMixin, GitPackageMixin, OverlayMixin,
+):
     def __init__(
         self, name, branch, repo, prebuildcmd=None, explicit_deps=None,
         generate_version=True, predepscmd=None, deps_path=None, subdir=None, deoptions=None, jobs=None,
@@ -57,7 +69,20 @@ class Package(BootstrapMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin, G
         self.parent_changed = False
         self.force_build = False
         self._build_time_dependencies = None
+        self._git_state = None
+        self._hash_changed_cache = None
         self.build_stage = None
+        self.build_deps_key = None
+        self.build_deps_layer = None
+        self.build_jobs = None
+        self.jobserver = None
+        self.processes = None
+        self.build_log = None
+        self.timings = PhaseTimings()
+        # Remote workers build with the version and build time of the coordinating scale-build run
+        self.version = VERSION
+        self.build_time = BUILD_TIME
+        self.store_key = None
         self.logger = logger
         self.children = set()
         self.batch_priority = batch_priority
@@ -75,6 +100,12 @@ class Package(BootstrapMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin, G
     def log_file_path(self):
         return os.path.join(PKG_LOG_DIR, f'{self.name}.log')
 
+    def open_build_log(self, compress=BUILD_LOG_COMPRESSION):
+        self.build_log = BuildLogHandler(
+            self.log_file_path, 'w', compress, BUILD_LOG_BUFFER_SIZE, BUILD_LOG_TAIL_LINES,
+        )
+        return self.build_log
+
     @property
     def package_path(self):
         pkg_path = self.source_path
@@ -105,26 +136,31 @@ class Package(BootstrapMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin, G
             self._binary_packages.append(BinaryPackage(self.name, self.build_depends, self.name, self.name, set()))
             return self._binary_packages
 
-        with (self.build_dir() if self.depscmd else contextlib.nullcontext()):
-            if self.depscmd:
-                self.setup_control_file_for_dependency_ordering()
-                control_file_path = os.path.join(self.package_source_with_chroot, 'debian/control')
-            else:
-                control_file_path = self.debian_control_file_path
-
-            cp = run([DEPENDS_SCRIPT_PATH, control_file_path], log=False)
-            info = json.loads(cp.stdout)
-            self.build_depends = set(
-                normalize_build_depends(info['source_package']['build_depends'])
-            ) | self.explicit_deps
-            self.source_package = info['source_package']['name']
-            for bin_package in info['binary_packages']:
-                self._binary_packages.append(BinaryPackage(
-                    bin_package['name'], self.build_depends, self.source_package, self.name,
-                    set(normalize_bin_packages_depends(bin_package['depends'] or ''))
-                ))
-                if self.name == 'truenas':
-                    self._binary_packages[-1].build_dependencies |= self._binary_packages[-1].install_dependencies
+        metadata_key = self.dependency_metadata_key
+        info = self.get_cached_dependency_metadata(metadata_key)
+        if info is None:
+            with (self.build_dir() if self.depscmd else contextlib.nullcontext()):
+                if self.depscmd:
+                    self.setup_control_file_for_dependency_ordering()
+                    control_file_path = os.path.join(self.package_source_with_chroot, 'debian/control')
+                else:
+                    control_file_path = self.debian_control_file_path
+
+                cp = run([DEPENDS_SCRIPT_PATH, control_file_path], log=False)
+                info = json.loads(cp.stdout)
+            self.cache_dependency_metadata(metadata_key, info)
+
+        self.build_depends = set(
+            normalize_build_depends(info['source_package']['build_depends'])
+        ) | self.explicit_deps
+        self.source_package = info['source_package']['name']
+        for bin_package in info['binary_packages']:
+            self._binary_packages.append(BinaryPackage(
+                bin_package['name'], self.build_depends, self.source_package, self.name,
+                set(normalize_bin_packages_depends(bin_package['depends'] or ''))
+            ))
+            if self.name == 'truenas':
+                self._binary_packages[-1].build_dependencies |= self._binary_packages[-1].install_dependencies
 
         return self._binary_packages
 
@@ -149,29 +185,73 @@ class Package(BootstrapMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin, G
 
     @property
     def hash_changed(self):
-        return self._hash_changed()
+        if self._hash_changed_cache is None:
+            self._hash_changed_cache = self._hash_changed()
+        return self._hash_changed_cache
 
     def _hash_changed(self):
+        return bool(self.hash_change_reason)
+
+    @property
+    def hash_change_reason(self):
         if self.name == 'truenas':
             # truenas is special and we want to rebuild it always
             # TODO: Do see why that is so
-            return True
-
-        source_hash = self.source_hash
-        existing_hash = None
-        if os.path.exists(self.hash_path):
-            with open(self.hash_path, 'r') as f:
-                existing_hash = f.read().strip()
-        if source_hash == existing_hash:
-            return run(
-                ['git', '-C', self.source_path, 'diff-files', '--quiet', '--ignore-submodules'], check=False, log=False
-            ).returncode != 0
-        else:
-            return True
+            return 'always rebuilt'
+
+        if not os.path.exists(self.hash_path):
+            return 'not built before'
+
+        with open(self.hash_path, 'r') as f:
+            existing_hash = f.read().strip()
+        if self.source_hash != existing_hash:
+            return 'hash changed'
+        elif self.source_dirty:
+            return 'dirty tree'
+
+    @property
+    def git_state(self):
+        # Normally populated for all packages at once by `snapshot_git_state()` when packages are ordered
+        if self._git_state is None:
+            self._git_state = retrieve_git_state(self.source_path)
+        return self._git_state
+
+    @git_state.setter
+    def git_state(self, state):
+        self._git_state = state
+        self._hash_changed_cache = None
+
+    @property
+    def source_dirty(self):
+        return self.git_state['dirty']
 
     @property
     def source_hash(self):
-        return run(['git', '-C', self.source_path, 'rev-parse', '--verify', 'HEAD'], log=False).stdout.strip()
+        return self.git_state['head']
+
+    @property
+    def source_tree_hash(self):
+        return self.git_state['tree']
+
+    @property
+    def build_definition(self):
+        # Everything from the manifest entry which has an effect on the packages produced from the source tree
+        return {
+            'name': self.name,
+            'source_name': self.source_name,
+            'subdir': self.subdir,
+            'deps_path': self.deps_path,
+            'predepscmd': self.predepscmd,
+            'depscmd': self.depscmd,
+            'prebuildcmd': self.prebuildcmd,
+            'buildcmd': self.buildcmd,
+            'deoptions': self.deoptions,
+            'generate_version': self.generate_version,
+            'debian_fork': self.debian_fork,
+            'explicit_deps': sorted(self.explicit_deps),
+            'env': self.env,
+            'secret_env': sorted(self.secret_env),
+        }
 
     @property
     def rebuild(self):
@@ -181,6 +261,23 @@ class Package(BootstrapMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin, G
     def hash_path(self):
         return os.path.join(HASH_DIR, f'{self.name}.hash')
 
+    @property
+    def output_digest_path(self):
+        return os.path.join(HASH_DIR, f'{self.name}.digest')
+
+    def update_output_digest(self):
+        # Returns `True` if the packages produced by the latest build differ from the ones produced before
+        digest = get_packages_digest([os.path.join(PKG_DIR, p) for p in self.built_packages])
+        existing_digest = None
+        if os.path.exists(self.output_digest_path):
+            with open(self.output_digest_path, 'r') as f:
+                existing_digest = f.read().strip()
+
+        with open(self.output_digest_path, 'w') as f:
+            f.write(digest)
+
+        return digest != existing_digest
+
     @property
     def exists(self):
         return os.path.exists(self.source_path)
@@ -189,6 +286,14 @@ class Package(BootstrapMixin, BuildPackageMixin, BuildCleanMixin, CCacheMixin, G
     def pkglist_hash_file_path(self):
         return os.path.join(HASH_DIR, f'{self.name}.pkglist')
 
+    @property
+    def built_packages(self):
+        if not os.path.exists(self.pkglist_hash_file_path):
+            return []
+
+        with open(self.pkglist_hash_file_path, 'r') as f:
+            return [p for p in map(str.strip, f.read().split()) if p]
+
     @property
     def to_build(self):
         return all(
@@ -0,0 +1,85 @@
+import json
+import os
+import socket
+import threading
+
+from scale_build.exceptions import CallError
+
+
+DEFAULT_WORKER_PORT = 7788
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, DEFAULT_WORKER_PORT
+    return host, int(port)
+
+
+class Connection:
+    """
+    Framing used between the coordinating scale-build run and its build workers. Every message is a single line of
+    JSON with a `type`. A `file` message is followed by exactly `size` bytes of file contents. An `error` message
+    received while waiting for something else raises `CallError`.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        # The worker streams log lines from another thread while the build thread sends results
+        self.lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, address, timeout=30):
+        sock = socket.create_connection(parse_address(address), timeout=timeout)
+        sock.settimeout(None)
+        return cls(sock)
+
+    def send(self, message_type, **data):
+        with self.lock:
+            self.sock.sendall(json.dumps({'type': message_type, **data}).encode() + b'\n')
+
+    def send_file(self, path, name=None):
+        with open(path, 'rb') as f, self.lock:
+            size = os.fstat(f.fileno()).st_size
+            self.sock.sendall(json.dumps({
+                'type': 'file', 'name': name or os.path.basename(path), 'size': size,
+            }).encode() + b'\n')
+            if size:
+                self.sock.sendfile(f)
+
+    def receive(self, *message_types):
+        line = self.reader.readline()
+        if not line:
+            raise CallError('Connection closed by peer')
+
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            raise CallError(f'Invalid message received: {line[:100]!r}')
+
+        if message['type'] == 'error' and 'error' not in message_types:
+            raise CallError(message['error'])
+        if message_types and message['type'] not in message_types:
+            raise CallError(f'Expected {"/".join(message_types)!r} message, got {message["type"]!r}')
+        return message
+
+    def receive_file(self, message, destination):
+        name = message['name']
+        if name != os.path.basename(name) or name.startswith('.'):
+            raise CallError(f'Invalid file name {name!r} received')
+
+        path = os.path.join(destination, name)
+        remaining = message['size']
+        with open(f'{path}.tmp', 'wb') as f:
+            while remaining:
+                if not (chunk := self.reader.read(min(remaining, 1024 * 1024))):
+                    raise CallError(f'Connection closed while receiving {name!r}')
+                f.write(chunk)
+                remaining -= len(chunk)
+        os.replace(f'{path}.tmp', path)
+        return path
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
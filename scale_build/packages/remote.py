@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+
+from scale_build.config import BUILD_TIME, VERSION, WORKER_TOKEN
+from scale_build.exceptions import CallError, RemoteBuildFailed, WorkerUnavailable
+from scale_build.utils.paths import TMP_DIR
+from scale_build.utils.run import run
+
+from .protocol import Connection
+
+
+# Number of times a worker may become unavailable before it is not used anymore for the rest of the run
+MAX_FAILURES = 3
+
+
+class RemoteWorker:
+    """
+    Coordinator side of a `scale_build worker`. Packages are built one at a time over a persistent connection which
+    is re-established if it breaks.
+    """
+
+    def __init__(self, address, token=WORKER_TOKEN):
+        self.address = address
+        self.token = token
+        self.connection = None
+        self.failures = 0
+
+    @property
+    def usable(self):
+        return self.failures < MAX_FAILURES
+
+    def connect(self):
+        try:
+            self.connection = Connection.connect(self.address)
+            self.connection.send('hello', token=self.token, version=VERSION, build_time=BUILD_TIME)
+            self.connection.receive('hello')
+        except (OSError, CallError) as e:
+            self.close()
+            raise CallError(f'Failed to connect to build worker {self.address!r}: {e}')
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def build(self, package, local_repo, staging_dir):
+        """
+        Build `package` on the worker. The worker is given whatever it is missing of the packages in `local_repo`
+        and of the package sources. Built packages are placed in `staging_dir`, the names of the packages and the
+        build phases timed by the worker are returned.
+
+        `RemoteBuildFailed` is raised if the package failed to build and `WorkerUnavailable` if the worker could not
+        build it for any other reason, in which case the package should be built elsewhere.
+        """
+        try:
+            if not self.connection:
+                self.connect()
+            return self.build_impl(self.connection, package, local_repo, staging_dir)
+        except RemoteBuildFailed:
+            raise
+        except OSError as e:
+            self.close()
+            raise WorkerUnavailable(f'Lost connection to build worker {self.address!r}: {e}')
+        except CallError as e:
+            self.close()
+            raise WorkerUnavailable(str(e))
+
+    def build_impl(self, connection, package, local_repo, staging_dir):
+        with os.scandir(local_repo) as entries:
+            connection.send(
+                'job', package=package.name, definition=json.loads(json.dumps(package.build_definition)),
+                git_state=package.git_state,
+                local_repo=[{'name': e.name, 'size': e.stat().st_size} for e in entries if e.is_file()],
+            )
+
+        need = connection.receive('need')
+        if need['sources']:
+            package.logger.debug('Sending %r sources to %r', package.source_name, self.address)
+            with tempfile.TemporaryDirectory(dir=TMP_DIR) as td:
+                run(['tar', '-C', package.source_path, '-cf', os.path.join(td, 'sources.tar'), '.'], log=False)
+                connection.send_file(os.path.join(td, 'sources.tar'))
+        package.logger.debug('Sending %d package(s) to %r', len(need['packages']), self.address)
+        for name in need['packages']:
+            connection.send_file(os.path.join(local_repo, name))
+        connection.send('start')
+
+        while (message := connection.receive('log', 'result'))['type'] == 'log':
+            package.logger.debug(message['line'])
+
+        if message['status'] != 'built':
+            # The worker is still usable after a failed build
+            raise RemoteBuildFailed(f'{package.name!r} failed to build on {self.address!r}: {message["error"]}')
+
+        for _ in message['files']:
+            connection.receive_file(connection.receive('file'), staging_dir)
+        return message['files'], message['phases']
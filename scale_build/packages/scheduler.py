@@ -0,0 +1,146 @@
+import heapq
+import logging
+import threading
+
+from toposort import toposort
+
+
+logger = logging.getLogger(__name__)
+
+
+class BuildScheduler:
+    """
+    Hands out packages to build threads as soon as all of their build time dependencies have been built.
+
+    Each package keeps a counter of dependencies which are still to be built. When a package finishes, the counters
+    of its children are decremented and any child which reaches zero is moved to the ready set and waiting threads
+    are woken up right away.
+
+    With `early_cutoff`, packages which are only scheduled because a parent changed are skipped once all of their
+    dependencies are done if none of those dependencies actually produced different output (`changed`).
+
+    Normally nothing is handed out anymore once a package failed. With `keep_going`, only the packages depending on
+    a failed package are dropped and everything else is still built.
+    """
+
+    def __init__(self, to_build, built, early_cutoff=False, changed=None, keep_going=False):
+        self.condition = threading.Condition()
+        self.to_build = to_build
+        self.built = built
+        self.early_cutoff = early_cutoff
+        self.changed = set(changed or ())
+        self.keep_going = keep_going
+        self.failed = {}
+        self.skipped = {}
+        self.in_progress = {}
+        self.pending = {}
+        self.children = {name: set() for name in to_build}
+        self.ready = []
+        self.order = {name: i for i, name in enumerate(to_build)}
+
+        dependencies = {
+            name: {d for d in package.build_time_dependencies() if d in to_build and d != name}
+            for name, package in to_build.items()
+        }
+        # This makes sure that we fail early if we have a dependency cycle as it would otherwise
+        # result in build threads waiting forever
+        list(toposort(dependencies))
+
+        for name, deps in dependencies.items():
+            self.pending[name] = len(deps)
+            for dep in deps:
+                self.children[dep].add(name)
+
+        for name in [n for n in to_build if self.pending[n] == 0]:
+            self._mark_ready(name)
+
+    def _can_skip(self, package):
+        return self.early_cutoff and not (
+            package.force_build or package.hash_changed or package.build_time_dependencies() & self.changed
+        )
+
+    def _mark_ready(self, name):
+        package = self.to_build[name]
+        if self._can_skip(package):
+            logger.debug('Skipping %r as none of its dependencies produced different packages', name)
+            self.pending.pop(name)
+            self.skipped[name] = self.built[name] = package
+            self._release_children(name)
+        else:
+            heapq.heappush(self.ready, (package.batch_priority, self.order[name], name))
+
+    def _release_children(self, name):
+        # Children of a failed package have already been dropped with `keep_going`
+        for child in filter(lambda c: c in self.pending, self.children[name]):
+            self.pending[child] -= 1
+            if self.pending[child] == 0:
+                self._mark_ready(child)
+
+    @property
+    def remaining(self):
+        return len(self.pending) + len(self.in_progress)
+
+    @property
+    def finished(self):
+        return (bool(self.failed) and not self.keep_going) or not (self.pending or self.in_progress)
+
+    def _drop_dependents(self, name):
+        dropped = []
+        dependents = list(self.children[name])
+        while dependents:
+            child = dependents.pop()
+            if child in self.pending:
+                self.pending.pop(child)
+                dropped.append(child)
+                dependents.extend(self.children[child])
+        return sorted(dropped)
+
+    def get(self):
+        """
+        Blocks until a package is ready to be built and returns it. `None` is returned when there is nothing
+        left for the calling thread to build.
+        """
+        with self.condition:
+            while not self.ready and not self.finished:
+                self.condition.wait()
+
+            if (self.failed and not self.keep_going) or not self.ready:
+                return None
+
+            name = heapq.heappop(self.ready)[2]
+            self.pending.pop(name)
+            package = self.in_progress[name] = self.to_build[name]
+            return package
+
+    def mark_built(self, package, output_changed=True):
+        with self.condition:
+            try:
+                self.in_progress.pop(package.name)
+                self.built[package.name] = package
+                if output_changed:
+                    self.changed.add(package.name)
+                self._release_children(package.name)
+            finally:
+                # Waiting threads must never be left behind
+                self.condition.notify_all()
+
+    def requeue(self, package):
+        """
+        Hand out `package` again, e.g. because the build worker it was given to went away.
+        """
+        with self.condition:
+            self.in_progress.pop(package.name)
+            self.pending[package.name] = 0
+            heapq.heappush(self.ready, (package.batch_priority, self.order[package.name], package.name))
+            self.condition.notify_all()
+
+    def mark_failed(self, package, exception, log_tail=None):
+        with self.condition:
+            self.in_progress.pop(package.name)
+            self.failed[package.name] = {
+                'package': package,
+                'exception': exception,
+                'log_tail': log_tail or [],
+                'skipped': self._drop_dependents(package.name) if self.keep_going else [],
+            }
+            self.condition.notify_all()
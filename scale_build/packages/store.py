@@ -0,0 +1,188 @@
+import contextlib
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import urllib.parse
+
+import requests
+
+from scale_build.config import PACKAGE_STORE, PACKAGE_STORE_READ_ONLY
+from scale_build.utils.manifest import get_manifest
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_store_keys(packages):
+    """
+    Compute content addressed store keys for `packages`. A key covers the source tree, the build definition of the
+    package in the manifest and the keys of its build time dependencies. Packages which cannot be reproduced from
+    their key (dirty source trees, the truenas package which is always rebuilt and anything depending on those)
+    get `None`.
+    """
+    manifest = get_manifest()
+    keys = {}
+
+    def get_key(name):
+        if name in keys:
+            return keys[name]
+
+        keys[name] = None
+        package = packages[name]
+        if package.name == 'truenas' or package.source_dirty:
+            return None
+
+        dependencies = {
+            dep: get_key(dep) for dep in sorted(package.build_time_dependencies()) if dep in packages and dep != name
+        }
+        if all(dependencies.values()):
+            keys[name] = hashlib.sha256(json.dumps({
+                'build_epoch': manifest['build-epoch'],
+                'debian_release': manifest['debian_release'],
+                'definition': package.build_definition,
+                'dependencies': dependencies,
+                'source_tree': package.source_tree_hash,
+            }, sort_keys=True).encode()).hexdigest()
+
+        return keys[name]
+
+    for package_name in packages:
+        get_key(package_name)
+
+    return keys
+
+
+class PackageStore:
+
+    read_only = True
+
+    def __init__(self, location):
+        self.location = location
+
+    def entry_path(self, key):
+        return f'{key[:2]}/{key}'
+
+    def fetch(self, key, destination):
+        """
+        Place the packages stored under `key` into the `destination` directory. Returns the list of package
+        filenames or `None` if nothing is stored under `key`.
+        """
+        raise NotImplementedError
+
+    def publish(self, key, package_name, paths):
+        raise NotImplementedError
+
+
+class LocalPackageStore(PackageStore):
+
+    def __init__(self, location, read_only=False):
+        super().__init__(location)
+        self.read_only = read_only
+
+    def fetch(self, key, destination):
+        entry = os.path.join(self.location, self.entry_path(key))
+        try:
+            with open(os.path.join(entry, 'index.json'), 'r') as f:
+                files = json.loads(f.read())['files']
+        except FileNotFoundError:
+            return None
+
+        for filename in files:
+            try:
+                os.link(os.path.join(entry, filename), os.path.join(destination, filename))
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.copy2(os.path.join(entry, filename), os.path.join(destination, filename))
+
+        return files
+
+    def publish(self, key, package_name, paths):
+        entry = os.path.join(self.location, self.entry_path(key))
+        if self.read_only or os.path.exists(entry):
+            return
+
+        tmp_entry = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(tmp_entry)
+        try:
+            for path in paths:
+                shutil.copy2(path, tmp_entry)
+            with open(os.path.join(tmp_entry, 'index.json'), 'w') as f:
+                f.write(json.dumps({'package': package_name, 'files': [os.path.basename(p) for p in paths]}))
+            os.rename(tmp_entry, entry)
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+
+class HTTPPackageStore(PackageStore):
+    """
+    Read-only store served by any plain HTTP server pointing at a directory populated by `LocalPackageStore`.
+    """
+
+    def url(self, key, filename):
+        return urllib.parse.urljoin(f'{self.location.rstrip("/")}/', f'{self.entry_path(key)}/{filename}')
+
+    def fetch(self, key, destination):
+        resp = requests.get(self.url(key, 'index.json'), timeout=60)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+
+        files = resp.json()['files']
+        for filename in files:
+            path = os.path.join(destination, filename)
+            with requests.get(self.url(key, filename), stream=True, timeout=60) as resp:
+                resp.raise_for_status()
+                with open(f'{path}.tmp', 'wb') as f:
+                    for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+            os.replace(f'{path}.tmp', path)
+
+        return files
+
+    def publish(self, key, package_name, paths):
+        pass
+
+
+def get_package_store(location=PACKAGE_STORE, read_only=PACKAGE_STORE_READ_ONLY):
+    if not location:
+        return None
+    elif location.startswith(('http://', 'https://')):
+        return HTTPPackageStore(location)
+    else:
+        return LocalPackageStore(location, read_only)
+
+
+def restore_package_from_store(store, package, key, staging_dir, destination):
+    """
+    Satisfy `package` from `store` instead of building it. Returns `True` if the package was restored.
+    """
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(staging_dir)
+    try:
+        try:
+            files = store.fetch(key, staging_dir)
+        except (OSError, requests.exceptions.RequestException, ValueError) as e:
+            logger.warning('Failed to fetch %r from package store: %s', package.name, e)
+            return False
+
+        if files is None:
+            return False
+
+        package.clean_previous_packages()
+        for filename in files:
+            os.replace(os.path.join(staging_dir, filename), os.path.join(destination, filename))
+
+        package.record_built_packages(files)
+
+        return True
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            shutil.rmtree(staging_dir)
@@ -0,0 +1,31 @@
+import collections
+import contextlib
+import time
+
+
+class PhaseTimings:
+
+    def __init__(self):
+        self.phases = collections.defaultdict(float)
+        self.lock_waits = collections.defaultdict(float)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.monotonic() - start
+
+    @contextlib.contextmanager
+    def lock(self, name, lock):
+        start = time.monotonic()
+        with lock:
+            self.lock_waits[name] += time.monotonic() - start
+            yield
+
+    def to_dict(self):
+        return {
+            'phases': {k: round(v, 3) for k, v in self.phases.items()},
+            'lock_waits': {k: round(v, 3) for k, v in self.lock_waits.items()},
+        }
@@ -0,0 +1,198 @@
+import heapq
+import json
+import logging
+import os
+import statistics
+
+from toposort import toposort_flatten
+
+from .bootstrap.bootstrapdir import PackageBootstrapDir
+from .config import EARLY_CUTOFF, PARALLEL_BUILD
+from .epoch import epoch_changed
+from .exceptions import CallError
+from .packages.bootstrap import clean_shared_chroot_basedir
+from .packages.order import get_initialized_packages, get_to_build_packages
+from .packages.scheduler import BuildScheduler
+from .stats import load_build_stats
+from .utils.logger import LoggingContext
+from .utils.paths import LOG_DIR
+
+
+logger = logging.getLogger(__name__)
+
+PLAN_JSON_PATH = os.path.join(LOG_DIR, 'build_plan.json')
+PLAN_DOT_PATH = os.path.join(LOG_DIR, 'build_plan.dot')
+BOOTSTRAP_ACTIONS = {'intact': 'used as is', 'stale': 'refreshed', None: 'created from scratch'}
+
+
+def get_rebuild_reasons(to_build, desired_packages=None, full_build=False):
+    """
+    Explain why each package of `to_build` would be built. Returns a dict mapping package names to a list of
+    reasons and the parents whose rebuild causes the package to be rebuilt.
+    """
+    reasons = {}
+    for name, package in to_build.items():
+        parents = sorted(d for d in package.build_time_dependencies() if d in to_build and d != name)
+        if full_build:
+            why = ['build epoch changed']
+        elif desired_packages and name in desired_packages:
+            why = ['forced']
+        else:
+            why = [package.hash_change_reason] if package.hash_changed else []
+            if not desired_packages and package.parent_changed:
+                why.append('parent changed')
+        reasons[name] = {'reasons': why, 'changed_parents': parents if 'parent changed' in why else []}
+
+    return reasons
+
+
+def get_recorded_durations(records):
+    """
+    Median duration of every package across the `packages` runs in `records` which built it.
+    """
+    durations = {}
+    for record in records:
+        for name, package in filter(lambda i: i[1]['status'] == 'built', record['packages'].items()):
+            durations.setdefault(name, []).append(package['duration'])
+    return {name: statistics.median(history) for name, history in durations.items()}
+
+
+def get_dependencies(to_build):
+    return {
+        name: {d for d in package.build_time_dependencies() if d in to_build and d != name}
+        for name, package in to_build.items()
+    }
+
+
+def get_longest_chain(to_build, durations):
+    """
+    Returns the chain of dependent packages in `to_build` which takes longest to build one after the other and
+    its total duration. No amount of parallel builds can finish faster than this chain.
+    """
+    dependencies = get_dependencies(to_build)
+    finish = {}
+    previous = {}
+    for name in toposort_flatten(dependencies):
+        previous[name] = max(dependencies[name], key=lambda d: finish[d], default=None)
+        finish[name] = durations[name] + (finish[previous[name]] if previous[name] else 0)
+
+    if not finish:
+        return [], 0
+
+    chain = [max(finish, key=lambda n: finish[n])]
+    while previous[chain[-1]]:
+        chain.append(previous[chain[-1]])
+    return chain[::-1], finish[chain[0]]
+
+
+def simulate_makespan(to_build, durations, parallel_builds):
+    """
+    Estimate how long building `to_build` takes with `parallel_builds` build threads by replaying the order in
+    which `BuildScheduler` hands out packages against `durations`.
+    """
+    scheduler = BuildScheduler(to_build, {})
+    now = 0
+    running = []
+    while scheduler.remaining:
+        while scheduler.ready and len(running) < parallel_builds:
+            package = scheduler.get()
+            heapq.heappush(running, (now + durations[package.name], package.name))
+
+        now, name = heapq.heappop(running)
+        scheduler.mark_built(to_build[name])
+
+    return now
+
+
+def get_dot_graph(packages, to_build, chain):
+    chain_edges = set(zip(chain, chain[1:]))
+    lines = ['digraph packages {', '    rankdir=LR;', '    node [shape=box, style=filled, fillcolor=white];']
+    for name in sorted(packages):
+        attrs = 'fillcolor=red' if name in chain else 'fillcolor=orange' if name in to_build else 'fontcolor=grey40'
+        lines.append(f'    "{name}" [{attrs}];')
+    for name in sorted(packages):
+        for dep in sorted(d for d in packages[name].build_time_dependencies() if d in packages and d != name):
+            attrs = ' [color=red, penwidth=2]' if (dep, name) in chain_edges else ''
+            lines.append(f'    "{dep}" -> "{name}"{attrs};')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def show_build_plan(desired_packages=None):
+    logger.info('Planning package builds (%s/build_plan.log)', LOG_DIR)
+    bootstrap_dir = PackageBootstrapDir()
+    with LoggingContext('build_plan', 'w'):
+        # This is a dry run, so the bootstrap directory is only checked and not set up
+        bootstrap_status = bootstrap_dir.check_cache()
+        if not bootstrap_dir.cache_exists:
+            raise CallError(
+                'Package bootstrap does not exist yet, it is needed to order packages generating their control file. '
+                'Please run "make packages" once.'
+            )
+        try:
+            # An outdated bootstrap is good enough to order packages
+            all_packages = get_initialized_packages(desired_packages)
+        finally:
+            clean_shared_chroot_basedir()
+
+    bootstrap_action = BOOTSTRAP_ACTIONS[bootstrap_status]
+    if bootstrap_status != 'intact':
+        logger.warning('Package bootstrap would be %s before building packages', bootstrap_action)
+
+    full_build = epoch_changed()
+    if full_build:
+        logger.warning('Build epoch changed, all packages have to be rebuilt')
+        to_build = all_packages
+    else:
+        to_build = get_to_build_packages(all_packages, desired_packages)
+
+    reasons = get_rebuild_reasons(to_build, desired_packages, full_build)
+    recorded = get_recorded_durations(load_build_stats())
+    fallback = statistics.median(recorded.values()) if recorded else 0
+    durations = {name: recorded.get(name, fallback) for name in to_build}
+    chain, chain_duration = get_longest_chain(to_build, durations)
+    parallel_builds = max(int(PARALLEL_BUILD), 1)
+    makespan = simulate_makespan(to_build, durations, parallel_builds)
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    with open(PLAN_JSON_PATH, 'w') as f:
+        f.write(json.dumps({
+            'packages': {
+                name: {
+                    'rebuild': name in to_build,
+                    'dependencies': sorted(
+                        d for d in package.build_time_dependencies() if d in all_packages and d != name
+                    ),
+                    **({
+                        **reasons[name],
+                        'estimated_duration': round(durations[name], 3),
+                        'recorded_duration': name in recorded,
+                    } if name in to_build else {}),
+                } for name, package in all_packages.items()
+            },
+            'bootstrap': bootstrap_action,
+            'longest_chain': {'packages': chain, 'duration': round(chain_duration, 3)},
+            'parallel_builds': parallel_builds,
+            'estimated_makespan': round(makespan, 3),
+        }, indent=4))
+    with open(PLAN_DOT_PATH, 'w') as f:
+        f.write(get_dot_graph(all_packages, to_build, chain))
+
+    logger.info('%d of %d package(s) would be built:', len(to_build), len(all_packages))
+    for name, reason in reasons.items():
+        parents = f' ({", ".join(reason["changed_parents"])})' if reason['changed_parents'] else ''
+        logger.info('  %-32s %s%s', name, ', '.join(reason['reasons']), parents)
+
+    if not to_build:
+        return
+
+    if missing := sorted(set(to_build) - set(recorded)):
+        logger.info(
+            '\nNo recorded duration for %d package(s), assuming %.1fs for: %s', len(missing), fallback,
+            ', '.join(missing)
+        )
+    logger.info('\nLongest dependency chain (%.1fs): %s', chain_duration, ' -> '.join(chain))
+    logger.info('Estimated build time with %d parallel build(s): %.1fs', parallel_builds, makespan)
+    if EARLY_CUTOFF:
+        logger.info('Packages skipped because their dependencies produced identical output are not accounted for')
+    logger.info('Build plan written to %r and %r', PLAN_JSON_PATH, PLAN_DOT_PATH)
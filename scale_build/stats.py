@@ -0,0 +1,132 @@
+import collections
+import glob
+import json
+import logging
+import os
+import statistics
+import threading
+
+from .config import BUILD_TIME, PARALLEL_BUILD, VERSION
+from .utils.paths import STATS_DIR
+
+
+logger = logging.getLogger(__name__)
+
+
+class BuildStats:
+    """
+    Machine readable record of a `packages` run. Every package build contributes the time spent in each of its
+    phases and waiting on locks, the record is written to `STATS_DIR` so `scale_build stats` can compare runs.
+    """
+
+    def __init__(self, path=STATS_DIR):
+        self.path = path
+        self.lock = threading.Lock()
+        self.record = {
+            'build_time': BUILD_TIME,
+            'version': VERSION,
+            'parallel_builds': PARALLEL_BUILD,
+            'packages': {},
+            'lock_waits': collections.defaultdict(float),
+        }
+
+    def add_package(self, package, status, duration, log_tail=None):
+        with self.lock:
+            self.record['packages'][package.name] = {
+                'status': status,
+                'duration': round(duration, 3),
+                **package.timings.to_dict(),
+            }
+            if log_tail:
+                self.record['packages'][package.name]['log_tail'] = log_tail
+            for name, wait in package.timings.lock_waits.items():
+                self.record['lock_waits'][name] += wait
+
+    def add_lock_wait(self, name, wait):
+        with self.lock:
+            self.record['lock_waits'][name] += wait
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self.lock:
+            self.record['lock_waits'] = {k: round(v, 3) for k, v in self.record['lock_waits'].items()}
+            with open(os.path.join(self.path, f'{BUILD_TIME}.json'), 'w') as f:
+                f.write(json.dumps(self.record, indent=4))
+
+
+def load_build_stats(path=STATS_DIR):
+    records = []
+    for record_path in glob.glob(os.path.join(path, '*.json')):
+        with open(record_path, 'r') as f:
+            records.append(json.loads(f.read()))
+    return sorted(records, key=lambda r: r['build_time'])
+
+
+def get_regressions(records, window, threshold, min_seconds=10):
+    """
+    Compare every phase of the packages built in the latest run against the median of the same phase in up to
+    `window` previous runs which built that package. Returns (package, phase, median, latest) tuples for phases
+    which got slower by more than `threshold` (a fraction) and at least `min_seconds`.
+    """
+    latest = records[-1]
+    previous = records[:-1][-window:] if window else []
+    regressions = []
+    for name, package in filter(lambda i: i[1]['status'] == 'built', latest['packages'].items()):
+        for phase, duration in package['phases'].items():
+            history = [
+                r['packages'][name]['phases'][phase] for r in previous
+                if r['packages'].get(name, {}).get('status') == 'built' and phase in r['packages'][name]['phases']
+            ]
+            if not history:
+                continue
+
+            median = statistics.median(history)
+            if duration - median >= max(median * threshold, min_seconds):
+                regressions.append((name, phase, median, duration))
+
+    return sorted(regressions, key=lambda r: r[3] - r[2], reverse=True)
+
+
+def show_stats(window=5, top=15, threshold=0.2):
+    records = load_build_stats()
+    if not records:
+        logger.info('No build stats found in %r, run "scale_build packages" first', STATS_DIR)
+        return
+
+    latest = records[-1]
+    logger.info(
+        'Latest run (%s): %d package(s) with %d parallel build(s)',
+        latest['version'], len(latest['packages']), latest['parallel_builds']
+    )
+
+    phases = [
+        (name, phase, duration) for name, package in latest['packages'].items()
+        for phase, duration in package['phases'].items()
+    ]
+    logger.info('\nSlowest phases:')
+    for name, phase, duration in sorted(phases, key=lambda p: p[2], reverse=True)[:top]:
+        logger.info('  %-32s %-20s %10.1fs', name, phase, duration)
+
+    totals = collections.defaultdict(float)
+    for name, phase, duration in phases:
+        totals[phase] += duration
+    logger.info('\nTotal time per phase across packages:')
+    for phase, duration in sorted(totals.items(), key=lambda p: p[1], reverse=True):
+        logger.info('  %-53s %10.1fs', phase, duration)
+
+    logger.info('\nTime spent waiting on locks:')
+    for name, wait in sorted(latest['lock_waits'].items(), key=lambda p: p[1], reverse=True):
+        logger.info('  %-53s %10.1fs', name, wait)
+    logger.info('  %-53s %10.1fs', 'total', sum(latest['lock_waits'].values()))
+
+    previous = len(records[:-1][-window:] if window else [])
+    if not previous:
+        logger.info('\nNo previous runs to compare against')
+        return
+
+    logger.info('\nRegressions against the previous %d run(s):', previous)
+    regressions = get_regressions(records, window, threshold)
+    for name, phase, median, duration in regressions:
+        logger.info('  %-32s %-20s %10.1fs -> %10.1fs', name, phase, median, duration)
+    if not regressions:
+        logger.info('  None')
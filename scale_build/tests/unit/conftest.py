@@ -0,0 +1,20 @@
+import pytest
+
+from scale_build.packages.package import Package
+
+
+@pytest.fixture
+def make_packages():
+    """
+    Returns a function creating packages with the given build time dependencies and batch priorities.
+    """
+    def get_packages(dependencies, priorities=None, package_class=Package):
+        packages = {}
+        for name, deps in dependencies.items():
+            package = package_class(name, 'master', f'https://github.com/truenas/{name}')
+            package._build_time_dependencies = set(deps)
+            package.batch_priority = (priorities or {}).get(name, 100)
+            packages[name] = package
+        return packages
+
+    return get_packages
@@ -0,0 +1,65 @@
+import json
+import os
+
+from scale_build.utils.apt_archives import AptArchiveCache
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_downloads_are_harvested_and_seeded(tmp_path):
+    cache = AptArchiveCache(str(tmp_path / 'cache'))
+    first = tmp_path / 'first'
+    os.makedirs(first / 'partial')
+    write(first / 'zfs_2.2.0_amd64.deb', b'zfs')
+    write(first / 'partial' / 'samba_4.19_amd64.deb', b'incomplete')
+    write(first / 'lock', b'')
+
+    assert cache.harvest(str(first)) == 1
+    with open(cache.index_path) as f:
+        assert list(json.loads(f.read())) == ['zfs_2.2.0_amd64.deb']
+
+    second = tmp_path / 'second'
+    os.makedirs(second)
+    assert cache.seed(str(second)) == 1
+    assert os.path.samefile(second / 'zfs_2.2.0_amd64.deb', tmp_path / 'cache' / 'zfs_2.2.0_amd64.deb')
+    # Seeded packages apt did not touch are not harvested again
+    assert cache.harvest(str(second)) == 0
+
+
+def test_replaced_download_does_not_modify_cached_copy(tmp_path):
+    cache = AptArchiveCache(str(tmp_path / 'cache'))
+    first = tmp_path / 'first'
+    os.makedirs(first)
+    write(first / 'zfs_2.2.0_amd64.deb', b'zfs')
+    cache.harvest(str(first))
+
+    second = tmp_path / 'second'
+    os.makedirs(second)
+    cache.seed(str(second))
+    # apt replaces files by renaming downloads over them
+    write(second / 'zfs.tmp', b'republished zfs')
+    os.replace(second / 'zfs.tmp', second / 'zfs_2.2.0_amd64.deb')
+    with open(tmp_path / 'cache' / 'zfs_2.2.0_amd64.deb', 'rb') as f:
+        assert f.read() == b'zfs'
+
+    assert cache.harvest(str(second)) == 1
+    with open(tmp_path / 'cache' / 'zfs_2.2.0_amd64.deb', 'rb') as f:
+        assert f.read() == b'republished zfs'
+
+
+def test_entries_not_matching_index_are_not_seeded(tmp_path):
+    cache = AptArchiveCache(str(tmp_path / 'cache'))
+    first = tmp_path / 'first'
+    os.makedirs(first)
+    write(first / 'zfs_2.2.0_amd64.deb', b'zfs')
+    cache.harvest(str(first))
+    write(tmp_path / 'first' / 'truncated', b'z')
+    os.replace(tmp_path / 'first' / 'truncated', tmp_path / 'cache' / 'zfs_2.2.0_amd64.deb')
+
+    second = tmp_path / 'second'
+    os.makedirs(second)
+    assert cache.seed(str(second)) == 0
+    assert os.listdir(second) == []
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from unittest.mock import patch
+
+from scale_build.bootstrap.bootstrapdir import PackageBootstrapDir, RootfsBootstrapDir
+from scale_build.bootstrap.hash import get_bootstrap_base_state
+from scale_build.utils.paths import REFERENCE_FILES, REFERENCE_FILES_DIR
+
+
+class BootstrapDir(PackageBootstrapDir):
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    @property
+    def cache_file_path(self):
+        return os.path.join(self.path, self.cache_filename)
+
+    @property
+    def cache_hash_file_path(self):
+        return os.path.join(self.path, self.cache_hash_filename)
+
+    @property
+    def saved_packages_file_path(self):
+        return os.path.join(self.path, 'packages.json')
+
+    @property
+    def cache_base_state_file_path(self):
+        return os.path.join(self.path, 'base.json')
+
+
+@pytest.fixture
+def bootstrap_dir(tmp_path):
+    bootstrap_dir = BootstrapDir(str(tmp_path))
+    for path, contents in (
+        (bootstrap_dir.cache_file_path, ''),
+        (bootstrap_dir.cache_hash_file_path, 'repo_hash'),
+        (bootstrap_dir.saved_packages_file_path, json.dumps({p: {} for p in bootstrap_dir.extra_packages_to_install})),
+        (bootstrap_dir.cache_base_state_file_path, json.dumps({'debian_release': 'trixie'})),
+    ):
+        with open(path, 'w') as f:
+            f.write(contents)
+    return bootstrap_dir
+
+
+def unsquashfs(passwd_suffix=''):
+    extracted = []
+
+    def run(args, **kwargs):
+        destination, paths = args[3], args[5:]
+        extracted.extend(paths)
+        for path in paths:
+            os.makedirs(os.path.join(destination, os.path.dirname(path)), exist_ok=True)
+            shutil.copyfile(os.path.join(REFERENCE_FILES_DIR, path), os.path.join(destination, path))
+            if path == 'etc/passwd':
+                with open(os.path.join(destination, path), 'a') as f:
+                    f.write(passwd_suffix)
+
+    return run, extracted
+
+
+@pytest.mark.parametrize('passwd_suffix,intact', [
+    ('', True),
+    ('builder:x:1000:1000::/home/builder:/bin/sh\n', False),
+])
+def test_only_reference_files_are_extracted_to_verify_cache(bootstrap_dir, passwd_suffix, intact):
+    run, extracted = unsquashfs(passwd_suffix)
+    with patch('scale_build.bootstrap.cache.get_all_repo_hash', return_value='repo_hash'):
+        with patch('scale_build.bootstrap.cache_backends.run', side_effect=run):
+            assert (bootstrap_dir.cache_status == 'intact') is intact
+
+    assert extracted == list(REFERENCE_FILES)
+    assert os.path.exists(bootstrap_dir.cache_file_path) is intact
+
+
+@pytest.mark.parametrize('base_state,status', [
+    ({'debian_release': 'trixie'}, 'stale'),
+    ({'debian_release': 'forky'}, None),
+])
+def test_cache_out_of_date_with_repos_is_refreshed_unless_base_changed(bootstrap_dir, base_state, status):
+    run, extracted = unsquashfs()
+    with patch('scale_build.bootstrap.cache.get_all_repo_hash', return_value='new_repo_hash'):
+        with patch('scale_build.bootstrap.cache.get_bootstrap_base_state', return_value=base_state):
+            with patch('scale_build.bootstrap.cache_backends.run', side_effect=run):
+                assert bootstrap_dir.cache_status == status
+
+    assert os.path.exists(bootstrap_dir.cache_file_path) is bool(status)
+
+
+def test_build_epoch_is_part_of_bootstrap_base_state():
+    apt_repos = {
+        'url': 'https://apt.tn.ixsystems.com', 'distribution': 'trixie', 'components': 'main', 'additional': [],
+    }
+    states = []
+    for epoch in (1, 2):
+        with patch('scale_build.bootstrap.hash.get_manifest', return_value={
+            'build-epoch': epoch, 'debian_release': 'trixie',
+        }), patch('scale_build.bootstrap.hash.get_apt_repos', return_value=apt_repos), patch(
+            'scale_build.bootstrap.hash.get_apt_preferences', return_value='Package: *'
+        ):
+            states.append(get_bootstrap_base_state())
+
+    assert states[0] != states[1]
+
+
+def test_package_bootstrap_is_derived_from_rootfs_bootstrap(tmp_path):
+    calls = []
+    with patch.object(RootfsBootstrapDir, 'setup', lambda self: calls.append(('setup', self.cache_filename))):
+        with patch.object(
+            RootfsBootstrapDir, 'restore_cache', lambda self, path: calls.append(('restore', self.cache_filename, path))
+        ):
+            with patch('scale_build.bootstrap.bootstrapdir.run') as run:
+                bootstrap_dir = BootstrapDir(str(tmp_path))
+                bootstrap_dir.debootstrap_debian()
+
+    run.assert_not_called()
+    assert calls == [
+        ('setup', 'basechroot-rootfs.squashfs'),
+        ('restore', 'basechroot-rootfs.squashfs', bootstrap_dir.chroot_basedir),
+    ]
+    assert bootstrap_dir.apt_archives != RootfsBootstrapDir().apt_archives
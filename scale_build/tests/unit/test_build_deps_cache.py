@@ -0,0 +1,105 @@
+import json
+import os
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from scale_build.packages.build_deps_cache import LAYERS_IN_USE, BuildDepsCacheMixin, evict_build_deps_layers
+
+
+def add_layer(path, key, size, last_used):
+    os.makedirs(path / key)
+    with open(path / f'{key}.json', 'w') as f:
+        f.write(json.dumps({'package': key, 'size': size}))
+    os.utime(path / f'{key}.json', ns=(last_used, last_used))
+
+
+def test_least_recently_used_layers_are_evicted(tmp_path):
+    add_layer(tmp_path, 'old', 10, 1)
+    add_layer(tmp_path, 'new', 10, 3)
+    add_layer(tmp_path, 'recent', 10, 2)
+    evict_build_deps_layers(str(tmp_path), 20)
+    assert sorted(os.listdir(tmp_path)) == ['new', 'new.json', 'recent', 'recent.json']
+
+
+def test_layers_in_use_are_not_evicted(tmp_path):
+    add_layer(tmp_path, 'old', 10, 1)
+    add_layer(tmp_path, 'new', 10, 2)
+    LAYERS_IN_USE['old'] += 1
+    try:
+        evict_build_deps_layers(str(tmp_path), 10)
+    finally:
+        LAYERS_IN_USE['old'] -= 1
+    assert sorted(os.listdir(tmp_path)) == ['old', 'old.json']
+
+
+class CachedPackage(BuildDepsCacheMixin):
+    build_deps_cache_enabled = True
+    build_deps_key = build_deps_layer = None
+    ccache_enabled = False
+    name = 'zectl'
+    package_source = '/zectl'
+
+    def __init__(self, path):
+        self.build_depends = {'debhelper-compat', 'libzfs-dev'}
+        self.predepscmd = []
+        self.installed = 'libc6=2.36-9\n'
+        self.resolved = 'Inst debhelper (13.11.4 Debian:12/stable [all])\nInst libzfs-dev [2.2.0-1] (2.3.0-1 local)\n'
+        self.chroot_overlay = str(path / 'chroot')
+        self.workdir_overlay = str(path / 'workdir')
+        self.dpkg_overlay_packages_path = str(path / 'packages')
+        self.logger = Mock()
+        self.calls = []
+
+    def run_in_chroot(self, command, exception_message=None, log=True):
+        self.calls.append(command)
+        return Mock(stdout=self.resolved if 'simulate' in command else self.installed)
+
+    def umount_overlayfs(self):
+        self.calls.append('umount')
+
+    def make_overlayfs(self):
+        assert not os.path.exists(self.chroot_overlay) and not os.path.exists(self.workdir_overlay)
+        self.calls.append(f'mount {self.build_deps_layer}')
+
+
+@patch('scale_build.packages.build_deps_cache.get_base_chroot_hash', Mock(return_value='base'))
+@pytest.mark.parametrize('change', [
+    lambda p: p.build_depends.add('dh-python'),
+    lambda p: p.predepscmd.append('apt install -y zfs'),
+    lambda p: setattr(p, 'installed', p.installed + 'libzfs6=2.3.0-1\n'),
+    lambda p: setattr(p, 'resolved', p.resolved.replace('2.3.0-1 local', '2.3.1-1 local')),
+])
+def test_build_deps_key_covers_its_inputs(tmp_path, change):
+    package = CachedPackage(tmp_path)
+    key = package.get_build_deps_key()
+    assert package.get_build_deps_key() == key
+    change(package)
+    assert package.get_build_deps_key() != key
+
+
+@pytest.mark.parametrize('cached', [True, False])
+def test_cached_layer_is_mounted_below_fresh_overlay(tmp_path, cached):
+    package = CachedPackage(tmp_path)
+    for path in (package.chroot_overlay, package.workdir_overlay, package.dpkg_overlay_packages_path):
+        os.makedirs(path)
+    open(os.path.join(package.dpkg_overlay_packages_path, 'Packages.gz'), 'w').close()
+    if cached:
+        add_layer(tmp_path / 'cache', 'abcd', 10, 1)
+
+    with patch('scale_build.packages.build_deps_cache.BUILD_DEPS_CACHE_DIR', str(tmp_path / 'cache')), patch.object(
+        CachedPackage, 'get_build_deps_key', return_value='abcd'
+    ):
+        assert package.restore_build_deps_layer() is cached
+
+    if cached:
+        layer = str(tmp_path / 'cache' / 'abcd')
+        assert package.calls == ['umount', f'mount {layer}', 'apt update']
+        assert LAYERS_IN_USE['abcd'] == 1
+        package.release_build_deps_layer()
+        assert LAYERS_IN_USE['abcd'] == 0
+        assert package.build_deps_layer is None
+    else:
+        assert package.calls == []
+        assert os.path.exists(package.chroot_overlay)
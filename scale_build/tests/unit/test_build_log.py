@@ -0,0 +1,64 @@
+import logging
+import shutil
+import subprocess
+
+import pytest
+
+from scale_build.utils.logger import BuildLogContext, BuildLogHandler, LogHandler
+from scale_build.utils.run import run
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('scale_build')
+    level, handlers, propagate = logger.level, logger.handlers, logger.propagate
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [LogHandler()]
+    logger.propagate = False
+    yield logger
+    logger.setLevel(level)
+    logger.handlers = handlers
+    logger.propagate = propagate
+
+
+def test_tail_keeps_last_lines(tmp_path, logger):
+    build_log = BuildLogHandler(str(tmp_path / 'zfs.log'), tail_lines=3)
+    with BuildLogContext(build_log):
+        logger.debug('Building zfs')
+        build_log.write('line 1\nline 2\nline 3\npartial')
+    assert build_log.tail() == ['line 2', 'line 3', 'partial']
+
+    build_log.close()
+    with open(tmp_path / 'zfs.log') as f:
+        assert f.read() == 'Building zfs\nline 1\nline 2\nline 3\npartial'
+
+
+def test_log_is_appended_to_after_close(tmp_path):
+    build_log = BuildLogHandler(str(tmp_path / 'zfs.log'))
+    build_log.write('build\n')
+    build_log.close()
+    build_log.write('cleanup\n')
+    build_log.close()
+    with open(tmp_path / 'zfs.log') as f:
+        assert f.read() == 'build\ncleanup\n'
+
+
+@pytest.mark.skipif(not shutil.which('zstd'), reason='zstd is not installed')
+def test_compressed_log(tmp_path):
+    build_log = BuildLogHandler(str(tmp_path / 'zfs.log'), compress=True)
+    build_log.write('build\n')
+    build_log.close()
+    build_log.write('cleanup\n')
+    build_log.close()
+    assert build_log.path == str(tmp_path / 'zfs.log.zst')
+    assert subprocess.check_output(['zstd', '-dc', build_log.path]) == b'build\ncleanup\n'
+
+
+def test_command_output_is_written_to_build_log(tmp_path, logger):
+    build_log = BuildLogHandler(str(tmp_path / 'zfs.log'), tail_lines=2)
+    with BuildLogContext(build_log):
+        run(['sh', '-c', 'for i in 1 2 3; do echo "line $i"; done; printf "no newline"'])
+    build_log.close()
+    assert build_log.tail() == ['line 3', 'no newline']
+    with open(tmp_path / 'zfs.log') as f:
+        assert f.read() == 'line 1\nline 2\nline 3\nno newline'
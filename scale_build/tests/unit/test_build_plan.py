@@ -0,0 +1,78 @@
+import contextlib
+import json
+
+from unittest.mock import Mock, patch
+
+from scale_build.plan import get_dot_graph, get_longest_chain, get_rebuild_reasons, show_build_plan, simulate_makespan
+
+
+DEPENDENCIES = {'kernel': [], 'openzfs': ['kernel'], 'zectl': ['openzfs'], 'scst': ['kernel'], 'middleware': []}
+DURATIONS = {'kernel': 100, 'openzfs': 30, 'zectl': 5, 'scst': 50, 'middleware': 60}
+
+
+def test_longest_chain_is_weighted_by_duration(make_packages):
+    chain, duration = get_longest_chain(make_packages(DEPENDENCIES), DURATIONS)
+    assert chain == ['kernel', 'scst']
+    assert duration == 150
+
+
+def test_makespan_follows_scheduler_order(make_packages):
+    packages = make_packages(DEPENDENCIES)
+    assert simulate_makespan(packages, DURATIONS, 1) == sum(DURATIONS.values())
+    # kernel and middleware start together, openzfs and scst once kernel is done and zectl after openzfs
+    assert simulate_makespan(packages, DURATIONS, 2) == 150
+    assert simulate_makespan(packages, DURATIONS, 10) == 150
+
+
+def test_children_of_changed_packages_name_their_parents(make_packages, tmp_path):
+    packages = make_packages(DEPENDENCIES)
+    packages['kernel']._hash_changed_cache = True
+    packages['kernel']._git_state = {'head': 'abc', 'tree': 'def', 'dirty': True}
+    for name in ('openzfs', 'zectl', 'scst'):
+        packages[name]._hash_changed_cache = False
+        packages[name].parent_changed = True
+
+    to_build = {k: v for k, v in packages.items() if k != 'middleware'}
+    with patch('scale_build.packages.package.HASH_DIR', str(tmp_path)):
+        reasons = get_rebuild_reasons(to_build)
+    assert reasons['kernel'] == {'reasons': ['not built before'], 'changed_parents': []}
+    assert reasons['zectl'] == {'reasons': ['parent changed'], 'changed_parents': ['openzfs']}
+    assert get_rebuild_reasons(to_build, ['openzfs'])['openzfs']['reasons'] == ['forced']
+
+
+def test_dot_graph_highlights_longest_chain(make_packages):
+    packages = make_packages(DEPENDENCIES)
+    graph = get_dot_graph(packages, packages, ['kernel', 'scst'])
+    assert '"kernel" -> "scst" [color=red, penwidth=2];' in graph
+    assert '"kernel" -> "openzfs";' in graph
+
+
+def test_plan_does_not_set_up_bootstrap(make_packages, tmp_path):
+    packages = make_packages(DEPENDENCIES)
+    packages['middleware']._hash_changed_cache = True
+    packages['middleware']._git_state = {'head': 'abc', 'tree': 'def', 'dirty': False}
+    bootstrap_dir = Mock(cache_exists=True, **{'check_cache.return_value': 'stale'})
+
+    with contextlib.ExitStack() as stack:
+        for target, value in (
+            ('PackageBootstrapDir', Mock(return_value=bootstrap_dir)),
+            ('LoggingContext', Mock(return_value=contextlib.nullcontext())),
+            ('get_initialized_packages', Mock(return_value=packages)),
+            ('get_to_build_packages', Mock(return_value={'middleware': packages['middleware']})),
+            ('clean_shared_chroot_basedir', Mock()),
+            ('epoch_changed', Mock(return_value=False)),
+            ('load_build_stats', Mock(return_value=[])),
+            ('LOG_DIR', str(tmp_path)),
+            ('PLAN_JSON_PATH', str(tmp_path / 'build_plan.json')),
+            ('PLAN_DOT_PATH', str(tmp_path / 'build_plan.dot')),
+        ):
+            stack.enter_context(patch(f'scale_build.plan.{target}', value))
+        stack.enter_context(patch('scale_build.packages.package.HASH_DIR', str(tmp_path)))
+        show_build_plan()
+
+    bootstrap_dir.setup.assert_not_called()
+    bootstrap_dir.remove_cache.assert_not_called()
+    plan = json.loads((tmp_path / 'build_plan.json').read_text())
+    assert plan['bootstrap'] == 'refreshed'
+    assert [name for name, package in plan['packages'].items() if package['rebuild']] == ['middleware']
+    assert plan['packages']['middleware']['reasons'] == ['not built before']
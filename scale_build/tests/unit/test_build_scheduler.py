@@ -0,0 +1,139 @@
+import threading
+
+import pytest
+
+from scale_build.packages.package import Package
+from scale_build.packages.scheduler import BuildScheduler
+
+
+class CutoffPackage(Package):
+    hash_changed = False
+
+
+def test_children_are_released_when_parent_is_built(make_packages):
+    scheduler = BuildScheduler(make_packages({'kernel': [], 'openzfs': ['kernel'], 'zectl': ['openzfs']}), {})
+    package = scheduler.get()
+    assert package.name == 'kernel'
+    assert not scheduler.ready
+
+    scheduler.mark_built(package)
+    assert scheduler.get().name == 'openzfs'
+    assert scheduler.remaining == 2
+
+
+def test_already_built_dependencies_are_ignored(make_packages):
+    packages = make_packages({'kernel': [], 'openzfs': ['kernel']})
+    scheduler = BuildScheduler({'openzfs': packages['openzfs']}, {'kernel': packages['kernel']})
+    assert scheduler.get().name == 'openzfs'
+
+
+def test_ready_packages_honour_batch_priority(make_packages):
+    scheduler = BuildScheduler(make_packages({'zectl': [], 'kernel': []}, {'kernel': 0}), {})
+    assert [scheduler.get().name, scheduler.get().name] == ['kernel', 'zectl']
+
+
+def test_waiting_thread_is_woken_up_by_finished_parent(make_packages):
+    scheduler = BuildScheduler(make_packages({'kernel': [], 'openzfs': ['kernel']}), {})
+    kernel = scheduler.get()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(scheduler.get()))
+    thread.start()
+    scheduler.mark_built(kernel)
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert result[0].name == 'openzfs'
+
+
+def test_no_packages_are_handed_out_after_failure(make_packages):
+    scheduler = BuildScheduler(make_packages({'kernel': [], 'zectl': [], 'openzfs': ['kernel']}), {})
+    kernel = scheduler.get()
+    scheduler.mark_failed(kernel, Exception('failed'))
+    assert scheduler.get() is None
+    assert list(scheduler.failed) == ['kernel']
+
+
+def test_requeued_packages_are_handed_out_again(make_packages):
+    scheduler = BuildScheduler(make_packages({'kernel': [], 'openzfs': ['kernel']}), {})
+    kernel = scheduler.get()
+    scheduler.requeue(kernel)
+    assert not scheduler.finished
+    assert scheduler.get() is kernel
+    scheduler.mark_built(kernel)
+    assert scheduler.get().name == 'openzfs'
+
+
+def test_independent_packages_are_built_after_failure_with_keep_going(make_packages):
+    scheduler = BuildScheduler(make_packages(
+        {'kernel': [], 'openzfs': ['kernel'], 'zectl': ['openzfs'], 'scst': ['kernel'], 'middleware': []},
+        {'kernel': 0},
+    ), {}, keep_going=True)
+    scheduler.mark_failed(scheduler.get(), Exception('failed'))
+    assert scheduler.failed['kernel']['skipped'] == ['openzfs', 'scst', 'zectl']
+    assert not scheduler.finished
+
+    middleware = scheduler.get()
+    assert middleware.name == 'middleware'
+    scheduler.mark_built(middleware)
+    assert scheduler.get() is None
+    assert scheduler.finished
+
+
+def test_dependents_shared_with_building_parent_are_dropped_with_keep_going(make_packages):
+    scheduler = BuildScheduler(make_packages(
+        {'kernel': [], 'kernel-dbg': [], 'scst': ['kernel', 'kernel-dbg']}, {'kernel': 0},
+    ), {}, keep_going=True)
+    kernel, kernel_dbg = scheduler.get(), scheduler.get()
+    scheduler.mark_failed(kernel, Exception('failed'))
+    assert scheduler.failed['kernel']['skipped'] == ['scst']
+
+    scheduler.mark_built(kernel_dbg)
+    assert scheduler.get() is None
+    assert scheduler.finished
+
+
+@pytest.fixture
+def cutoff_packages(make_packages):
+    def get_cutoff_packages(dependencies, changed_sources):
+        packages = make_packages(dependencies, package_class=CutoffPackage)
+        for name, package in packages.items():
+            package.hash_changed = name in changed_sources
+        return packages
+
+    return get_cutoff_packages
+
+
+def test_children_are_skipped_when_parent_output_did_not_change(cutoff_packages):
+    packages = cutoff_packages({'kernel': [], 'openzfs': ['kernel'], 'zectl': ['openzfs']}, {'kernel'})
+    scheduler = BuildScheduler(packages, {}, early_cutoff=True)
+    scheduler.mark_built(scheduler.get(), output_changed=False)
+    assert scheduler.get() is None
+    assert list(scheduler.skipped) == ['openzfs', 'zectl']
+    assert scheduler.finished
+
+
+def test_children_are_built_when_parent_output_changed(cutoff_packages):
+    packages = cutoff_packages({'kernel': [], 'openzfs': ['kernel'], 'zectl': ['openzfs']}, {'kernel'})
+    scheduler = BuildScheduler(packages, {}, early_cutoff=True)
+    scheduler.mark_built(scheduler.get(), output_changed=True)
+    openzfs = scheduler.get()
+    assert openzfs.name == 'openzfs'
+    scheduler.mark_built(openzfs, output_changed=False)
+    assert scheduler.get() is None
+    assert list(scheduler.skipped) == ['zectl']
+
+
+def test_changed_sources_are_never_skipped(cutoff_packages):
+    packages = cutoff_packages({'kernel': [], 'openzfs': ['kernel']}, {'kernel', 'openzfs'})
+    scheduler = BuildScheduler(packages, {}, early_cutoff=True)
+    scheduler.mark_built(scheduler.get(), output_changed=False)
+    assert scheduler.get().name == 'openzfs'
+
+
+def test_restored_parent_with_changed_output_is_honoured(cutoff_packages):
+    packages = cutoff_packages({'kernel': [], 'openzfs': ['kernel']}, set())
+    scheduler = BuildScheduler({'openzfs': packages['openzfs']}, {'kernel': packages['kernel']}, True, {'kernel'})
+    assert scheduler.get().name == 'openzfs'
+
+    scheduler = BuildScheduler({'openzfs': packages['openzfs']}, {'kernel': packages['kernel']}, True, set())
+    assert scheduler.get() is None
+    assert list(scheduler.skipped) == ['openzfs']
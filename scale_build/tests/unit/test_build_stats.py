@@ -0,0 +1,44 @@
+from scale_build.packages.package import Package
+from scale_build.stats import BuildStats, get_regressions, load_build_stats
+
+
+def get_record(build_time, phases, status='built'):
+    return {
+        'build_time': build_time,
+        'packages': {'openzfs': {'status': status, 'phases': phases}},
+        'lock_waits': {},
+    }
+
+
+def test_stats_are_saved_per_run(tmp_path):
+    package = Package('openzfs', 'master', 'https://github.com/truenas/zfs')
+    with package.timings.phase('build'):
+        pass
+    package.timings.lock_waits['apt'] += 2
+
+    stats = BuildStats(str(tmp_path))
+    stats.add_package(package, 'built', 10)
+    stats.add_lock_wait('scheduler', 3)
+    stats.save()
+
+    record = load_build_stats(str(tmp_path))[0]
+    assert record['packages']['openzfs']['status'] == 'built'
+    assert 'build' in record['packages']['openzfs']['phases']
+    assert record['lock_waits'] == {'apt': 2, 'scheduler': 3}
+
+
+def test_regressions_are_compared_against_median_of_previous_runs():
+    records = [
+        get_record(1, {'build': 100, 'apt_update': 5}),
+        get_record(2, {'build': 400, 'apt_update': 5}),
+        get_record(3, {'build': 110, 'apt_update': 5}),
+        get_record(4, {'build': 150, 'apt_update': 12}),
+    ]
+    assert get_regressions(records, 5, 0.2) == [('openzfs', 'build', 110, 150)]
+    assert get_regressions(records, 1, 0.2) == [('openzfs', 'build', 110, 150)]
+    assert get_regressions(records, 5, 0.5) == []
+
+
+def test_failed_builds_are_not_used_for_regressions():
+    records = [get_record(1, {'build': 10}, 'failed'), get_record(2, {'build': 300})]
+    assert get_regressions(records, 5, 0.2) == []
@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import pytest
+
+from scale_build.bootstrap.cache_backends import CACHE_BACKENDS, get_cache_backend
+from scale_build.exceptions import CallError
+
+
+def create_chroot(path):
+    os.makedirs(os.path.join(path, 'etc'))
+    os.makedirs(os.path.join(path, 'usr/bin'))
+    for name, contents in (('etc/group', 'root:x:0:\n'), ('etc/passwd', 'root:x:0:0::/root:/bin/sh\n')):
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(contents)
+    with open(os.path.join(path, 'usr/bin/true'), 'w') as f:
+        f.write('#!/bin/sh\n')
+    os.chmod(os.path.join(path, 'usr/bin/true'), 0o755)
+    os.symlink('usr/bin', os.path.join(path, 'bin'))
+
+
+REQUIRED_COMMANDS = {'tar-zstd': ('tar', 'zstd'), 'directory': ('cp',)}
+
+
+@pytest.mark.parametrize('name', CACHE_BACKENDS)
+def test_cache_round_trip(tmp_path, name):
+    if missing := [c for c in REQUIRED_COMMANDS.get(name, ('mksquashfs', 'unsquashfs')) if not shutil.which(c)]:
+        pytest.skip(f'{", ".join(missing)} not installed')
+
+    backend = get_cache_backend(name)
+    create_chroot(str(tmp_path / 'chroot'))
+    cache = str(tmp_path / f'cache{backend.suffix}')
+    backend.save(str(tmp_path / 'chroot'), cache)
+
+    backend.restore(cache, str(tmp_path / 'restored'))
+    assert os.readlink(tmp_path / 'restored' / 'bin') == 'usr/bin'
+    assert os.stat(tmp_path / 'restored' / 'usr/bin/true').st_mode & 0o777 == 0o755
+
+    backend.restore(cache, str(tmp_path / 'reference'), ['etc/group', 'etc/passwd'])
+    assert sorted(os.listdir(tmp_path / 'reference')) == ['etc']
+    assert sorted(os.listdir(tmp_path / 'reference' / 'etc')) == ['group', 'passwd']
+
+    backend.remove(cache)
+    assert not os.path.lexists(cache)
+
+
+def test_unknown_backend():
+    with pytest.raises(CallError, match='squashfs-zstd'):
+        get_cache_backend('ext4')
@@ -0,0 +1,41 @@
+import os
+
+from scale_build.packages.ccache import configure_ccache_dir, parse_ccache_print_stats, parse_ccache_stats_log
+
+
+STATS_LOG = '''# /dpkg-src/lib/a.c
+direct_cache_hit
+# /dpkg-src/lib/b.c
+cache_miss
+direct_cache_miss
+preprocessed_cache_miss
+# /dpkg-src/lib/c.c
+preprocessed_cache_hit
+direct_cache_miss
+# /dpkg-src/conftest.c
+called_for_link
+'''
+
+
+def test_stats_log_is_summarized():
+    stats = parse_ccache_stats_log(STATS_LOG)
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.667
+    assert stats['counters']['called_for_link'] == 1
+
+
+def test_empty_stats_log_has_no_hit_rate():
+    assert parse_ccache_stats_log('') == {'hits': 0, 'misses': 0, 'hit_rate': None, 'counters': {}}
+
+
+def test_print_stats_are_parsed():
+    assert parse_ccache_print_stats('stats_updated_timestamp\t1700000000\ncache_size_kibibyte\t2048\n') == {
+        'stats_updated_timestamp': 1700000000, 'cache_size_kibibyte': 2048,
+    }
+
+
+def test_ccache_dir_is_configured(tmp_path):
+    configure_ccache_dir(str(tmp_path), '5G', 3)
+    with open(os.path.join(tmp_path, 'ccache.conf')) as f:
+        assert f.read() == 'max_size = 5G\ncompression = true\ncompression_level = 3\n'
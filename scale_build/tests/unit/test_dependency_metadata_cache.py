@@ -0,0 +1,43 @@
+import json
+import subprocess
+
+from unittest.mock import patch
+
+from scale_build.packages.package import Package
+
+
+PARSED_CONTROL = {
+    'source_package': {'name': 'zectl', 'build_depends': 'debhelper-compat (= 13), libzfs-dev'},
+    'binary_packages': [{'name': 'zectl', 'depends': 'libzfs6, ${misc:Depends}'}],
+}
+
+
+class MetadataPackage(Package):
+    debian_control_file_path = None
+
+
+def get_package(tmp_path, control):
+    with open(tmp_path / 'control', 'w') as f:
+        f.write(control)
+    package = MetadataPackage('zectl', 'master', 'https://github.com/truenas/zectl')
+    package.debian_control_file_path = str(tmp_path / 'control')
+    return package
+
+
+def parse_deps(cmd, **kwargs):
+    return subprocess.CompletedProcess(cmd, 0, stdout=json.dumps(PARSED_CONTROL))
+
+
+def test_parsed_control_file_is_cached(tmp_path):
+    with (
+        patch('scale_build.packages.metadata_cache.PACKAGE_METADATA_CACHE_DIR', str(tmp_path / 'cache')),
+        patch('scale_build.packages.package.run', side_effect=parse_deps) as run
+    ):
+        assert [p.name for p in get_package(tmp_path, 'Source: zectl').binary_packages] == ['zectl']
+        package = get_package(tmp_path, 'Source: zectl')
+        assert package.binary_packages[0].install_dependencies == {'libzfs6'}
+        assert package.build_depends == {'debhelper-compat', 'libzfs-dev'}
+        assert run.call_count == 1
+
+        get_package(tmp_path, 'Source: zectl\nBuild-Depends: libzfs-dev').binary_packages
+        assert run.call_count == 2
@@ -0,0 +1,173 @@
+import contextlib
+import os
+import shutil
+import stat
+
+from unittest.mock import patch
+
+from scale_build.extensions import (
+    DevToolsExtension, Extension, NvidiaExtension, build_extensions, get_installed_packages, get_package_key_versions,
+)
+
+
+def write(path, data='', mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(data)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+
+def create_overlay(tmp_path):
+    """
+    Lays out what an extension overlay looks like after installing something, `chroot` stands in for the merged
+    overlay mount.
+    """
+    base, extension = str(tmp_path / 'base'), Extension(str(tmp_path / 'base'), str(tmp_path / 'extension'))
+    for path in ('usr/bin/ls', 'usr/bin/dpkg', 'usr/lib/libc.so', 'usr/src/linux/Makefile', 'etc/passwd'):
+        write(os.path.join(base, path), path, mtime=1000000000)
+    os.makedirs(os.path.join(base, 'usr/lib/nvidia'))
+
+    upper = extension.upper
+    # Installed files
+    write(os.path.join(upper, 'usr/bin/nvidia-smi'), 'nvidia-smi')
+    write(os.path.join(upper, 'usr/lib/nvidia/libcuda.so'), 'libcuda')
+    os.symlink('nvidia/libcuda.so', os.path.join(upper, 'usr/lib/libcuda.so'))
+    os.symlink('nvidia', os.path.join(upper, 'usr/lib/nvidia-current'))
+    write(os.path.join(upper, 'usr/src/nvidia/Makefile'), 'nvidia module')
+    write(os.path.join(upper, 'etc/apt/sources.list.d/nvidia.list'), 'deb nvidia')
+    # Modified file
+    write(os.path.join(upper, 'usr/bin/dpkg'), 'patched dpkg binary', mtime=1000000000)
+    # Copied up without changes
+    shutil.copy2(os.path.join(base, 'usr/lib/libc.so'), os.path.join(upper, 'usr/lib/libc.so'))
+    shutil.copytree(base, extension.chroot, symlinks=True)
+    shutil.copytree(upper, extension.chroot, symlinks=True, dirs_exist_ok=True)
+    if os.geteuid() == 0:
+        # Whiteout of a removed file, creating it needs root
+        os.mknod(os.path.join(upper, 'usr/bin/ls'), 0o600 | stat.S_IFCHR, os.makedev(0, 0))
+        os.unlink(os.path.join(extension.chroot, 'usr/bin/ls'))
+    return extension
+
+
+def test_sysext_files_come_from_upper_directory(tmp_path):
+    extension = create_overlay(tmp_path)
+    assert extension.get_sysext_files() == [
+        'usr/bin/dpkg', 'usr/bin/nvidia-smi', 'usr/lib/libcuda.so', 'usr/lib/nvidia/libcuda.so',
+    ]
+
+
+def test_extension_tree_contains_only_sysext_files(tmp_path):
+    extension = create_overlay(tmp_path)
+    os.chmod(os.path.join(extension.chroot, 'usr/lib/nvidia'), 0o750)
+    with patch('scale_build.extensions.run') as run:
+        extension.build_extension('nvidia', str(tmp_path / 'nvidia.raw'))
+
+    sysext = os.path.join(extension.path, 'sysext')
+    run.assert_called_once_with(['mksquashfs', sysext, str(tmp_path / 'nvidia.raw'), '-comp', 'xz'])
+    assert sorted(
+        os.path.relpath(os.path.join(root, f), sysext) for root, dirs, files in os.walk(sysext) for f in files
+    ) == [
+        'usr/bin/dpkg', 'usr/bin/nvidia-smi', 'usr/lib/extension-release.d/extension-release.nvidia',
+        'usr/lib/libcuda.so', 'usr/lib/nvidia/libcuda.so',
+    ]
+    assert os.readlink(os.path.join(sysext, 'usr/lib/libcuda.so')) == 'nvidia/libcuda.so'
+    assert os.stat(os.path.join(sysext, 'usr/lib/nvidia')).st_mode & 0o777 == 0o750
+    assert set(extension.timings.phases) == {'collect', 'squash'}
+
+
+def test_installed_packages_are_read_from_dpkg_status(tmp_path):
+    write(str(tmp_path / 'var/lib/dpkg/status'), '\n'.join([
+        'Package: dpkg', 'Status: install ok installed', 'Version: 1.21.22',
+        'Description: Debian package management system', ' Status: not a field', '',
+        'Package: gcc', 'Status: deinstall ok config-files', 'Version: 4:12.2.0-3', '',
+        'Package: make', 'Status: install reinstreq half-installed', 'Version: 4.3-4.1', '',
+    ]))
+    assert get_installed_packages(str(tmp_path)) == {'dpkg': '1.21.22'}
+
+
+def dpkg_status(packages):
+    return '\n'.join(
+        f'Package: {name}\nStatus: install ok installed\nVersion: {version}\n' for name, version in packages.items()
+    )
+
+
+def test_locally_built_packages_are_keyed_on_their_contents(tmp_path):
+    write(str(tmp_path / 'var/lib/dpkg/status'), dpkg_status({
+        'dpkg': '1.21.22', 'truenas': '26.04.0-MASTER-20261017-101010', 'zfs': '2.3.0-1~20261017', 'libzfs': '2.3.0-1',
+    }))
+    write(str(tmp_path / 'pkghashes/openzfs.pkglist'), 'zfs_2.3.0-1~20261017_amd64.deb\nlibzfs_2.3.0-1_amd64.deb')
+    write(str(tmp_path / 'pkghashes/openzfs.digest'), 'abcd')
+    write(str(tmp_path / 'pkghashes/truenas.pkglist'), 'truenas_26.04.0-MASTER-20261017-101010_all.deb')
+    with patch('scale_build.extensions.HASH_DIR', str(tmp_path / 'pkghashes')):
+        assert get_package_key_versions(str(tmp_path)) == {
+            'dpkg': '1.21.22', 'truenas': None, 'zfs': 'abcd', 'libzfs': 'abcd',
+        }
+
+
+@patch('scale_build.extensions.get_all_repo_hash', lambda: 'repos')
+@patch('scale_build.extensions.get_kernel_version', lambda chroot: '6.12.15-production+truenas')
+@patch('scale_build.extensions.get_manifest', lambda: {'extensions': {'nvidia': {'current': '570.124.04'}}})
+@patch('scale_build.extensions.requests.get')
+def test_nvidia_key_changes_with_rootfs_packages(get, tmp_path):
+    get.return_value.content = b'Release'
+    status = {'dpkg': '1.21.22', 'libvulkan1': '1.3.239.0-1', 'libx11-6': '2:1.8.4-2'}
+    write(str(tmp_path / 'base/var/lib/dpkg/status'), dpkg_status(status))
+    extension = NvidiaExtension(str(tmp_path / 'base'), str(tmp_path / 'extension'))
+    with patch('scale_build.extensions.HASH_DIR', str(tmp_path / 'pkghashes')):
+        key = extension.cache_key('nvidia')
+        assert extension.cache_key('nvidia') == key
+
+        # The extension would have to install libx11-6 itself if the rootfs does not provide it anymore
+        status.pop('libx11-6')
+        write(str(tmp_path / 'base/var/lib/dpkg/status'), dpkg_status(status))
+        assert extension.cache_key('nvidia') != key
+
+
+@patch('scale_build.extensions.get_all_repo_hash', lambda: 'repos')
+@patch('scale_build.extensions.HASH_DIR', '/nonexistent')
+def test_extension_is_reused_when_its_inputs_did_not_change(tmp_path):
+    write(str(tmp_path / 'base/var/lib/dpkg/status'), 'Package: dpkg\nStatus: install ok installed\nVersion: 1.21\n')
+
+    def build_uncached(name, dst_path):
+        write(dst_path, f'{name} image')
+
+    extension = Extension(str(tmp_path / 'base'), str(tmp_path / 'extension'))
+    with patch('scale_build.extensions.EXTENSIONS_CACHE_DIR', str(tmp_path / 'cache')):
+        with patch.object(extension, 'build_uncached', side_effect=build_uncached) as build:
+            extension.build('dev-tools', str(tmp_path / 'dev-tools.raw'))
+            os.unlink(tmp_path / 'dev-tools.raw')
+            extension.build('dev-tools', str(tmp_path / 'dev-tools.raw'))
+            assert build.call_count == 1
+            with open(tmp_path / 'dev-tools.raw') as f:
+                assert f.read() == 'dev-tools image'
+
+            status = 'Package: dpkg\nStatus: install ok installed\nVersion: 1.22\n'
+            write(str(tmp_path / 'base/var/lib/dpkg/status'), status)
+            extension.build('dev-tools', str(tmp_path / 'dev-tools.raw'))
+            assert build.call_count == 2
+
+
+def test_images_are_moved_into_rootfs_after_all_extensions_are_built(tmp_path):
+    dst_dir = tmp_path / 'rootfs/usr/share/truenas/sysext-extensions'
+    os.makedirs(dst_dir)
+    seen = []
+
+    def build(self, name, dst_path):
+        # The rootfs is the lower layer of the overlays of all extensions being built
+        seen.append(os.listdir(dst_dir))
+        assert not dst_path.startswith(str(tmp_path / 'rootfs'))
+        write(dst_path, name)
+
+    with contextlib.ExitStack() as stack:
+        for target, value in (
+            ('LOG_DIR', str(tmp_path)), ('TMP_DIR', str(tmp_path / 'tmp')), ('TMPFS', str(tmp_path / 'tmpfs')),
+            ('LoggingContext', lambda *args: contextlib.nullcontext()),
+        ):
+            stack.enter_context(patch(f'scale_build.extensions.{target}', value))
+        for klass in (DevToolsExtension, NvidiaExtension):
+            stack.enter_context(patch.object(klass, 'build', build))
+        build_extensions(str(tmp_path / 'rootfs'), str(dst_dir))
+
+    assert seen == [[], []]
+    assert sorted(os.listdir(dst_dir)) == ['dev-tools.raw', 'nvidia.raw']
+    assert not os.path.exists(tmp_path / 'tmp/extensions')
@@ -0,0 +1,35 @@
+import subprocess
+
+from scale_build.utils.git_utils import snapshot_git_state
+
+
+def init_repo(path):
+    path.mkdir()
+    for cmd in (
+        ['init', '-q'],
+        ['-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '--allow-empty', '-m', 'init'],
+    ):
+        subprocess.run(['git', '-C', str(path)] + cmd, check=True)
+    return str(path)
+
+
+def test_snapshot_reports_head_and_dirty_state(tmp_path):
+    clean = init_repo(tmp_path / 'clean')
+    dirty = init_repo(tmp_path / 'dirty')
+    with open(tmp_path / 'dirty/file', 'w') as f:
+        f.write('committed')
+    subprocess.run(['git', '-C', dirty, 'add', 'file'], check=True)
+    subprocess.run(
+        ['git', '-C', dirty, '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'file'],
+        check=True,
+    )
+    with open(tmp_path / 'dirty/file', 'w') as f:
+        f.write('modified')
+
+    snapshot = snapshot_git_state([clean, dirty, clean])
+    assert sorted(snapshot) == sorted([clean, dirty])
+    assert snapshot[clean]['dirty'] is False
+    assert snapshot[dirty]['dirty'] is True
+    assert snapshot[clean]['head'] == subprocess.run(
+        ['git', '-C', clean, 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+    ).stdout.strip()
@@ -0,0 +1,58 @@
+import os
+
+from scale_build.packages.jobserver import JobServer
+from scale_build.packages.package import Package
+
+
+def pool_size(jobserver):
+    tokens = os.read(jobserver.fd, 1024)
+    os.write(jobserver.fd, tokens)
+    return len(tokens)
+
+
+def test_grant_is_fair_share_of_active_builds(tmp_path):
+    jobserver = JobServer(8, str(tmp_path / 'jobserver'))
+    jobserver.start()
+    try:
+        with jobserver.building(), jobserver.building():
+            with jobserver.grant() as jobs:
+                assert jobs == 4
+                assert pool_size(jobserver) == 4
+        assert pool_size(jobserver) == 7
+    finally:
+        jobserver.stop()
+    assert not os.path.exists(tmp_path / 'jobserver')
+
+
+def test_only_build_left_is_granted_all_tokens(tmp_path):
+    jobserver = JobServer(8, str(tmp_path / 'jobserver'))
+    jobserver.start()
+    try:
+        with jobserver.building():
+            with jobserver.grant() as jobs:
+                assert jobs == 8
+            with jobserver.grant(limit=2) as jobs:
+                assert jobs == 2
+    finally:
+        jobserver.stop()
+
+
+def test_grant_does_not_wait_forever_for_tokens(tmp_path):
+    jobserver = JobServer(4, str(tmp_path / 'jobserver'))
+    jobserver.start()
+    try:
+        with jobserver.building(), jobserver.grant() as jobs, jobserver.grant(timeout=0.1) as other_jobs:
+            assert (jobs, other_jobs) == (4, 1)
+    finally:
+        jobserver.stop()
+
+
+def test_only_make_jobs_flags_join_jobserver(tmp_path):
+    package = Package('scst', 'master', 'https://github.com/truenas/scst')
+    package.jobserver = JobServer(8, str(tmp_path / 'jobserver'))
+    env = package._get_make_env()
+    assert 'MAKEFLAGS' not in env
+    assert env['MAKE_JOBS_FLAGS'] == '--jobserver-auth=fifo:/jobserver/fifo'
+
+    package.jobs = 2
+    assert package._get_make_env() == {'MAKE_JOBS_FLAGS': '-j2'}
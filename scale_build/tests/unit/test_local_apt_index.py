@@ -0,0 +1,80 @@
+import gzip
+import os
+import subprocess
+
+from unittest.mock import patch
+
+from scale_build.packages.apt_index import LocalAptIndex
+
+
+def dpkg_deb_field(cmd, **kwargs):
+    name = os.path.basename(cmd[-1]).split('_')[0]
+    return subprocess.CompletedProcess(cmd, 0, stdout=f'Package: {name}\nVersion: 1.0\nArchitecture: amd64\n')
+
+
+def add_deb(path, filename, content=b'deb'):
+    with open(os.path.join(path, filename), 'wb') as f:
+        f.write(content)
+
+
+def read_index(path):
+    with open(os.path.join(path, 'Packages'), 'r') as f:
+        packages = f.read()
+    with gzip.open(os.path.join(path, 'Packages.gz'), 'rt') as f:
+        assert f.read() == packages
+    return packages
+
+
+def test_index_only_inspects_new_packages(tmp_path):
+    repo = tmp_path / 'pkgdir'
+    repo.mkdir()
+    index = LocalAptIndex(str(repo), str(tmp_path / 'index.json'))
+    with patch('scale_build.packages.apt_index.run', side_effect=dpkg_deb_field) as run:
+        add_deb(repo, 'openzfs_1.0_amd64.deb')
+        assert index.update() == ({'openzfs_1.0_amd64.deb'}, set())
+
+        add_deb(repo, 'zectl_1.0_amd64.deb')
+        assert index.update() == ({'zectl_1.0_amd64.deb'}, set())
+        assert run.call_count == 2
+
+    packages = read_index(repo)
+    assert 'Package: openzfs\n' in packages
+    assert 'Filename: ./zectl_1.0_amd64.deb\nSize: 3\n' in packages
+
+
+def test_index_drops_removed_packages(tmp_path):
+    repo = tmp_path / 'pkgdir'
+    repo.mkdir()
+    with patch('scale_build.packages.apt_index.run', side_effect=dpkg_deb_field):
+        add_deb(repo, 'openzfs_1.0_amd64.deb')
+        add_deb(repo, 'zectl_1.0_amd64.deb')
+        LocalAptIndex(str(repo), str(tmp_path / 'index.json')).update()
+
+        os.unlink(repo / 'zectl_1.0_amd64.deb')
+        assert LocalAptIndex(str(repo), str(tmp_path / 'index.json')).update() == (set(), {'zectl_1.0_amd64.deb'})
+
+    assert 'zectl' not in read_index(repo)
+
+
+def test_cached_stanzas_are_reused_by_update(tmp_path):
+    repo = tmp_path / 'pkgdir'
+    repo.mkdir()
+    index = LocalAptIndex(str(repo), str(tmp_path / 'index.json'))
+    add_deb(repo, 'openzfs_1.0_amd64.deb')
+    with patch('scale_build.packages.apt_index.run', side_effect=dpkg_deb_field) as run:
+        index.cache_stanzas(['openzfs_1.0_amd64.deb'])
+        index.update()
+        assert run.call_count == 1
+
+
+def test_rebuilt_package_with_same_name_is_reindexed(tmp_path):
+    repo = tmp_path / 'pkgdir'
+    repo.mkdir()
+    index = LocalAptIndex(str(repo), str(tmp_path / 'index.json'))
+    with patch('scale_build.packages.apt_index.run', side_effect=dpkg_deb_field):
+        add_deb(repo, 'openzfs_1.0_amd64.deb')
+        index.update()
+        add_deb(repo, 'openzfs_1.0_amd64.deb', b'rebuilt')
+        assert index.update() == ({'openzfs_1.0_amd64.deb'}, set())
+
+    assert 'Size: 7\n' in read_index(repo)
@@ -0,0 +1,36 @@
+import gzip
+import os
+import subprocess
+
+from scale_build.packages.digest import get_packages_digest
+
+
+def build_deb(path, version, content, changelog):
+    root = path / f'root_{version}_{content}'
+    os.makedirs(root / 'DEBIAN')
+    os.makedirs(root / 'usr/share/doc/zectl')
+    with open(root / 'DEBIAN/control', 'w') as f:
+        f.write(
+            f'Package: zectl\nVersion: {version}\nArchitecture: all\nMaintainer: TrueNAS\n'
+            f'Depends: libzectl (= {version})\nDescription: zectl\n'
+        )
+    with open(root / 'usr/share/doc/zectl/README', 'w') as f:
+        f.write(content)
+    with gzip.open(root / 'usr/share/doc/zectl/changelog.Debian.gz', 'wt') as f:
+        f.write(changelog)
+
+    deb = str(path / f'zectl_{version}_{content}.deb')
+    subprocess.run(['dpkg-deb', '--root-owner-group', '-b', str(root), deb], check=True, capture_output=True)
+    return deb
+
+
+def test_digest_ignores_version_and_changelog(tmp_path):
+    first = build_deb(tmp_path, '1.0~20260101', 'readme', 'first build')
+    second = build_deb(tmp_path, '1.0~20260102', 'readme', 'second build')
+    assert get_packages_digest([first]) == get_packages_digest([second])
+
+
+def test_digest_changes_with_content(tmp_path):
+    first = build_deb(tmp_path, '1.0~20260101', 'readme', 'first build')
+    second = build_deb(tmp_path, '1.0~20260102', 'changed readme', 'second build')
+    assert get_packages_digest([first]) != get_packages_digest([second])
@@ -0,0 +1,114 @@
+import functools
+import http.server
+import os
+import subprocess
+import threading
+
+import pytest
+
+from scale_build.packages.package import Package
+from scale_build.packages.store import HTTPPackageStore, LocalPackageStore, get_store_keys
+from scale_build.utils.git_utils import retrieve_git_state
+
+
+class StorePackage(Package):
+    source_dirty = False
+    source_tree_hash = 'tree'
+
+
+def get_packages(dependencies):
+    packages = {}
+    for name, deps in dependencies.items():
+        packages[name] = StorePackage(name, 'master', f'https://github.com/truenas/{name}')
+        packages[name]._build_time_dependencies = set(deps)
+    return packages
+
+
+@pytest.fixture
+def debs(tmp_path):
+    paths = []
+    for name in ('openzfs_1.0_amd64.deb', 'openzfs-dbg_1.0_amd64.deb'):
+        with open(tmp_path / name, 'w') as f:
+            f.write(name)
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def test_local_store_round_trip(tmp_path, debs):
+    store = LocalPackageStore(str(tmp_path / 'store'))
+    destination = tmp_path / 'pkgdir'
+    destination.mkdir()
+    assert store.fetch('ab12', str(destination)) is None
+
+    store.publish('ab12', 'openzfs', debs)
+    assert store.fetch('ab12', str(destination)) == ['openzfs_1.0_amd64.deb', 'openzfs-dbg_1.0_amd64.deb']
+    assert (destination / 'openzfs_1.0_amd64.deb').read_text() == 'openzfs_1.0_amd64.deb'
+
+
+def test_read_only_store_is_not_published_to(tmp_path, debs):
+    LocalPackageStore(str(tmp_path / 'store'), read_only=True).publish('ab12', 'openzfs', debs)
+    assert not os.path.exists(tmp_path / 'store')
+
+
+def test_http_store_serves_local_store(tmp_path, debs):
+    LocalPackageStore(str(tmp_path / 'store')).publish('ab12', 'openzfs', debs)
+    server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(tmp_path / 'store'))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        store = HTTPPackageStore(f'http://127.0.0.1:{server.server_address[1]}')
+        destination = tmp_path / 'pkgdir'
+        destination.mkdir()
+        assert store.fetch('cd34', str(destination)) is None
+        assert len(store.fetch('ab12', str(destination))) == 2
+        assert (destination / 'openzfs-dbg_1.0_amd64.deb').read_text() == 'openzfs-dbg_1.0_amd64.deb'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_store_keys_change_with_dependencies():
+    packages = get_packages({'kernel': [], 'openzfs': ['kernel'], 'zectl': []})
+    keys = get_store_keys(packages)
+    assert all(keys.values())
+
+    packages = get_packages({'kernel': [], 'openzfs': ['kernel'], 'zectl': []})
+    packages['kernel'].source_tree_hash = 'changed'
+    changed_keys = get_store_keys(packages)
+    assert changed_keys['kernel'] != keys['kernel']
+    assert changed_keys['openzfs'] != keys['openzfs']
+    assert changed_keys['zectl'] == keys['zectl']
+
+
+def test_dirty_packages_and_their_children_have_no_key():
+    packages = get_packages({'kernel': [], 'openzfs': ['kernel'], 'truenas': []})
+    packages['kernel'].source_dirty = True
+    assert get_store_keys(packages) == {'kernel': None, 'openzfs': None, 'truenas': None}
+
+
+def git(path, *args):
+    subprocess.run(
+        ['git', '-C', str(path), '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args), check=True
+    )
+
+
+@pytest.mark.parametrize('change', ['staged', 'untracked'])
+def test_packages_with_staged_or_untracked_changes_have_no_key(tmp_path, change):
+    git(tmp_path, 'init', '-q')
+    (tmp_path / 'file').write_text('committed')
+    git(tmp_path, 'add', 'file')
+    git(tmp_path, 'commit', '-q', '-m', 'file')
+
+    package = Package('openzfs', 'master', 'https://github.com/truenas/zfs')
+    package._build_time_dependencies = set()
+    package.git_state = retrieve_git_state(str(tmp_path))
+    assert get_store_keys({'openzfs': package})['openzfs'] is not None
+
+    if change == 'staged':
+        (tmp_path / 'file').write_text('modified')
+        git(tmp_path, 'add', 'file')
+    else:
+        (tmp_path / 'new_file').write_text('untracked')
+    package.git_state = retrieve_git_state(str(tmp_path))
+    assert get_store_keys({'openzfs': package})['openzfs'] is None
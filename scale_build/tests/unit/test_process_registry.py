@@ -0,0 +1,38 @@
+import threading
+import time
+
+import pytest
+
+from scale_build.exceptions import CallError
+from scale_build.utils.run import ProcessRegistry, run
+
+
+def test_terminate_kills_process_tree():
+    registry = ProcessRegistry()
+    errors = []
+
+    def build():
+        try:
+            run('sh -c "sleep 60; true" && true', shell=True, registry=registry)
+        except CallError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=build)
+    start = time.monotonic()
+    thread.start()
+    while not registry.processes:
+        time.sleep(0.05)
+    registry.terminate()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 10
+    assert errors
+    assert not registry.processes
+
+
+def test_processes_started_after_terminate_are_killed():
+    registry = ProcessRegistry()
+    registry.terminate()
+    with pytest.raises(CallError):
+        run(['sleep', '60'], registry=registry)
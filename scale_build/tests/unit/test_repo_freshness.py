@@ -0,0 +1,77 @@
+import http.server
+import threading
+
+import pytest
+import requests
+
+from scale_build.bootstrap.hash import RepoFreshnessChecker
+
+
+class MirrorHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        mirror = self.server.mirror
+        mirror['requests'].append(self.path)
+        release = mirror['releases'].get(self.path)
+        if release is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        etag = f'"{hash(release)}"'
+        if self.headers.get('If-None-Match') == etag:
+            mirror['not_modified'].append(self.path)
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(release)))
+        self.end_headers()
+        self.wfile.write(release)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mirror():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), MirrorHandler)
+    server.mirror = {
+        'url': f'http://127.0.0.1:{server.server_address[1]}/',
+        'releases': {
+            '/debian/dists/bookworm/Release': b'Suite: bookworm',
+            '/docker/dists/bookworm/Release': b'Suite: docker',
+        },
+        'requests': [],
+        'not_modified': [],
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.mirror
+    server.shutdown()
+    server.server_close()
+
+
+def test_hashes_are_memoized_and_revalidated(mirror, tmp_path):
+    repos = [(f'{mirror["url"]}debian/', 'bookworm'), (f'{mirror["url"]}docker/', 'bookworm')]
+    checker = RepoFreshnessChecker(str(tmp_path))
+    hashes = checker.get_repo_hashes(repos)
+    assert len(set(hashes)) == 2
+    assert checker.get_repo_hashes(repos) == hashes
+    assert len(mirror['requests']) == 2
+
+    # A new process revalidates with the stored ETag
+    assert RepoFreshnessChecker(str(tmp_path)).get_repo_hashes(repos) == hashes
+    assert len(mirror['not_modified']) == 2
+
+    mirror['releases']['/docker/dists/bookworm/Release'] = b'Suite: docker\nDate: later'
+    changed = RepoFreshnessChecker(str(tmp_path)).get_repo_hashes(repos)
+    assert changed[0] == hashes[0]
+    assert changed[1] != hashes[1]
+
+
+def test_missing_release_raises(mirror, tmp_path):
+    with pytest.raises(requests.HTTPError):
+        RepoFreshnessChecker(str(tmp_path)).get_repo_hashes([(f'{mirror["url"]}missing/', 'bookworm')])
@@ -0,0 +1,160 @@
+import os
+import socket
+import threading
+
+from unittest.mock import patch
+
+import pytest
+
+from scale_build.exceptions import CallError, RemoteBuildFailed, WorkerUnavailable
+from scale_build.package import build_package
+from scale_build.packages.package import Package
+from scale_build.packages.protocol import Connection, parse_address
+from scale_build.packages.remote import MAX_FAILURES, RemoteWorker
+from scale_build.packages.scheduler import BuildScheduler
+from scale_build.stats import BuildStats
+from scale_build.worker import WorkerHandler, run_worker, sync_local_repo
+
+
+@pytest.fixture
+def connections():
+    coordinator, worker = socket.socketpair()
+    coordinator, worker = Connection(coordinator), Connection(worker)
+    yield coordinator, worker
+    coordinator.close()
+    worker.close()
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_messages_and_files_are_framed(connections, tmp_path):
+    coordinator, worker = connections
+    write(tmp_path / 'zfs_2.2.0_amd64.deb', b'\n{"type": "not a message"}\n')
+    os.makedirs(tmp_path / 'received')
+
+    coordinator.send_file(str(tmp_path / 'zfs_2.2.0_amd64.deb'))
+    coordinator.send('start', package='openzfs')
+
+    path = worker.receive_file(worker.receive('file'), str(tmp_path / 'received'))
+    with open(path, 'rb') as f:
+        assert f.read() == b'\n{"type": "not a message"}\n'
+    assert worker.receive('start')['package'] == 'openzfs'
+
+
+def test_errors_and_unexpected_messages_raise(connections):
+    coordinator, worker = connections
+    worker.send('error', error='openzfs is not part of the build manifest')
+    worker.send('log', line='unexpected')
+    with pytest.raises(CallError, match='build manifest'):
+        coordinator.receive('need')
+    with pytest.raises(CallError, match='Expected'):
+        coordinator.receive('need')
+
+
+def test_file_names_cannot_escape_destination(connections, tmp_path):
+    coordinator, worker = connections
+    with pytest.raises(CallError):
+        worker.receive_file({'type': 'file', 'name': '../../etc/passwd', 'size': 0}, str(tmp_path))
+
+
+def test_address_defaults_port():
+    assert parse_address('builder2') == ('builder2', 7788)
+    assert parse_address('10.0.0.2:9000') == ('10.0.0.2', 9000)
+
+
+def test_local_repo_is_synced_to_coordinator(tmp_path):
+    write(tmp_path / 'stale_1.0_amd64.deb', b'stale')
+    write(tmp_path / 'kept_1.0_amd64.deb', b'kept')
+    write(tmp_path / 'resized_1.0_amd64.deb', b'old')
+    write(tmp_path / 'Packages.gz', b'index')
+
+    assert sync_local_repo(str(tmp_path), [
+        {'name': 'kept_1.0_amd64.deb', 'size': 4},
+        {'name': 'resized_1.0_amd64.deb', 'size': 10},
+        {'name': 'new_1.0_amd64.deb', 'size': 3},
+    ]) == ['new_1.0_amd64.deb', 'resized_1.0_amd64.deb']
+    assert sorted(os.listdir(tmp_path)) == ['Packages.gz', 'kept_1.0_amd64.deb']
+
+
+def fake_worker(connection, local_repo, status):
+    job = connection.receive('job')
+    connection.send('need', sources=False, packages=sync_local_repo(local_repo, job['local_repo']))
+    connection.receive_file(connection.receive('file'), local_repo)
+    connection.receive('start')
+    connection.send('log', line=f'Building {job["package"]}')
+    if status == 'built':
+        connection.send('result', status='built', files=['zectl_1.0_amd64.deb'], phases={'build': 1.5})
+        connection.sock.sendall(b'{"type": "file", "name": "zectl_1.0_amd64.deb", "size": 5}\nzectl')
+    else:
+        connection.send('result', status='failed', error='debuild failed')
+
+
+@pytest.mark.parametrize('status', ['built', 'failed'])
+def test_remote_build(connections, tmp_path, status):
+    coordinator, worker = connections
+    package = Package('zectl', 'master', 'https://github.com/truenas/zectl')
+    package._git_state = {'head': 'a' * 40, 'tree': 'b' * 40, 'dirty': False}
+    for path in ('repo', 'staging', 'worker'):
+        os.makedirs(tmp_path / path)
+    write(tmp_path / 'repo' / 'openzfs_2.2.0_amd64.deb', b'zfs')
+
+    remote = RemoteWorker('worker1')
+    remote.connection = coordinator
+    thread = threading.Thread(target=fake_worker, args=(worker, str(tmp_path / 'worker'), status))
+    thread.start()
+    try:
+        if status == 'built':
+            assert remote.build(package, str(tmp_path / 'repo'), str(tmp_path / 'staging')) == (
+                ['zectl_1.0_amd64.deb'], {'build': 1.5}
+            )
+            assert os.listdir(tmp_path / 'staging') == ['zectl_1.0_amd64.deb']
+        else:
+            with pytest.raises(RemoteBuildFailed):
+                remote.build(package, str(tmp_path / 'repo'), str(tmp_path / 'staging'))
+            # A failed build does not need a new connection
+            assert remote.connection is coordinator
+    finally:
+        thread.join(timeout=5)
+    assert os.listdir(tmp_path / 'worker') == ['openzfs_2.2.0_amd64.deb']
+
+
+@patch('scale_build.worker.WORKER_TOKEN', None)
+def test_worker_without_token_rejects_everything(connections):
+    coordinator, worker = connections
+    with pytest.raises(CallError, match='WORKER_TOKEN'):
+        run_worker('127.0.0.1:0')
+
+    coordinator.send('hello', token=None, version='1', build_time=0)
+    WorkerHandler(worker.sock, ('127.0.0.1', 1234), None)
+    with pytest.raises(CallError, match='No WORKER_TOKEN'):
+        coordinator.receive('hello')
+
+
+def test_lost_connection_makes_worker_unavailable(connections, tmp_path):
+    coordinator, worker = connections
+    package = Package('zectl', 'master', 'https://github.com/truenas/zectl')
+    package._git_state = {'head': 'a' * 40, 'tree': 'b' * 40, 'dirty': False}
+    remote = RemoteWorker('worker1')
+    remote.connection = coordinator
+    worker.close()
+    with pytest.raises(WorkerUnavailable):
+        remote.build(package, str(tmp_path), str(tmp_path))
+    assert remote.connection is None
+
+
+def test_packages_of_unavailable_worker_are_requeued(tmp_path):
+    package = Package('zectl', 'master', 'https://github.com/truenas/zectl')
+    package._build_time_dependencies = set()
+    scheduler = BuildScheduler({'zectl': package}, {})
+    remote = RemoteWorker('worker1')
+    with patch('scale_build.packages.package.PKG_LOG_DIR', str(tmp_path)), patch(
+        'scale_build.package.build_package_remotely', side_effect=WorkerUnavailable('Lost connection')
+    ):
+        build_package(scheduler, None, BuildStats(), worker=remote)
+
+    assert remote.failures == MAX_FAILURES
+    assert not scheduler.failed
+    assert scheduler.get() is package
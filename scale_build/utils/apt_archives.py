@@ -0,0 +1,176 @@
+import contextlib
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from scale_build.config import APT_ARCHIVE_CACHE
+
+from .manifest import get_apt_repos
+from .paths import APT_ARCHIVE_CACHE_DIR
+from .run import run
+
+
+logger = logging.getLogger(__name__)
+
+APT_ARCHIVES_IN_CHROOT = 'var/cache/apt/archives'
+
+
+def get_apt_archive_cache_key():
+    # Debian archives never publish different contents under the same filename, so the mirrors a package could
+    # have been downloaded from are enough to key the cache
+    apt_repos = get_apt_repos(check_custom=True)
+    return hashlib.sha256(json.dumps([
+        [repo['url'], repo['distribution']] for repo in [apt_repos] + apt_repos['additional']
+    ]).encode()).hexdigest()[:16]
+
+
+def get_file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class AptArchiveCache:
+    """
+    Host side cache of downloaded .deb files shared by all chroots.
+
+    Chroots never write to the cache directly. Each chroot gets a private archives directory which is seeded with
+    hardlinks to the cached files and bind mounted as /var/cache/apt/archives so concurrent apt runs do not contend on
+    a single apt lock. Afterwards new downloads are harvested back into the cache while holding an exclusive lock.
+
+    The size and sha256 of every cached file is kept in an index. Seeding skips files which do not match it, apt
+    additionally verifies the checksum of every file it uses against its own package lists.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    @contextlib.contextmanager
+    def locked(self, operation):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as f:
+            fcntl.flock(f, operation)
+            yield
+
+    def read_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_index(self, index):
+        with open(f'{self.index_path}.tmp', 'w') as f:
+            f.write(json.dumps(index))
+        os.replace(f'{self.index_path}.tmp', self.index_path)
+
+    def seed(self, destination):
+        seeded = 0
+        with self.locked(fcntl.LOCK_SH):
+            for filename, entry in self.read_index().items():
+                path = os.path.join(self.path, filename)
+                try:
+                    if os.stat(path).st_size != entry['size']:
+                        continue
+                    os.link(path, os.path.join(destination, filename))
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.copy2(path, os.path.join(destination, filename))
+                seeded += 1
+
+        return seeded
+
+    def harvest(self, source):
+        harvested = 0
+        with self.locked(fcntl.LOCK_EX):
+            index = self.read_index()
+            with os.scandir(source) as entries:
+                for entry in filter(lambda e: e.name.endswith('.deb') and e.is_file(follow_symlinks=False), entries):
+                    path = os.path.join(self.path, entry.name)
+                    with contextlib.suppress(FileNotFoundError):
+                        if os.path.samefile(entry.path, path) and entry.name in index:
+                            # Seeded from the cache and left untouched
+                            continue
+
+                    sha256 = get_file_sha256(entry.path)
+                    if index.get(entry.name, {}).get('sha256') == sha256:
+                        continue
+                    elif entry.name in index:
+                        logger.warning('%r changed upstream, replacing cached copy', entry.name)
+
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(f'{path}.tmp')
+                    try:
+                        os.link(entry.path, f'{path}.tmp')
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        shutil.copy2(entry.path, f'{path}.tmp')
+                    os.replace(f'{path}.tmp', path)
+                    index[entry.name] = {'size': entry.stat().st_size, 'sha256': sha256}
+                    harvested += 1
+
+            if harvested:
+                self.write_index(index)
+
+        return harvested
+
+
+def get_apt_archive_cache():
+    if APT_ARCHIVE_CACHE:
+        return AptArchiveCache(os.path.join(APT_ARCHIVE_CACHE_DIR, get_apt_archive_cache_key()))
+
+
+def setup_apt_archives(path):
+    """
+    Create a private archives directory at `path` seeded from the shared cache. Returns `False` if the cache is
+    disabled in which case nothing is created.
+    """
+    if not (cache := get_apt_archive_cache()):
+        return False
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(os.path.join(path, 'partial'))
+    logger.debug('Seeded %d package(s) from apt archive cache', cache.seed(path))
+    return True
+
+
+def release_apt_archives(path):
+    if not os.path.exists(path):
+        return
+
+    try:
+        if cache := get_apt_archive_cache():
+            logger.debug('Added %d package(s) to apt archive cache', cache.harvest(path))
+    finally:
+        shutil.rmtree(path)
+
+
+@contextlib.contextmanager
+def mount_apt_archives(chroot, path):
+    # Only the mount point is left behind in `chroot` so no downloaded package ends up in an image built from it
+    if not setup_apt_archives(path):
+        yield
+        return
+
+    mountpoint = os.path.join(chroot, APT_ARCHIVES_IN_CHROOT)
+    os.makedirs(mountpoint, exist_ok=True)
+    try:
+        run(['mount', '--bind', path, mountpoint])
+        try:
+            yield
+        finally:
+            run(['umount', '-f', mountpoint], check=False)
+    finally:
+        release_apt_archives(path)
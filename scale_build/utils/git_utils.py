@@ -1,3 +1,4 @@
+import concurrent.futures
 import re
 
 from urllib.parse import urlparse
@@ -7,6 +8,7 @@ from .paths import GIT_MANIFEST_PATH
 
 
 # TODO: Let's please use python for git specific bits
+SNAPSHOT_MAX_THREADS = 16
 
 
 def update_git_manifest(git_remote, git_sha, mode='a+'):
@@ -57,3 +59,30 @@ def safe_checkout(path, branch):
         run(['git', '-C', path, 'checkout', branch])
     else:
         run(['git', '-C', path, 'checkout', '-b', branch])
+
+
+def retrieve_git_state(path, check=True):
+    cp = run(['git', '-C', path, 'rev-parse', 'HEAD', 'HEAD^{tree}'], check=check, log=False)
+    if cp.returncode:
+        return None
+
+    head, tree = cp.stdout.split()
+    return {
+        'head': head,
+        'tree': tree,
+        # Staged changes and untracked files end up in the build as well, so they make the tree dirty too
+        'dirty': bool(run(
+            ['git', '-C', path, 'status', '--porcelain', '--untracked-files=normal', '--ignore-submodules'],
+            check=False, log=False,
+        ).stdout.strip()),
+    }
+
+
+def snapshot_git_state(paths):
+    """
+    Retrieve HEAD, tree hash and dirty state of every git repository in `paths` in parallel. Repositories whose
+    state cannot be retrieved are mapped to `None`.
+    """
+    paths = sorted(set(paths))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(SNAPSHOT_MAX_THREADS, len(paths) or 1)) as exc:
+        return dict(zip(paths, exc.map(lambda path: retrieve_git_state(path, check=False), paths)))
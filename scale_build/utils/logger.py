@@ -1,6 +1,8 @@
+import codecs
 import collections
 import logging
 import os
+import subprocess
 import threading
 
 from .paths import LOG_DIR
@@ -15,6 +17,75 @@ def get_logger(logger_name, logger_path, mode='a+'):
     return logger
 
 
+class BuildLogHandler(logging.Handler):
+    """
+    Log of a single package build. Output is written in large blocks and optionally compressed with zstd as it is
+    written. The last `tail_lines` lines are kept in memory so they can be reported when the build fails.
+
+    The log is opened on first write and can be written to again after it has been closed, in which case it is
+    appended to (zstd decompresses concatenated frames as a single stream).
+    """
+
+    def __init__(self, path, mode='w', compress=False, buffer_size=1024 * 1024, tail_lines=200):
+        super().__init__()
+        self.path = f'{path}.zst' if compress else path
+        self.mode = mode[0]
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.tail_lines = collections.deque(maxlen=tail_lines)
+        self.partial = ''
+        self.file = self.stream = self.compressor = None
+
+    def _open(self):
+        self.file = open(self.path, f'{self.mode}b', buffering=0 if self.compress else self.buffer_size)
+        if self.compress:
+            self.compressor = subprocess.Popen(
+                ['zstd', '-q', '-c', '-T0'], stdin=subprocess.PIPE, stdout=self.file, bufsize=self.buffer_size,
+            )
+            self.stream = self.compressor.stdin
+        else:
+            self.stream = self.file
+        self.mode = 'a'
+
+    def write(self, data):
+        """
+        Write `data` as is, it does not need to end with a complete line.
+        """
+        with self.lock:
+            if self.stream is None:
+                self._open()
+            self.stream.write(data.encode('utf8', errors='ignore'))
+            lines = (self.partial + data).split('\n')
+            self.partial = lines.pop()
+            self.tail_lines.extend(lines[-self.tail_lines.maxlen:])
+
+    def emit(self, record):
+        try:
+            self.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def tail(self):
+        with self.lock:
+            return (list(self.tail_lines) + ([self.partial] if self.partial else []))[-self.tail_lines.maxlen:]
+
+    def flush(self):
+        with self.lock:
+            if self.stream:
+                self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            if self.stream:
+                self.stream.close()
+            if self.compressor:
+                self.compressor.wait()
+            if self.file and not self.file.closed:
+                self.file.close()
+            self.file = self.stream = self.compressor = None
+        super().close()
+
+
 class LoggingContext:
 
     CONTEXTS = collections.defaultdict(list)
@@ -41,6 +112,37 @@ class LoggingContext:
         return LoggingContext.CONTEXTS[threading.current_thread().name][-1]
 
 
+class BuildLogContext(LoggingContext):
+    """
+    Routes logging of the current thread to an already created `BuildLogHandler` which outlives the context.
+    """
+
+    def __init__(self, handler):
+        self.build_log = handler
+
+    def __enter__(self):
+        self.CONTEXTS[threading.current_thread().name].append(self.build_log)
+        return self
+
+
+def build_log_writer():
+    """
+    Returns a callable which writes raw command output to the build log of the current thread, or None if the
+    current thread is not logging to a build log.
+    """
+    handler = LoggingContext.handler() if LoggingContext.has_handler() else None
+    if not isinstance(handler, BuildLogHandler):
+        return None
+
+    decoder = codecs.getincrementaldecoder('utf8')(errors='ignore')
+
+    def write(data, final=False):
+        if data := decoder.decode(data, final):
+            handler.write(data)
+
+    return write
+
+
 class ConsoleFilter(logging.Filter):
 
     def filter(self, record):
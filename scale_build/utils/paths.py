@@ -9,10 +9,13 @@ TMPFS = os.path.join(TMP_DIR, 'tmpfs')
 BRANCH_OUT_LOG_FILENAME = 'git-branchout.log'
 BRANCH_OUT_LOG_DIR = os.path.join(LOG_DIR, 'branchout')
 CACHE_DIR = os.path.join(TMP_DIR, 'cache')
+APT_ARCHIVE_CACHE_DIR = os.path.join(CACHE_DIR, 'apt-archives')
+BUILD_DEPS_CACHE_DIR = os.path.join(CACHE_DIR, 'build-deps')
 CCACHE_DIR = os.path.join(TMP_DIR, 'ccache')
 CD_DIR = os.path.join(TMP_DIR, 'cdrom')
 CD_FILES_DIR = os.path.join(BUILDER_DIR, 'conf/cd-files')
 CHROOT_BASEDIR = os.path.join(TMPFS, 'chroot')
+EXTENSIONS_CACHE_DIR = os.path.join(CACHE_DIR, 'extensions')
 CHROOT_OVERLAY = os.path.join(TMPFS, 'chroot-overlay')
 CONF_GRUB = os.path.join(BUILDER_DIR, 'scripts/grub.cfg')
 DPKG_OVERLAY = os.path.join(TMP_DIR, 'dpkg-overlay')
@@ -21,12 +24,16 @@ GIT_LOG_DIR_NAME = 'git'
 GIT_LOG_DIR = os.path.join(LOG_DIR, GIT_LOG_DIR_NAME)
 HASH_DIR = os.path.join(TMP_DIR, 'pkghashes')
 MANIFEST = os.path.join(BUILDER_DIR, 'conf/build.manifest')
+PACKAGE_METADATA_CACHE_DIR = os.path.join(CACHE_DIR, 'package-metadata')
+PKG_CHROOT_BASEDIR = os.path.join(TMP_DIR, 'chroot-package-base')
 PKG_DIR = os.path.join(TMP_DIR, 'pkgdir')
 PKG_LOG_DIR = os.path.join(LOG_DIR, 'packages')
+REPO_METADATA_CACHE_DIR = os.path.join(CACHE_DIR, 'repo-metadata')
 REFERENCE_FILES = ('etc/group', 'etc/passwd')
 REFERENCE_FILES_DIR = os.path.join(BUILDER_DIR, 'conf/reference-files')
 RELEASE_DIR = os.path.join(TMP_DIR, 'release')
 SECRETS_FILE = os.path.join(BUILDER_DIR, 'conf/secrets.yaml')
 SOURCES_DIR = os.path.join(BUILDER_DIR, 'sources')
+STATS_DIR = os.path.join(LOG_DIR, 'stats')
 UPDATE_DIR = os.path.join(TMP_DIR, 'update')
 WORKDIR_OVERLAY = os.path.join(TMPFS, 'workdir-overlay')
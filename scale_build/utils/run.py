@@ -1,14 +1,52 @@
+import contextlib
 import logging
 import os
 import pexpect
+import signal
 import subprocess
+import threading
 
 from scale_build.exceptions import CallError
 
+from .logger import build_log_writer
+
 
 logger = logging.getLogger(__name__)
 
 
+class ProcessRegistry:
+    """
+    Keeps track of processes started through `run(..., registry=...)` so that they can be terminated along with
+    everything they spawned. Each of them is started in its own session, processes started after `terminate()` are
+    terminated right away.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processes = set()
+        self.terminated = False
+
+    def add(self, proc):
+        with self.lock:
+            self.processes.add(proc)
+            if self.terminated:
+                self.kill(proc)
+
+    def remove(self, proc):
+        with self.lock:
+            self.processes.discard(proc)
+
+    def kill(self, proc):
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(proc.pid, signal.SIGTERM)
+
+    def terminate(self):
+        with self.lock:
+            self.terminated = True
+            for proc in self.processes:
+                self.kill(proc)
+
+
 def run(*args, **kwargs):
     if isinstance(args[0], list):
         args = tuple(args[0])
@@ -19,17 +57,32 @@ def run(*args, **kwargs):
     shell = kwargs.pop('shell', False)
     log = kwargs.pop('log', True)
     env = kwargs.pop('env', None) or os.environ
+    registry = kwargs.pop('registry', None)
     if log:
         kwargs['stderr'] = subprocess.STDOUT
 
     proc = subprocess.Popen(
-        args, stdout=kwargs['stdout'], stderr=kwargs['stderr'], shell=shell, env=env, encoding='utf8', errors='ignore'
+        args, stdout=kwargs['stdout'], stderr=kwargs['stderr'], shell=shell, env=env, encoding='utf8', errors='ignore',
+        start_new_session=registry is not None,
     )
-    if log:
-        for line in map(str.rstrip, iter(proc.stdout.readline, '')):
-            logger.debug(line)
+    if registry is not None:
+        registry.add(proc)
+    try:
+        if log and logger.isEnabledFor(logging.DEBUG) and (write := build_log_writer()):
+            # Package builds produce a lot of output, it is copied to the build log in blocks rather than going
+            # through logging line by line
+            fd = proc.stdout.fileno()
+            while data := os.read(fd, 1024 * 1024):
+                write(data)
+            write(b'', final=True)
+        elif log:
+            for line in map(str.rstrip, iter(proc.stdout.readline, '')):
+                logger.debug(line)
 
-    stdout, stderr = proc.communicate()
+        stdout, stderr = proc.communicate()
+    finally:
+        if registry is not None:
+            registry.remove(proc)
 
     cp = subprocess.CompletedProcess(args, proc.returncode, stdout=stdout, stderr=stderr)
     if check:
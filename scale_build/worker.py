@@ -0,0 +1,194 @@
+import hmac
+import json
+import logging
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+
+from .bootstrap.bootstrapdir import PackageBootstrapDir
+from .config import WORKER_TOKEN
+from .exceptions import CallError
+from .package import build_single_package
+from .packages.bootstrap import clean_shared_chroot_basedir
+from .packages.protocol import Connection, parse_address
+from .packages.timings import PhaseTimings
+from .utils.git_utils import retrieve_git_state
+from .utils.logger import BuildLogContext, LoggingContext
+from .utils.package import get_packages
+from .utils.paths import PKG_DIR, PKG_LOG_DIR, TMP_DIR
+from .utils.run import run
+
+
+logger = logging.getLogger(__name__)
+
+
+def sync_local_repo(path, wanted):
+    """
+    Remove packages from the local repo at `path` which are not part of `wanted` (name and size of every package in
+    the coordinator's local repo). Returns the names of the packages which have to be transferred.
+    """
+    wanted = {entry['name']: entry['size'] for entry in wanted}
+    present = set()
+    with os.scandir(path) as entries:
+        for entry in filter(lambda e: e.is_file() and e.name.endswith(('.deb', '.udeb')), entries):
+            if wanted.get(entry.name) == entry.stat().st_size:
+                present.add(entry.name)
+            else:
+                os.unlink(entry.path)
+    return sorted(set(wanted) - present)
+
+
+class LogStreamer(threading.Thread):
+
+    def __init__(self, connection, build_log):
+        super().__init__(daemon=True)
+        self.connection = connection
+        self.build_log = build_log
+        self.finished = threading.Event()
+
+    def run(self):
+        while not os.path.exists(self.build_log.path):
+            if self.finished.wait(0.2):
+                return
+
+        partial = ''
+        with open(self.build_log.path, 'r', errors='ignore') as f:
+            while True:
+                finished = self.finished.is_set()
+                # The build log is written in large blocks
+                self.build_log.flush()
+                for line in f.readlines():
+                    if not line.endswith('\n') and not finished:
+                        partial += line
+                        continue
+                    self.connection.send('log', line=(partial + line).rstrip('\n'))
+                    partial = ''
+                if finished:
+                    return
+                self.finished.wait(0.2)
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    """
+    Serves a single coordinating `scale_build packages` run. After the handshake the coordinator sends one job at a
+    time:
+
+        coordinator -> worker: job (package, build definition, git state and contents of its local repo)
+        worker -> coordinator: need (whether sources are required and which packages of the local repo)
+        coordinator -> worker: file frames for everything needed, then start
+        worker -> coordinator: log lines while building, then result followed by a file frame per built package
+    """
+
+    def handle(self):
+        connection = Connection(self.request)
+        try:
+            hello = connection.receive('hello')
+            if not WORKER_TOKEN:
+                connection.send('error', error='No WORKER_TOKEN is configured on the worker')
+                return
+            elif not hmac.compare_digest((hello.get('token') or '').encode(), WORKER_TOKEN.encode()):
+                connection.send('error', error='Invalid worker token')
+                return
+
+            logger.info('Accepted build jobs from %s:%d', *self.client_address[:2])
+            with LoggingContext('build_packages', 'w'):
+                PackageBootstrapDir().setup()
+            clean_shared_chroot_basedir()
+            connection.send('hello')
+
+            while True:
+                try:
+                    job = connection.receive('job')
+                except CallError:
+                    break
+
+                try:
+                    self.build(connection, hello, job)
+                except CallError as e:
+                    connection.send('error', error=str(e))
+        except (OSError, CallError) as e:
+            logger.error('Connection to %s:%d failed: %s', *self.client_address[:2], e)
+        finally:
+            clean_shared_chroot_basedir()
+            connection.close()
+
+    def build(self, connection, hello, job):
+        package = {p.name: p for p in get_packages()}.get(job['package'])
+        if package is None:
+            raise CallError(f'{job["package"]!r} package is not part of the build manifest of this worker')
+        elif json.loads(json.dumps(package.build_definition)) != job['definition']:
+            raise CallError(f'{package.name!r} package is defined differently in the build manifest of this worker')
+
+        package.version = hello['version']
+        package.build_time = hello['build_time']
+        package.timings = PhaseTimings()
+
+        state = retrieve_git_state(package.source_path, check=False) if package.exists else None
+        need_sources = state != job['git_state'] or state['dirty']
+        os.makedirs(PKG_DIR, exist_ok=True)
+        need_packages = sync_local_repo(PKG_DIR, job['local_repo'])
+        connection.send('need', sources=need_sources, packages=need_packages)
+
+        with package.timings.phase('transfer'), tempfile.TemporaryDirectory(dir=TMP_DIR) as td:
+            if need_sources:
+                archive = connection.receive_file(connection.receive('file'), td)
+                if os.path.exists(package.source_path):
+                    shutil.rmtree(package.source_path)
+                os.makedirs(package.source_path)
+                run(['tar', '-C', package.source_path, '-xf', archive], log=False)
+            for _ in need_packages:
+                connection.receive_file(connection.receive('file'), PKG_DIR)
+        connection.receive('start')
+
+        package.git_state = job['git_state']
+        logger.info('Building %r package', package.name)
+        os.makedirs(PKG_LOG_DIR, exist_ok=True)
+        if os.path.exists(package.log_file_path):
+            os.unlink(package.log_file_path)
+
+        # The log is streamed to the coordinator, which compresses it if it has been configured to
+        streamer = LogStreamer(connection, package.open_build_log(compress=False))
+        streamer.start()
+        try:
+            with BuildLogContext(package.build_log):
+                # Build dependencies are needed to key cached build dependency layers
+                package.binary_packages
+                build_single_package(package)
+        except Exception as e:
+            with BuildLogContext(package.build_log):
+                logger.error('%r package failed to build: %r', package.name, e, exc_info=True)
+            package.build_log.close()
+            streamer.stop()
+            logger.error('Failed to build %r package: %s', package.name, e)
+            connection.send('result', status='failed', error=str(e))
+            return
+
+        package.build_log.close()
+        streamer.stop()
+        logger.info('Successfully built %r package', package.name)
+        built_packages = package.built_packages
+        connection.send(
+            'result', status='built', files=built_packages, phases=package.timings.to_dict()['phases'],
+        )
+        for name in built_packages:
+            connection.send_file(os.path.join(PKG_DIR, name))
+
+
+class WorkerServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def run_worker(address):
+    if not WORKER_TOKEN:
+        # Workers build whatever they are sent as root, so they must never be reachable without a secret
+        raise CallError('WORKER_TOKEN must be set to run a build worker')
+
+    with WorkerServer(parse_address(address), WorkerHandler) as server:
+        logger.info('Waiting for build jobs on %s:%d', *server.server_address[:2])
+        server.serve_forever()
@@ -0,0 +1,103 @@
+"""
+Compare the bootstrap cache backends on the real package bootstrap: time taken to save the chroot, to restore it
+completely, to restore only the reference files (as done to verify a cache) and to mount it, along with the disk
+space each cache takes.
+
+This needs to run as root from the scale-build root after `make packages` has created the package bootstrap cache.
+The cache is read with the backend selected by BOOTSTRAP_CACHE_BACKEND.
+
+Usage:
+    python3 scripts/benchmark_cache_backends.py --backend squashfs --backend squashfs-zstd --backend tar-zstd
+"""
+import argparse
+import os
+import pathlib
+import shutil
+import sys
+import time
+
+SCALE_BUILD_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(SCALE_BUILD_ROOT))
+
+
+def disk_usage(path):
+    from scale_build.utils.run import run
+
+    return int(run(['du', '-s', '--block-size=1', path], log=False).stdout.split()[0])
+
+
+def timed(func, *args):
+    start = time.monotonic()
+    func(*args)
+    return time.monotonic() - start
+
+
+def benchmark(backend, source, path):
+    from scale_build.exceptions import CallError
+    from scale_build.utils.paths import REFERENCE_FILES
+    from scale_build.utils.run import run
+
+    cache = os.path.join(path, f'cache{backend.suffix}')
+    restored = os.path.join(path, 'restored')
+    results = {}
+    try:
+        results['save'] = timed(backend.save, source, cache)
+        results['size'] = disk_usage(cache)
+        results['restore'] = timed(backend.restore, cache, restored)
+        shutil.rmtree(restored)
+        results['reference files'] = timed(backend.restore, cache, restored, REFERENCE_FILES)
+        shutil.rmtree(restored)
+        os.makedirs(restored)
+        try:
+            results['mount'] = timed(backend.mount, cache, restored)
+        except CallError:
+            results['mount'] = None
+        run(['umount', '-f', restored], check=False, log=False)
+    finally:
+        if os.path.lexists(cache):
+            backend.remove(cache)
+        shutil.rmtree(restored, ignore_errors=True)
+
+    return results
+
+
+def main():
+    from scale_build.bootstrap.cache_backends import CACHE_BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', action='append', choices=list(CACHE_BACKENDS), help='Backend to benchmark')
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        sys.exit('This benchmark must be run as root')
+
+    os.chdir(SCALE_BUILD_ROOT)
+
+    from scale_build.bootstrap.bootstrapdir import PackageBootstrapDir
+    from scale_build.utils.paths import TMP_DIR
+
+    bootstrap_dir = PackageBootstrapDir()
+    if not bootstrap_dir.cache_exists:
+        sys.exit(f'{bootstrap_dir.cache_file_path} does not exist, run "make packages" first')
+
+    path = os.path.join(TMP_DIR, 'benchmark_cache_backends')
+    source = os.path.join(path, 'chroot')
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    try:
+        bootstrap_dir.restore_cache(source)
+        print(f'Package bootstrap: {disk_usage(source) / 1024 ** 3:.2f}GiB\n')
+        print(f'{"backend":<15}{"save":>10}{"size":>12}{"restore":>10}{"reference files":>18}{"mount":>10}')
+        for name in args.backend or list(CACHE_BACKENDS):
+            results = benchmark(CACHE_BACKENDS[name], source, path)
+            mount = f'{results["mount"]:.2f}s' if results['mount'] is not None else '-'
+            print(
+                f'{name:<15}{results["save"]:>9.1f}s{results["size"] / 1024 ** 3:>9.2f}GiB'
+                f'{results["restore"]:>9.1f}s{results["reference files"]:>17.2f}s{mount:>10}'
+            )
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Compare package chroot setup time and memory usage when every package build extracts the package bootstrap into
+its own tmpfs (legacy) against using one shared read-only base chroot as the overlayfs lowerdir.
+
+This needs to run as root from the scale-build root after `make packages` has created the package bootstrap cache.
+
+Usage:
+    python3 scripts/benchmark_chroot_setup.py --parallel 4 --parallel 8
+"""
+import argparse
+import concurrent.futures
+import os
+import pathlib
+import shutil
+import sys
+import threading
+import time
+
+SCALE_BUILD_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(SCALE_BUILD_ROOT))
+
+
+def meminfo():
+    values = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            key, value = line.split(':')
+            values[key] = int(value.split()[0]) * 1024
+    return values['MemTotal'] - values['MemAvailable'], values['Shmem']
+
+
+class MemorySampler(threading.Thread):
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.baseline = meminfo()
+        self.peak = (0, 0)
+        self.event = threading.Event()
+
+    def run(self):
+        while not self.event.wait(0.2):
+            used, shmem = meminfo()
+            self.peak = (
+                max(self.peak[0], used - self.baseline[0]), max(self.peak[1], shmem - self.baseline[1])
+            )
+
+
+def setup_legacy(bootstrap_dir, path, tmpfs_size):
+    from scale_build.utils.run import run
+
+    run(['mount', '-t', 'tmpfs', '-o', f'size={tmpfs_size}G', 'tmpfs', path], log=False)
+    bootstrap_dir.restore_cache(os.path.join(path, 'chroot'))
+
+
+def setup_shared(bootstrap_dir, path, tmpfs_size):
+    from scale_build.packages.bootstrap import setup_shared_chroot_basedir
+    from scale_build.utils.paths import PKG_CHROOT_BASEDIR
+    from scale_build.utils.run import run
+
+    run(['mount', '-t', 'tmpfs', '-o', f'size={tmpfs_size}G', 'tmpfs', path], log=False)
+    setup_shared_chroot_basedir()
+    for d in ('upper', 'work', 'chroot'):
+        os.makedirs(os.path.join(path, d))
+    run([
+        'mount', '-t', 'overlay', '-o',
+        f'lowerdir={PKG_CHROOT_BASEDIR},upperdir={path}/upper,workdir={path}/work', 'none', f'{path}/chroot'
+    ], log=False)
+
+
+def benchmark(setup_method, parallel, tmpfs_size):
+    from scale_build.bootstrap.bootstrapdir import PackageBootstrapDir
+    from scale_build.packages.bootstrap import clean_shared_chroot_basedir
+    from scale_build.utils.paths import TMP_DIR
+    from scale_build.utils.run import run
+
+    bootstrap_dir = PackageBootstrapDir()
+    paths = [os.path.join(TMP_DIR, f'benchmark_chroot_{i}') for i in range(parallel)]
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.monotonic()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+            for future in [executor.submit(setup_method, bootstrap_dir, path, tmpfs_size) for path in paths]:
+                future.result()
+        elapsed = time.monotonic() - start
+        time.sleep(0.5)
+    finally:
+        sampler.event.set()
+        sampler.join()
+        for path in paths:
+            run(['umount', '-R', '-f', path], check=False, log=False)
+            shutil.rmtree(path, ignore_errors=True)
+        clean_shared_chroot_basedir()
+
+    return elapsed, sampler.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--parallel', type=int, action='append', help='Number of package chroots to set up at once')
+    parser.add_argument('--tmpfs-size', type=int, default=12, help='Size of each tmpfs in GB')
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        sys.exit('This benchmark must be run as root')
+
+    os.chdir(SCALE_BUILD_ROOT)
+    for parallel in args.parallel or [4, 8]:
+        print(f'\n{parallel} parallel package chroots')
+        for name, method in (('per-package extraction', setup_legacy), ('shared base chroot', setup_shared)):
+            elapsed, (memory, shmem) = benchmark(method, parallel, args.tmpfs_size)
+            print(
+                f'  {name:<24} setup: {elapsed:>7.1f}s  peak memory: {memory / 1024 ** 3:>6.2f}GiB  '
+                f'peak tmpfs: {shmem / 1024 ** 3:>6.2f}GiB'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare building the sysext extensions one after another with building them in parallel on a finished rootfs. The
+extensions cache is bypassed so both runs really build every extension.
+
+This needs to run as root from the scale-build root with network access. The rootfs is either a chroot directory or
+a rootfs squashfs, e.g. tmp/update/rootfs.squashfs as left behind by `make update`.
+
+Usage:
+    python3 scripts/benchmark_extensions.py --rootfs tmp/update/rootfs.squashfs --runs 2
+"""
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import sys
+import time
+
+SCALE_BUILD_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(SCALE_BUILD_ROOT))
+
+
+def benchmark(rootfs, path, parallel):
+    from scale_build import extensions
+    from scale_build.utils.paths import LOG_DIR
+
+    extensions.EXTENSIONS_CACHE = False
+    extensions.PARALLEL_EXTENSIONS = parallel
+    os.makedirs(path)
+    try:
+        start = time.monotonic()
+        extensions.build_extensions(rootfs, path)
+        duration = time.monotonic() - start
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    with open(os.path.join(LOG_DIR, 'extensions.json')) as f:
+        return duration, json.loads(f.read())['extensions']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rootfs', required=True, help='Rootfs chroot directory or squashfs')
+    parser.add_argument('--runs', type=int, default=1, help='Number of times to build the extensions each way')
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        sys.exit('This benchmark must be run as root')
+
+    rootfs = os.path.abspath(args.rootfs)
+    os.chdir(SCALE_BUILD_ROOT)
+
+    from scale_build.utils.paths import LOG_DIR, TMP_DIR
+    from scale_build.utils.run import run
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    path = os.path.join(TMP_DIR, 'benchmark_extensions')
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    try:
+        if os.path.isfile(rootfs):
+            run(['unsquashfs', '-f', '-d', os.path.join(path, 'rootfs'), rootfs], log=False)
+            rootfs = os.path.join(path, 'rootfs')
+
+        print(f'{"mode":<10}{"run":>5}{"total":>10}  phases')
+        for parallel in (False, True):
+            mode = 'parallel' if parallel else 'serial'
+            for i in range(args.runs):
+                duration, timings = benchmark(rootfs, os.path.join(path, 'extensions'), parallel)
+                phases = ', '.join(
+                    f'{name}: ' + ' '.join(f'{phase}={seconds:.0f}s' for phase, seconds in extension.items())
+                    for name, extension in timings.items()
+                )
+                print(f'{mode:<10}{i + 1:>5}{duration:>9.1f}s  {phases}')
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure how long planning a `packages` run takes (ordering all packages of the manifest and deciding which of them
+need to be rebuilt) with the batched git state snapshot against evaluating git state per package, uncached, like
+it was done before.
+
+This requires checked out sources. The first planning run is not measured so that parsed dependency metadata is
+cached for both variants.
+
+Usage (from the scale-build root):
+    python3 scripts/benchmark_planning.py --runs 5
+"""
+import argparse
+import contextlib
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+from unittest.mock import patch
+
+SCALE_BUILD_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(SCALE_BUILD_ROOT))
+
+
+class GitCounter:
+
+    def __init__(self):
+        self.count = 0
+        self.popen = subprocess.Popen
+
+    def __call__(self, args, *pargs, **kwargs):
+        if (args[0] if isinstance(args, (list, tuple)) else args.split()[0]) == 'git':
+            self.count += 1
+        return self.popen(args, *pargs, **kwargs)
+
+
+@contextlib.contextmanager
+def legacy_git_state():
+    from scale_build.packages import order
+    from scale_build.packages.package import Package
+    from scale_build.utils.git_utils import retrieve_git_state
+
+    with (
+        patch.object(order, 'snapshot_git_state', lambda paths: {p: None for p in paths}),
+        patch.object(Package, 'git_state', property(
+            lambda self: retrieve_git_state(self.source_path), lambda self, state: None
+        )),
+        patch.object(Package, 'hash_changed', property(lambda self: self._hash_changed())),
+    ):
+        yield
+
+
+def plan():
+    from scale_build.packages.order import get_initialized_packages, get_to_build_packages
+
+    counter = GitCounter()
+    start = time.monotonic()
+    with patch.object(subprocess, 'Popen', counter):
+        to_build = get_to_build_packages(get_initialized_packages())
+    return time.monotonic() - start, counter.count, len(to_build)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='Number of measured planning runs per variant')
+    args = parser.parse_args()
+
+    os.chdir(SCALE_BUILD_ROOT)
+    plan()
+
+    results = {'per package git state': [], 'batched git state snapshot': []}
+    for i in range(args.runs):
+        with legacy_git_state():
+            results['per package git state'].append(plan())
+        results['batched git state snapshot'].append(plan())
+
+    for name, runs in results.items():
+        print(
+            f'{name:<28} median: {statistics.median(r[0] for r in runs):>7.2f}s  git processes: {runs[0][1]:>5}  '
+            f'packages to build: {runs[0][2]}'
+        )
+
+
+if __name__ == '__main__':
+    main()
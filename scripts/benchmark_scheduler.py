@@ -0,0 +1,162 @@
+"""
+Compare the legacy polling package scheduler with the event driven `BuildScheduler`.
+
+Both schedulers are simulated against the real package dependency graph so no packages are actually built. The
+graph is computed from `conf/build.manifest` (this requires checked out sources) or loaded from a json file which
+was previously written with `--dump-graph`.
+
+Usage (from the scale-build root):
+    python3 scripts/benchmark_scheduler.py --workers 4 --workers 8 --durations durations.json
+"""
+import argparse
+import heapq
+import json
+import os
+import pathlib
+import sys
+
+SCALE_BUILD_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(SCALE_BUILD_ROOT))
+
+LEGACY_POLL_TIMEOUT = 5
+
+
+def get_manifest_graph():
+    from scale_build.packages.order import get_initialized_packages
+
+    packages = get_initialized_packages()
+    return {
+        name: {
+            'dependencies': sorted(d for d in package.build_time_dependencies() if d in packages and d != name),
+            'batch_priority': package.batch_priority,
+        } for name, package in packages.items()
+    }
+
+
+def priority(graph, name):
+    # Ties are broken by manifest order exactly like `BuildScheduler` does
+    return graph[name]['batch_priority'], list(graph).index(name)
+
+
+def summarize(graph, durations, workers, finished):
+    makespan = max(finished.values(), default=0)
+    return {
+        'makespan': makespan,
+        'idle_worker_seconds': workers * makespan - sum(durations[n] for n in graph),
+    }
+
+
+def simulate_event_driven(graph, durations, workers):
+    pending = {n: len(v['dependencies']) for n, v in graph.items()}
+    children = {n: set() for n in graph}
+    for name, value in graph.items():
+        for dep in value['dependencies']:
+            children[dep].add(name)
+
+    ready = [(priority(graph, n), n) for n, count in pending.items() if count == 0]
+    heapq.heapify(ready)
+    running = []
+    finished = {}
+    now = 0
+    while ready or running:
+        while ready and len(running) < workers:
+            name = heapq.heappop(ready)[1]
+            heapq.heappush(running, (now + durations[name], name))
+
+        now, name = heapq.heappop(running)
+        finished[name] = now
+        for child in children[name]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                heapq.heappush(ready, (priority(graph, child), child))
+
+    return summarize(graph, durations, workers, finished)
+
+
+def simulate_polling(graph, durations, workers):
+    # This mirrors the behaviour of the scheduler which polled a queue with a timeout and only refreshed it
+    # when a build thread came back empty handed
+    to_build = set(graph)
+    queue = []
+    building = {}
+    finished = {}
+
+    def update_queue():
+        blocked = {c for n in building for c in graph if n in graph[c]['dependencies']}
+        for name in sorted(
+            filter(
+                lambda n: n not in blocked and all(d in finished for d in graph[n]['dependencies']), to_build
+            ), key=lambda n: priority(graph, n)
+        ):
+            to_build.remove(name)
+            queue.append(name)
+
+    now = 0
+    update_queue()
+    # worker -> (event time, package being built or None when waiting on the queue)
+    threads = {i: (now + LEGACY_POLL_TIMEOUT, None) for i in range(workers)}
+    while len(finished) != len(graph):
+        for worker in sorted(filter(lambda w: threads[w][1] is None, threads), key=lambda w: threads[w][0]):
+            if not queue:
+                break
+            name = queue.pop(0)
+            building[name] = worker
+            threads[worker] = (now + durations[name], name)
+
+        worker = min(threads, key=lambda w: threads[w][0])
+        now, name = threads[worker]
+        if name:
+            building.pop(name)
+            finished[name] = now
+        else:
+            update_queue()
+
+        if not to_build and not queue:
+            threads.pop(worker)
+        else:
+            threads[worker] = (now + LEGACY_POLL_TIMEOUT, None)
+
+        if not threads and len(finished) != len(graph):
+            # All threads exited, remaining in-flight builds still have to finish
+            break
+
+    return summarize(graph, durations, workers, finished)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--graph', help='Load package dependency graph from this json file')
+    parser.add_argument('--dump-graph', help='Write the package dependency graph to this json file')
+    parser.add_argument('--durations', help='Json file mapping package names to build durations in seconds')
+    parser.add_argument('--default-duration', type=float, default=300, help='Duration used for unknown packages')
+    parser.add_argument('--workers', type=int, action='append', help='Number of parallel builds to simulate')
+    args = parser.parse_args()
+
+    os.chdir(SCALE_BUILD_ROOT)
+    if args.graph:
+        with open(args.graph, 'r') as f:
+            graph = json.loads(f.read())
+    else:
+        graph = get_manifest_graph()
+
+    if args.dump_graph:
+        with open(args.dump_graph, 'w') as f:
+            f.write(json.dumps(graph, indent=4))
+
+    durations = {}
+    if args.durations:
+        with open(args.durations, 'r') as f:
+            durations = json.loads(f.read())
+    durations = {n: float(durations.get(n, args.default_duration)) for n in graph}
+
+    print(f'{len(graph)} packages, {sum(durations.values()):.0f} seconds of total build time')
+    for workers in args.workers or [4, 8]:
+        legacy = simulate_polling(graph, durations, workers)
+        current = simulate_event_driven(graph, durations, workers)
+        print(f'\n{workers} parallel builds')
+        for key in ('makespan', 'idle_worker_seconds'):
+            print(f'  {key:<24} polling: {legacy[key]:>10.1f}  event driven: {current[key]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()